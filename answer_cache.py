@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from product_matcher import normalize_text
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Cache de respostas persistido em SQLite, fora de vectordb/
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", os.path.join(".cache", "answers.sqlite3"))
+
+# Validade das respostas (segundos), limite de entradas e similaridade mínima
+# (cosseno entre as perguntas) para considerar duas perguntas equivalentes
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Permite desativar o cache (ANSWER_CACHE=0)
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "1").lower() not in ("0", "false", "nao", "não", "no")
+
+def normalize_question(question):
+    """
+    Normaliza a pergunta para a busca exata no cache.
+    """
+    return normalize_text(question)
+
+def _serialize_documents(docs):
+    return json.dumps(
+        [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs or []],
+        ensure_ascii=False
+    )
+
+def _deserialize_documents(data):
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in json.loads(data)]
+
+class AnswerCache:
+    """
+    Cache de respostas por marca e versão do banco vetorial. A busca é feita
+    primeiro pelo texto normalizado da pergunta e depois por similaridade
+    entre os embeddings das perguntas, apenas entre as perguntas sobre o
+    mesmo produto (perguntas que diferem só no nome do produto, como
+    "consumo do Sikadur 31" e "consumo do Sikadur 32", têm embeddings quase
+    iguais). As entradas expiram após
+    ANSWER_CACHE_TTL segundos e as menos usadas são removidas quando o cache
+    passa de ANSWER_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, similarity=ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " brand TEXT NOT NULL,"
+            " store_version TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " embedding BLOB,"
+            " answer TEXT NOT NULL,"
+            " sources TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Produto identificado na pergunta (caches criados antes não têm a coluna)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+        if "product" not in columns:
+            self._conn.execute("ALTER TABLE answers ADD COLUMN product TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_lookup ON answers (brand, store_version, question)"
+        )
+        self._conn.commit()
+        # Vetores das perguntas em memória, por (marca, versão):
+        # (ids, produtos, instantes de criação, matriz)
+        self._vectors = {}
+
+    def _load_vectors(self, brand, store_version):
+        key = (brand, store_version)
+        if key not in self._vectors:
+            rows = self._conn.execute(
+                "SELECT id, product, created_at, embedding FROM answers "
+                "WHERE brand = ? AND store_version = ? AND embedding IS NOT NULL",
+                (brand, store_version)
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            products = [row[1] for row in rows]
+            created = np.asarray([row[2] for row in rows], dtype=np.float64)
+            matrix = (
+                np.vstack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+                if rows else np.zeros((0, 0), dtype=np.float32)
+            )
+            self._vectors[key] = (ids, products, created, matrix)
+        return self._vectors[key]
+
+    def _hit(self, row_id, kind, started):
+        row = self._conn.execute(
+            "SELECT answer, sources, created_at FROM answers WHERE id = ?", (row_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        answer, sources, created_at = row
+        now = time.time()
+        if now - created_at > self.ttl:
+            return None
+        self._conn.execute(
+            "UPDATE answers SET last_access = ?, hits = hits + 1 WHERE id = ?", (now, row_id)
+        )
+        self._conn.commit()
+        return {
+            "answer": answer,
+            "source_documents": _deserialize_documents(sources),
+            "cache": kind,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def lookup(self, brand, store_version, question, embedding=None, product=None):
+        """
+        Procura uma resposta para a pergunta. O acerto semântico só vale para
+        respostas gravadas com o mesmo produto (product, o produto
+        identificado na pergunta, ou None). Retorna um dict com answer,
+        source_documents e o tipo de acerto ("exato" ou "semantico"), ou None.
+        """
+        started = time.perf_counter()
+        normalized = normalize_question(question)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM answers WHERE brand = ? AND store_version = ? AND question = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (brand, store_version, normalized)
+            ).fetchone()
+            if row:
+                result = self._hit(row[0], "exato", started)
+                if result:
+                    return result
+
+            if embedding is None:
+                return None
+            ids, products, created, matrix = self._load_vectors(brand, store_version)
+            if not ids:
+                return None
+            # Apenas respostas válidas sobre o mesmo produto
+            candidates = (created >= time.time() - self.ttl) & np.asarray(
+                [row_product == product for row_product in products]
+            )
+            if not candidates.any():
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            scores = np.where(candidates, matrix @ query, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                return None
+            result = self._hit(ids[best], "semantico", started)
+            if result:
+                result["similarity"] = round(float(scores[best]), 4)
+            return result
+
+    def store(self, brand, store_version, question, answer, source_documents, embedding=None, product=None):
+        """
+        Grava a resposta de uma pergunta, com o produto identificado nela, e
+        aplica expiração e limite de tamanho.
+        """
+        now = time.time()
+        blob = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+            blob = vector.tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (brand, store_version, question, product, embedding, answer, sources, "
+                "created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (brand, store_version, normalize_question(question), product, blob, answer,
+                 _serialize_documents(source_documents), now, now)
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN "
+                "(SELECT id FROM answers ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+            self._vectors.clear()
+
+    def invalidate_brand(self, brand):
+        """
+        Remove todas as respostas de uma marca (ex.: após reingestão).
+        """
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM answers WHERE brand = ?", (brand,)).rowcount
+            self._conn.commit()
+            self._vectors.clear()
+        logger.info(f"Cache de respostas: {deleted} entradas removidas para {brand}")
+        return deleted
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """
+    Retorna o cache de respostas compartilhado pelo processo, ou None se
+    estiver desativado.
+    """
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
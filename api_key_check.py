@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import requests
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Validade (segundos) do resultado da verificação da chave da API do Groq e
+# tempo máximo de espera pela resposta do endpoint /models
+API_KEY_CHECK_TTL = int(os.environ.get("GROQ_KEY_CHECK_TTL", "3600"))
+API_KEY_CHECK_TIMEOUT = float(os.environ.get("GROQ_KEY_CHECK_TIMEOUT", "3"))
+
+# Falhas de rede (sem resposta da API) são verificadas de novo após esse
+# intervalo, em vez de valerem pelo TTL inteiro
+API_KEY_RETRY_INTERVAL = 30
+
+# Modo offline (GROQ_KEY_OFFLINE=1): não acessa a rede e aceita apenas
+# chaves já validadas antes, registradas (pelo hash) em API_KEY_CHECK_PATH.
+# Fora dele, essas chaves também são aceitas quando a API não responde
+API_KEY_OFFLINE = os.environ.get("GROQ_KEY_OFFLINE", "0").lower() in ("1", "true", "sim", "yes")
+API_KEY_CHECK_PATH = os.environ.get("GROQ_KEY_CHECK_PATH", os.path.join(".cache", "groq_key.json"))
+
+# Estado compartilhado do processo (sobrevive aos reruns do Streamlit):
+# resultados por hash da chave {hash: (válida, erro, instante, expira em)},
+# verificações em andamento {hash: thread} e a sessão HTTP reutilizada
+_results = {}
+_pending = {}
+_lock = threading.Lock()
+_session = None
+
+def key_fingerprint(api_key):
+    """
+    Hash da chave, usado no cache e no registro de chaves validadas (a chave
+    em si nunca é gravada).
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def _get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+def _load_validated():
+    try:
+        with open(API_KEY_CHECK_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("validated", {})
+    except (OSError, ValueError):
+        return {}
+
+def _save_validated(fingerprint):
+    """
+    Registra a chave como validada, para o modo offline.
+    """
+    validated = _load_validated()
+    validated[fingerprint] = time.time()
+    try:
+        directory = os.path.dirname(API_KEY_CHECK_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = API_KEY_CHECK_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"validated": validated}, f)
+        os.replace(tmp_path, API_KEY_CHECK_PATH)
+    except OSError as e:
+        logger.warning(f"Não foi possível registrar a chave validada em {API_KEY_CHECK_PATH}: {e}")
+
+def _request_check(api_key):
+    """
+    Consulta o endpoint /models com a chave. Retorna (válida, erro, falha de
+    rede).
+    """
+    api_base = os.environ.get("GROQ_API_BASE", "https://api.groq.com").rstrip("/")
+    url = f"{api_base}/openai/v1/models"
+    headers = {"Authorization": f"Bearer {api_key}"}
+    try:
+        response = _get_session().get(url, headers=headers, timeout=API_KEY_CHECK_TIMEOUT)
+    except requests.RequestException as e:
+        return False, str(e), True
+    if response.status_code == 200:
+        return True, None, False
+    return False, f"Status: {response.status_code} - {response.text}", False
+
+def _run_check(api_key, fingerprint):
+    started = time.perf_counter()
+    if API_KEY_OFFLINE:
+        valid = fingerprint in _load_validated()
+        error = None if valid else "Modo offline: a chave ainda não foi validada com acesso à rede"
+        ttl = API_KEY_CHECK_TTL
+        network_error = False
+    else:
+        valid, error, network_error = _request_check(api_key)
+        ttl = min(API_KEY_CHECK_TTL, API_KEY_RETRY_INTERVAL) if network_error else API_KEY_CHECK_TTL
+        if valid:
+            _save_validated(fingerprint)
+    validated = network_error and fingerprint in _load_validated()
+    now = time.time()
+    with _lock:
+        previous = _results.get(fingerprint)
+        if network_error and previous is not None and previous[0]:
+            # Sem resposta da API: mantém a chave já validada, verificando de
+            # novo após o intervalo curto
+            valid, error = True, None
+            _results[fingerprint] = (True, None, previous[2], now + ttl)
+        elif network_error and validated:
+            # Chave validada por uma execução anterior (registro em disco),
+            # por exemplo após reiniciar o servidor durante a falha de rede
+            valid, error = True, None
+            _results[fingerprint] = (True, None, now, now + ttl)
+        else:
+            _results[fingerprint] = (valid, error, now, now + ttl)
+        _pending.pop(fingerprint, None)
+    logger.info(
+        f"Chave da API do Groq verificada em {(time.perf_counter() - started) * 1000:.0f} ms: "
+        f"{'válida' if valid else 'inválida'}{' (offline)' if API_KEY_OFFLINE else ''}"
+    )
+    return valid, error
+
+def _cached_result(fingerprint):
+    """
+    Resultado ainda válido da chave, ou None. Deve ser chamada com _lock
+    adquirido.
+    """
+    cached = _results.get(fingerprint)
+    if cached is not None and time.time() < cached[3]:
+        return cached[0], cached[1]
+    return None
+
+def check_api_key(api_key, force=False):
+    """
+    Verifica a chave da API do Groq, usando o resultado em cache enquanto
+    ele não expira (force=True ignora o cache). Se a mesma chave já está
+    sendo verificada em segundo plano, aguarda essa verificação. Retorna
+    (True, None) se for válida, (False, erro) se for inválida.
+    """
+    fingerprint = key_fingerprint(api_key)
+    with _lock:
+        result = None if force else _cached_result(fingerprint)
+        thread = _pending.get(fingerprint)
+    if result is not None:
+        return result
+    if thread is not None and not force:
+        thread.join()
+        with _lock:
+            result = _results.get(fingerprint)
+        if result is not None:
+            return result[0], result[1]
+    return _run_check(api_key, fingerprint)
+
+def api_key_status(api_key):
+    """
+    Retorna sem bloquear o resultado da verificação da chave, (válida,
+    erro), ou None se a primeira verificação ainda não terminou. Sem
+    resultado dentro da validade, inicia a verificação em segundo plano e
+    retorna o resultado anterior, se houver.
+    """
+    fingerprint = key_fingerprint(api_key)
+    with _lock:
+        result = _cached_result(fingerprint)
+        if result is not None:
+            return result
+        if fingerprint not in _pending:
+            thread = threading.Thread(
+                target=_run_check, args=(api_key, fingerprint), name="groq-key-check", daemon=True
+            )
+            _pending[fingerprint] = thread
+            thread.start()
+        stale = _results.get(fingerprint)
+    return (stale[0], stale[1]) if stale is not None else None
@@ -1,9 +1,14 @@
 import streamlit as st
 import os
 import sys
-import requests
+import time
 import logging
-from models import get_conversation_chain, get_available_brands
+from startup import record_phase, start_warmup, startup_phase, startup_report
+with startup_phase("importações"):
+    from models import ALL_BRANDS, FEDERATED_SEARCH, embedding_cache_stats, get_conversation_chain, get_available_brands, ask_question
+    from model_artifacts import managed_models, preflight
+    from query_engine import get_query_engine
+from api_key_check import api_key_status, check_api_key
 from dotenv import load_dotenv
 import traceback
 
@@ -14,6 +19,13 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente
 load_dotenv()
 
+# Intervalo mínimo (segundos) entre atualizações da resposta em streaming
+STREAM_RENDER_INTERVAL = 0.05
+
+# "async" responde pelo motor assíncrono compartilhado (query_engine.py);
+# "chain" executa a cadeia de conversação na thread do script
+QUERY_ENGINE = os.environ.get("QUERY_ENGINE", "async").lower()
+
 # Configuração da página Streamlit
 st.set_page_config(
     page_title="Especialista em Impermeabilização",
@@ -21,27 +33,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# Função para verificar a validade da chave da API do Groq
-def verify_groq_api_key(api_key):
-    """
-    Verifica se a chave da API do Groq é válida fazendo uma chamada de teste.
-    Retorna (True, None) se for válida, (False, erro) se for inválida.
-    """
-    url = "https://api.groq.com/openai/v1/models"
-    headers = {
-        "Authorization": f"Bearer {api_key}"
-    }
-    
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return True, None
-        else:
-            error_message = f"Status: {response.status_code} - {response.text}"
-            return False, error_message
-    except Exception as e:
-        return False, str(e)
-
 # Função para verificar se o diretório vectordb existe
 def check_vectordb_directory():
     """
@@ -65,7 +56,14 @@ def initialize_conversation(brand_folder, brand_display_name):
     """
     try:
         logger.info(f"Inicializando conversa para a marca: {brand_folder}")
-        conversation = get_conversation_chain(brand_folder)
+        if QUERY_ENGINE == "async" or brand_folder == ALL_BRANDS:
+            # O motor assíncrono compartilhado responde às perguntas; a
+            # sessão guarda apenas a memória da conversa
+            conversation = None
+            memory = get_query_engine().create_memory()
+        else:
+            conversation = get_conversation_chain(brand_folder)
+            memory = conversation.memory
         logger.info(f"Conversa inicializada com sucesso para {brand_folder}")
         
         # Limpa o histórico
@@ -76,6 +74,7 @@ def initialize_conversation(brand_folder, brand_display_name):
         # Atualiza o estado da conversa
         st.session_state.selected_brand = brand_folder
         st.session_state.conversation = conversation
+        st.session_state.memory = memory
         
         return True, None
     except Exception as e:
@@ -146,9 +145,24 @@ if not vectordb_exists:
     
     st.stop()
 
+# Verifica se os modelos (embeddings e cross-encoder) podem ser carregados
+# (sem acesso ao Hugging Face Hub quando EMBEDDING_MODEL_OFFLINE=1)
+model_ready, model_error = preflight(*(model_name for model_name, _ in managed_models()))
+if not model_ready:
+    st.error(f"""
+    ⚠️ **Modelo indisponível**
+    
+    {model_error}
+    
+    Baixe os modelos com `python model_artifacts.py` e inclua a pasta `model_artifacts` na implantação.
+    """)
+    st.stop()
+
 # Inicializa o estado da sessão se não existir
 if "conversation" not in st.session_state:
     st.session_state.conversation = None
+if "memory" not in st.session_state:
+    st.session_state.memory = None
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "selected_brand" not in st.session_state:
@@ -159,6 +173,8 @@ if "conversation_error" not in st.session_state:
     st.session_state.conversation_error = None
 if "source_documents" not in st.session_state:
     st.session_state.source_documents = []
+if "last_retrieval_stats" not in st.session_state:
+    st.session_state.last_retrieval_stats = {}
 
 # Tenta obter a chave da API do Groq de múltiplas fontes
 groq_api_key = os.environ.get("GROQ_API_KEY")
@@ -191,7 +207,7 @@ if not groq_api_key:
         manual_key = st.text_input("Chave da API do Groq", type="password")
         if st.button("Salvar e Usar Chave") and manual_key:
             # Verifica se a chave inserida é válida
-            is_valid, error = verify_groq_api_key(manual_key.strip())
+            is_valid, error = check_api_key(manual_key.strip(), force=True)
             if is_valid:
                 groq_api_key = manual_key.strip()
                 os.environ["GROQ_API_KEY"] = groq_api_key
@@ -203,8 +219,10 @@ if not groq_api_key:
     if not groq_api_key:
         st.stop()
 else:
-    # Verifica se a chave existente é válida
-    is_valid, error = verify_groq_api_key(groq_api_key)
+    # A chave é verificada em segundo plano, uma vez por GROQ_KEY_CHECK_TTL
+    # no processo; enquanto a primeira verificação não termina, a aplicação
+    # segue normalmente
+    is_valid, error = api_key_status(groq_api_key) or (True, None)
     if not is_valid:
         st.error(f"""
         ⚠️ **Chave da API do Groq inválida!**
@@ -222,7 +240,7 @@ else:
             manual_key = st.text_input("Chave da API do Groq", type="password")
             if st.button("Salvar e Usar Chave") and manual_key:
                 # Verifica se a chave inserida é válida
-                is_valid, error = verify_groq_api_key(manual_key.strip())
+                is_valid, error = check_api_key(manual_key.strip(), force=True)
                 if is_valid:
                     groq_api_key = manual_key.strip()
                     os.environ["GROQ_API_KEY"] = groq_api_key
@@ -265,6 +283,10 @@ except Exception as e:
     logger.error(f"Erro ao carregar bancos de dados vetoriais: {str(e)}")
     st.stop()
 
+# Aquece o modelo de embeddings e o banco da marca padrão em segundo plano
+# enquanto a interface é exibida (uma vez por processo)
+start_warmup(brands)
+
 # Sidebar com seleção de marca
 with st.sidebar:
     st.header("Selecione a Marca")
@@ -272,6 +294,11 @@ with st.sidebar:
     # Transformar a lista de dicionários em uma lista de nomes para exibição
     brand_options = [brand["display"] for brand in brands]
     
+    # Opção de consulta federada, em todas as marcas ao mesmo tempo
+    if FEDERATED_SEARCH and len(brands) > 1:
+        brands = brands + [{"folder": ALL_BRANDS, "display": "Todas as marcas"}]
+        brand_options = brand_options + ["Todas as marcas"]
+    
     # Dropdown para seleção de marca
     selected_brand_display = st.selectbox(
         "Marca:",
@@ -343,9 +370,16 @@ st.header(f"Chat com Especialista - {selected_brand_display}")
 debug_expander = st.expander("Informações de Diagnóstico")
 with debug_expander:
     st.write(f"Marca selecionada: {st.session_state.selected_brand}")
-    st.write(f"Conversa inicializada: {'Sim' if st.session_state.conversation else 'Não'}")
+    st.write(f"Conversa inicializada: {'Sim' if st.session_state.memory is not None else 'Não'}")
     st.write(f"Total de mensagens no histórico: {len(st.session_state.messages)}")
-    if not st.session_state.conversation:
+    if st.session_state.last_retrieval_stats:
+        st.write("Última recuperação:")
+        st.json(st.session_state.last_retrieval_stats)
+    st.write("Inicialização do servidor (ms):")
+    st.json(startup_report())
+    st.write("Cache de embeddings das consultas:")
+    st.json(embedding_cache_stats())
+    if st.session_state.memory is None:
         st.warning("A conversa não está inicializada. Selecione uma marca e clique em 'Confirmar Seleção'.")
 
 # Exibe mensagens do histórico
@@ -369,7 +403,7 @@ if prompt := st.chat_input("Digite sua pergunta sobre produtos de impermeabiliza
         st.markdown(prompt)
     
     # Verifica se a conversa foi inicializada
-    if not st.session_state.conversation:
+    if st.session_state.memory is None:
         st.error("Por favor, selecione uma marca e clique em 'Confirmar Seleção' antes de fazer perguntas.")
         st.stop()
     
@@ -379,8 +413,32 @@ if prompt := st.chat_input("Digite sua pergunta sobre produtos de impermeabiliza
         message_placeholder.markdown("Pensando...")
         
         try:
-            # Gera resposta com tratamento para o novo formato
-            response = st.session_state.conversation({"question": prompt})
+            # Gera a resposta exibindo os tokens à medida que chegam
+            streamed_tokens = []
+            last_render = [0.0]
+            
+            def show_token(token):
+                streamed_tokens.append(token)
+                now = time.monotonic()
+                if now - last_render[0] >= STREAM_RENDER_INTERVAL:
+                    message_placeholder.markdown("".join(streamed_tokens) + "▌")
+                    last_render[0] = now
+            
+            query_started = time.perf_counter()
+            if QUERY_ENGINE == "async" or st.session_state.selected_brand == ALL_BRANDS:
+                # A consulta roda no event loop do motor; esta thread apenas
+                # consome os tokens e atualiza a interface
+                stream = get_query_engine().stream(
+                    st.session_state.selected_brand,
+                    prompt,
+                    memory=st.session_state.memory
+                )
+                for token in stream:
+                    show_token(token)
+                response = stream.result()
+            else:
+                response = ask_question(st.session_state.conversation, prompt, on_token=show_token)
+            record_phase("primeira consulta", (time.perf_counter() - query_started) * 1000)
             
             # Log da resposta completa para debug
             logger.info(f"Resposta completa: {response.keys()}")
@@ -393,6 +451,9 @@ if prompt := st.chat_input("Digite sua pergunta sobre produtos de impermeabiliza
                 answer = response.get("result", "Desculpe, não consegui processar sua pergunta.")
                 logger.warning("Usando campo 'result' como fallback para resposta")
             
+            # Guarda as estatísticas da recuperação para o painel de diagnóstico
+            st.session_state.last_retrieval_stats = response.get("retrieval_stats", {})
+            
             # Guarda os documentos fonte para exibição
             if "source_documents" in response:
                 st.session_state.source_documents.append(response["source_documents"])
@@ -408,6 +469,10 @@ if prompt := st.chat_input("Digite sua pergunta sobre produtos de impermeabiliza
             
             # Exibe resposta
             message_placeholder.markdown(answer)
+            if st.session_state.last_retrieval_stats.get("cache"):
+                st.caption("⚡ Resposta obtida do cache de respostas")
+            elif st.session_state.last_retrieval_stats.get("tech_data"):
+                st.caption("⚡ Resposta obtida da tabela de dados técnicos das fichas")
             
             # Adiciona resposta do assistente ao histórico
             st.session_state.messages.append({"role": "assistant", "content": answer})
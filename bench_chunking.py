@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Compara as estratégias de chunks da ingestão (ver chunking.py) sobre as
+fichas técnicas de uma ou mais marcas: quantidade e tamanho dos chunks,
+tamanho do banco vetorial gerado, taxa de acerto da recuperação e tokens
+recuperados por pergunta.
+
+As perguntas são geradas a partir dos dados técnicos extraídos das fichas
+(tech_data.py): "Qual o consumo do <produto>?" acerta quando algum dos k
+chunks recuperados do produto contém o valor do campo.
+
+Uso:
+    python bench_chunking.py "FT_SIKA" "FT - DENVER" --k 4
+"""
+import os
+import glob
+import shutil
+import argparse
+import logging
+import tempfile
+import time
+
+from langchain_community.vectorstores import Chroma
+
+from chunking import create_splitter
+from conversation_memory import estimate_tokens
+from ingest import BRANDS, SPLITTER_SETTINGS, extract_documents
+from models import get_embeddings
+from product_matcher import normalize_text
+from tech_data import extract_tech_rows
+
+# Configuração de logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ["caracteres", "secoes"]
+
+# Pergunta gerada para cada campo técnico
+FIELD_QUESTIONS = {
+    "consumo": "Qual o consumo do {product}?",
+    "rendimento": "Qual o rendimento do {product}?",
+    "secagem": "Qual o tempo de secagem do {product}?",
+    "validade": "Qual a validade do {product}?",
+    "embalagem": "Qual a embalagem do {product}?",
+}
+
+# Trecho inicial do valor procurado nos chunks recuperados
+ANSWER_PREFIX_CHARS = 40
+
+def load_pages(brands):
+    """
+    Extrai as páginas de todas as fichas das marcas, como na ingestão.
+    """
+    pdf_files = []
+    for brand in brands:
+        pdf_files.extend(sorted(glob.glob(os.path.join(brand, "*.pdf"))))
+    extracted, _ = extract_documents(pdf_files)
+    pages = []
+    for pdf_file, docs in extracted.items():
+        for doc in docs:
+            doc.metadata["brand"] = os.path.basename(os.path.dirname(pdf_file))
+        pages.extend(docs)
+    return pages
+
+def build_questions(pages):
+    """
+    Uma pergunta por (produto, campo) encontrado nas fichas, com o trecho
+    normalizado da resposta esperada.
+    """
+    questions = {}
+    for _, product, field, _, value, _, _ in extract_tech_rows(pages):
+        if (product, field) not in questions:
+            questions[(product, field)] = (
+                FIELD_QUESTIONS[field].format(product=product),
+                normalize_text(value)[:ANSWER_PREFIX_CHARS],
+            )
+    return [(product, question, answer) for (product, _), (question, answer) in questions.items()]
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path) for name in files
+    )
+
+def run_strategy(strategy, pages, questions, embeddings, k):
+    """
+    Gera os chunks com a estratégia, grava um banco vetorial temporário e
+    executa as perguntas, restritas ao produto de cada uma (como a busca do
+    índice de produtos).
+    """
+    splitter = create_splitter(dict(SPLITTER_SETTINGS, strategy=strategy))
+    started = time.perf_counter()
+    chunks = splitter.split_documents(pages)
+    split_seconds = time.perf_counter() - started
+
+    persist_directory = tempfile.mkdtemp(prefix=f"bench_{strategy}_")
+    try:
+        vectordb = Chroma.from_documents(chunks, embeddings, persist_directory=persist_directory)
+        hits = 0
+        retrieved_tokens = 0
+        started = time.perf_counter()
+        for product, question, answer in questions:
+            docs = vectordb.similarity_search(question, k=k, filter={"product": product})
+            retrieved_tokens += sum(estimate_tokens(doc.page_content) for doc in docs)
+            if answer in normalize_text(" ".join(doc.page_content for doc in docs)):
+                hits += 1
+        query_seconds = time.perf_counter() - started
+        index_bytes = directory_size(persist_directory)
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+    sizes = [len(chunk.page_content) for chunk in chunks]
+    return {
+        "strategy": strategy,
+        "chunks": len(chunks),
+        "avg_chars": sum(sizes) / len(sizes) if sizes else 0,
+        "split_ms": split_seconds * 1000,
+        "index_mb": index_bytes / (1024 * 1024),
+        "hit_rate": hits / len(questions) if questions else 0,
+        "tokens_per_query": retrieved_tokens / len(questions) if questions else 0,
+        "query_ms": query_seconds * 1000 / len(questions) if questions else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara as estratégias de chunks da ingestão")
+    parser.add_argument("brands", nargs="*", help="Pastas de marca (padrão: todas)")
+    parser.add_argument("--k", type=int, default=4, help="Chunks recuperados por pergunta")
+    parser.add_argument("--strategies", nargs="+", default=STRATEGIES, choices=STRATEGIES)
+    args = parser.parse_args()
+
+    brands = [brand for brand in (args.brands or BRANDS) if os.path.isdir(brand)]
+    pages = load_pages(brands)
+    questions = build_questions(pages)
+    print(f"{len(pages)} páginas de {len(brands)} marcas, {len(questions)} perguntas, k={args.k}")
+
+    embeddings = get_embeddings()
+    print(f"{'estratégia':<12} {'chunks':>7} {'média':>7} {'divisão':>9} {'índice':>9} "
+          f"{'acertos':>8} {'tokens/perg.':>13} {'busca':>9}")
+    for strategy in args.strategies:
+        result = run_strategy(strategy, pages, questions, embeddings, args.k)
+        print(
+            f"{result['strategy']:<12} {result['chunks']:>7} {result['avg_chars']:>7.0f} "
+            f"{result['split_ms']:>7.0f}ms {result['index_mb']:>7.2f}MB {result['hit_rate']:>8.1%} "
+            f"{result['tokens_per_query']:>13.0f} {result['query_ms']:>7.1f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Compara o índice compacto (VECTOR_BACKEND=compact: vetores int8 com
+reordenação em float16) com os bancos Chroma atuais: tamanho em disco, tempo de
+carregamento, recall@k e latência das buscas. Também mostra o tamanho total
+dos artefatos de deploy de cada backend (chroma, flat e compact, com os
+índices auxiliares), como exportados por ingest.py --export-deploy.
+
+O recall é medido contra a busca exata (cosseno em float32) sobre os
+vetores gravados no próprio banco. As perguntas são geradas a partir dos
+produtos de cada marca ("Qual o consumo do <produto>?").
+
+Uso:
+    python bench_compact_index.py "FT_SIKA" --k 5
+    python bench_compact_index.py --sizes-only
+"""
+import os
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+
+from compact_index import COMPACT_INDEX_DIRNAME, normalize_rows, write_compact_index
+from flat_index import FLAT_INDEX_DIRNAME, CompactIndex, load_flat_index, write_flat_index
+from ingest import is_chroma_file
+from models import VECTORDB_ROOT, get_embeddings
+
+# Configuração de logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+QUESTION_TEMPLATES = [
+    "Qual o consumo do {product}?",
+    "Como aplicar o {product}?",
+    "Qual a validade e a embalagem do {product}?",
+]
+
+def directory_size(path, exclude=()):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [name for name in dirs if name not in exclude]
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def artifact_sizes(persist_directory, data):
+    """
+    Tamanho total (bytes) dos artefatos de deploy da marca em cada backend:
+    os índices auxiliares (manifesto, índice lexical, dados técnicos...)
+    mais os arquivos do Chroma, o índice plano ou o índice compacto.
+    """
+    shared = chroma = 0
+    for name in os.listdir(persist_directory):
+        path = os.path.join(persist_directory, name)
+        if name in (FLAT_INDEX_DIRNAME, COMPACT_INDEX_DIRNAME):
+            continue
+        size = directory_size(path) if os.path.isdir(path) else os.path.getsize(path)
+        if is_chroma_file(path):
+            chroma += size
+        else:
+            shared += size
+
+    sizes = {"chroma": shared + chroma}
+    tmp_dir = tempfile.mkdtemp(prefix="bench_sizes_")
+    try:
+        for backend, dirname, write_index in (
+            ("flat", FLAT_INDEX_DIRNAME, write_flat_index),
+            ("compact", COMPACT_INDEX_DIRNAME, write_compact_index),
+        ):
+            write_index(tmp_dir, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+            sizes[backend] = shared + directory_size(os.path.join(tmp_dir, dirname))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return sizes
+
+def recall(found, expected):
+    return len(set(found) & set(expected)) / len(expected) if expected else 1.0
+
+def bench_brand(brand_folder, embeddings, k, max_questions):
+    """
+    Mede a marca nos dois índices. Sem embeddings (--sizes-only), retorna
+    apenas o tamanho dos artefatos de deploy de cada backend.
+    """
+    persist_directory = os.path.join(VECTORDB_ROOT, brand_folder)
+
+    # Chroma: abertura do banco e primeira busca
+    started = time.perf_counter()
+    vectordb = Chroma(persist_directory=persist_directory)
+    collection = vectordb._collection
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    if not data["ids"]:
+        return None
+    deploy_sizes = artifact_sizes(persist_directory, data)
+    if embeddings is None:
+        return {"brand": brand_folder, "chunks": len(data["ids"]), "deploy_mb": mb(deploy_sizes)}
+    vectors = normalize_rows(data["embeddings"])
+    collection.query(query_embeddings=[vectors[0].tolist()], n_results=1)
+    chroma_load_ms = (time.perf_counter() - started) * 1000
+
+    products = sorted({(metadata or {}).get("product") for metadata in data["metadatas"]} - {None})
+    questions = [template.format(product=product) for product in products for template in QUESTION_TEMPLATES]
+    questions = questions[:max_questions]
+    query_vectors = normalize_rows(embeddings.embed_documents(questions))
+
+    # Resultado exato (float32) para o recall
+    ids = np.asarray(data["ids"])
+    expected = [list(ids[np.argsort(-(vectors @ query))[:k]]) for query in query_vectors]
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_compact_")
+    try:
+        write_compact_index(tmp_dir, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+        compact_bytes = directory_size(os.path.join(tmp_dir, COMPACT_INDEX_DIRNAME))
+
+        started = time.perf_counter()
+        index = load_flat_index(tmp_dir, CompactIndex)
+        index.search_ids(query_vectors[0], 1)
+        compact_load_ms = (time.perf_counter() - started) * 1000
+
+        results = {"chroma": [], "compacto": []}
+        timings = {"chroma": 0.0, "compacto": 0.0}
+        for query in query_vectors:
+            started = time.perf_counter()
+            found = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+            timings["chroma"] += time.perf_counter() - started
+            results["chroma"].append(found)
+
+            started = time.perf_counter()
+            found = [index.ids[position] for position, _ in index.search_ids(query, k)]
+            timings["compacto"] += time.perf_counter() - started
+            results["compacto"].append(found)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {
+        "brand": brand_folder,
+        "chunks": len(ids),
+        "questions": len(questions),
+        "chroma_mb": directory_size(persist_directory, exclude={COMPACT_INDEX_DIRNAME}) / (1024 * 1024),
+        "compact_mb": compact_bytes / (1024 * 1024),
+        "chroma_load_ms": chroma_load_ms,
+        "compact_load_ms": compact_load_ms,
+        "chroma_recall": np.mean([recall(f, e) for f, e in zip(results["chroma"], expected)]),
+        "compact_recall": np.mean([recall(f, e) for f, e in zip(results["compacto"], expected)]),
+        "chroma_query_ms": timings["chroma"] * 1000 / len(questions),
+        "compact_query_ms": timings["compacto"] * 1000 / len(questions),
+        "deploy_mb": mb(deploy_sizes),
+    }
+
+def mb(sizes):
+    return {backend: size / (1024 * 1024) for backend, size in sizes.items()}
+
+def print_deploy_sizes(results):
+    print()
+    print(f"{'artefatos de deploy (MB)':<26} {'chroma':>8} {'flat':>8} {'compact':>8}")
+    totals = {"chroma": 0.0, "flat": 0.0, "compact": 0.0}
+    for result in results:
+        sizes = result["deploy_mb"]
+        print(f"{result['brand']:<26} {sizes['chroma']:>8.2f} {sizes['flat']:>8.2f} {sizes['compact']:>8.2f}")
+        for backend in totals:
+            totals[backend] += sizes[backend]
+    print(f"{'total':<26} {totals['chroma']:>8.2f} {totals['flat']:>8.2f} {totals['compact']:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o índice compacto com os bancos Chroma")
+    parser.add_argument("brands", nargs="*", help="Pastas de marca em vectordb/ (padrão: todas)")
+    parser.add_argument("--k", type=int, default=5, help="Documentos por busca (recall@k)")
+    parser.add_argument("--max-questions", type=int, default=200, help="Perguntas por marca")
+    parser.add_argument(
+        "--sizes-only", action="store_true",
+        help="Mostra apenas o tamanho dos artefatos de deploy (sem o modelo de embeddings)"
+    )
+    args = parser.parse_args()
+
+    brands = args.brands or sorted(
+        name for name in os.listdir(VECTORDB_ROOT) if os.path.isdir(os.path.join(VECTORDB_ROOT, name))
+    )
+    embeddings = None if args.sizes_only else get_embeddings()
+    if embeddings is not None:
+        print(f"{'marca':<20} {'chunks':>6} {'tamanho (MB)':>16} {'carga (ms)':>16} "
+              f"{'recall@' + str(args.k):>16} {'busca (ms)':>16}")
+        print(f"{'':<20} {'':>6} {'chroma  compacto':>16} {'chroma  compacto':>16} "
+              f"{'chroma  compacto':>16} {'chroma  compacto':>16}")
+    results = []
+    for brand in brands:
+        try:
+            result = bench_brand(brand, embeddings, args.k, args.max_questions)
+        except Exception as e:
+            print(f"{brand:<20} erro: {e}")
+            continue
+        if result is None:
+            print(f"{brand:<20} banco vazio")
+            continue
+        results.append(result)
+        if embeddings is None:
+            continue
+        print(
+            f"{result['brand']:<20} {result['chunks']:>6} "
+            f"{result['chroma_mb']:>7.2f} {result['compact_mb']:>8.2f} "
+            f"{result['chroma_load_ms']:>7.0f} {result['compact_load_ms']:>8.1f} "
+            f"{result['chroma_recall']:>7.3f} {result['compact_recall']:>8.3f} "
+            f"{result['chroma_query_ms']:>7.2f} {result['compact_query_ms']:>8.3f}"
+        )
+    print_deploy_sizes(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Compara os backends do modelo de embeddings (ver onnx_embeddings.py):
+sentence-transformers sobre PyTorch, ONNX Runtime e ONNX Runtime com o
+modelo quantizado em int8. Para cada backend são medidos o tempo de
+carregamento, a latência de uma pergunta, a vazão em lote, a memória (RSS)
+do processo e a paridade com o backend de referência (o primeiro da lista):
+cosseno entre os vetores das perguntas e sobreposição dos k chunks
+recuperados do banco vetorial existente da marca.
+
+Cada backend roda em um processo separado, para que a memória de um não
+afete a medição do outro. Requer o modelo local com a exportação ONNX
+(python model_artifacts.py --int8).
+
+Uso:
+    python bench_embeddings.py "FT_SIKA" --k 5
+"""
+import os
+import time
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Configuração de logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+QUESTION_TEMPLATES = [
+    "Qual o consumo do {product}?",
+    "Como aplicar o {product}?",
+    "Qual a validade e a embalagem do {product}?",
+]
+
+def current_rss_mb():
+    """
+    Memória residente atual do processo (Linux), em MB.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return float("nan")
+
+def load_encoder(backend, model_dir):
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_dir, device="cpu")
+    from onnx_embeddings import OnnxSentenceEncoder
+    return OnnxSentenceEncoder(model_dir, quantized=backend == "onnx-int8")
+
+def run_backend(backend, model_dir, questions, documents, batch_size):
+    """
+    Executado em um processo separado: carrega o backend e codifica as
+    perguntas (uma a uma) e os documentos (em lotes).
+    """
+    import resource
+
+    rss_start = current_rss_mb()
+    started = time.perf_counter()
+    encoder = load_encoder(backend, model_dir)
+    encoder.encode(["aquecimento"], normalize_embeddings=True)
+    load_ms = (time.perf_counter() - started) * 1000
+    rss_loaded = current_rss_mb()
+
+    latencies = []
+    query_vectors = []
+    for question in questions:
+        started = time.perf_counter()
+        query_vectors.append(encoder.encode([question], normalize_embeddings=True)[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    encoder.encode(documents, batch_size=batch_size, normalize_embeddings=True)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "load_ms": load_ms,
+        "model_mb": rss_loaded - rss_start,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+        "docs_per_s": len(documents) / batch_seconds if batch_seconds else float("nan"),
+        "query_vectors": np.asarray(query_vectors, dtype=np.float32),
+    }
+
+def top_k(doc_vectors, query_vectors, k):
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def main():
+    from langchain_community.vectorstores import Chroma
+
+    from compact_index import normalize_rows
+    from embedding_pipeline import EMBEDDING_BATCH_SIZE
+    from model_artifacts import model_artifact_dir
+    from models import EMBEDDING_MODEL_NAME, get_persist_directory
+
+    parser = argparse.ArgumentParser(description="Compara os backends do modelo de embeddings")
+    parser.add_argument("brand", help="Pasta da marca em vectordb/ usada nas perguntas e na paridade")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--k", type=int, default=5, help="Chunks recuperados por pergunta")
+    parser.add_argument("--max-questions", type=int, default=100, help="Perguntas geradas")
+    parser.add_argument("--max-docs", type=int, default=256, help="Chunks codificados no teste de vazão")
+    args = parser.parse_args()
+
+    model_dir = model_artifact_dir(EMBEDDING_MODEL_NAME)
+    data = Chroma(persist_directory=get_persist_directory(args.brand)).get(
+        include=["embeddings", "documents", "metadatas"]
+    )
+    if not data["ids"]:
+        print(f"Banco vazio: {args.brand}")
+        return
+    doc_vectors = normalize_rows(data["embeddings"])
+    products = sorted({(metadata or {}).get("product") for metadata in data["metadatas"]} - {None})
+    questions = [template.format(product=product) for product in products for template in QUESTION_TEMPLATES]
+    questions = questions[:args.max_questions]
+    documents = [text or "" for text in data["documents"][:args.max_docs]]
+    print(f"{args.brand}: {len(questions)} perguntas, {len(documents)} chunks no lote, k={args.k}, modelo em {model_dir}")
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                results.append(
+                    executor.submit(run_backend, backend, model_dir, questions, documents, EMBEDDING_BATCH_SIZE).result()
+                )
+            except Exception as e:
+                print(f"{backend:<10} erro: {e}")
+    if not results:
+        return
+
+    reference = results[0]
+    reference_top = top_k(doc_vectors, reference["query_vectors"], args.k)
+    print(f"{'backend':<10} {'carga':>8} {'RSS modelo':>11} {'RSS pico':>9} {'p50':>8} {'p95':>8} "
+          f"{'docs/s':>8} {'cos mín.':>9} {'cos méd.':>9} {'top-' + str(args.k):>7}")
+    for result in results:
+        cosines = np.sum(result["query_vectors"] * reference["query_vectors"], axis=1)
+        found = top_k(doc_vectors, result["query_vectors"], args.k)
+        overlap = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, reference_top)])
+        print(
+            f"{result['backend']:<10} {result['load_ms']:>6.0f}ms {result['model_mb']:>9.0f}MB "
+            f"{result['peak_mb']:>7.0f}MB {result['query_p50_ms']:>6.2f}ms {result['query_p95_ms']:>6.2f}ms "
+            f"{result['docs_per_s']:>8.0f} {cosines.min():>9.4f} {cosines.mean():>9.4f} {overlap:>7.3f}"
+        )
+    print(f"Paridade em relação a {reference['backend']}; top-{args.k} sobre os vetores gravados no banco.")
+
+if __name__ == "__main__":
+    main()
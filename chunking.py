@@ -0,0 +1,175 @@
+import os
+import re
+import logging
+from collections import Counter
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Estratégia de divisão das fichas técnicas em chunks:
+# - "secoes": uma ficha é dividida pelas seções (títulos em maiúsculas),
+#   sem cortar linhas de tabela nem separar páginas de uma mesma seção
+# - "caracteres": blocos de tamanho fixo por página (comportamento original)
+CHUNKING_STRATEGY = os.environ.get("CHUNKING", "secoes").lower()
+
+# Linhas de numeração de página ("1 / 3")
+PAGE_NUMBER_PATTERN = re.compile(r"^\d+\s*/\s*\d*$")
+
+def is_section_title(line):
+    """
+    Títulos de seção das fichas ("DESCRIÇÃO DO PRODUTO", "DADOS DO PRODUTO",
+    "CONSUMO"): linhas curtas, só com letras maiúsculas e sem números ou
+    pontuação final.
+    """
+    if not 3 <= len(line) <= 60 or line[-1] in ".,;:":
+        return False
+    letters = [ch for ch in line if ch.isalpha()]
+    if len(letters) < 3 or any(ch.isdigit() for ch in line):
+        return False
+    return all(ch.isupper() for ch in letters)
+
+def _is_continuation(previous, line):
+    # Frases quebradas pelo PDF: a linha seguinte começa em minúscula ou a
+    # anterior termina com hífen
+    return previous.endswith("-") or line[:1].islower()
+
+def _repeated_lines(pages):
+    """
+    Linhas repetidas em todas as páginas de uma ficha com mais de uma
+    página (cabeçalhos e rodapés).
+    """
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for _, text in pages:
+        counts.update({line.strip() for line in text.splitlines() if line.strip()})
+    return {line for line, count in counts.items() if count == len(pages)}
+
+def parse_sections(pages):
+    """
+    Lê as páginas de uma ficha ([(página, texto)], em ordem) e retorna as
+    seções como dicts {"title", "page", "rows"}. Cada linha de tabela ou de
+    texto é uma "row", junto com as linhas que a continuam; cabeçalhos e
+    rodapés repetidos são mantidos apenas na primeira página.
+    """
+    repeated = _repeated_lines(pages)
+    sections = [{"title": None, "page": pages[0][0] if pages else None, "rows": []}]
+    for page_idx, (page, text) in enumerate(pages):
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or PAGE_NUMBER_PATTERN.match(line):
+                continue
+            if page_idx > 0 and line in repeated:
+                continue
+            current = sections[-1]
+            if is_section_title(line):
+                sections.append({"title": line, "page": page, "rows": []})
+            elif current["rows"] and _is_continuation(current["rows"][-1], line):
+                current["rows"][-1] += "\n" + line
+            else:
+                if not current["rows"] and current["title"] is None:
+                    current["page"] = page
+                current["rows"].append(line)
+    return [section for section in sections if section["rows"] or section["title"]]
+
+class SectionChunker:
+    """
+    Divide as fichas técnicas por seção: cada seção vira um chunk com o
+    título no início e nos metadados ("section"; a posição do chunk no
+    arquivo fica em "chunk"). Seções pequenas são unidas às seguintes até
+    min_chars; seções maiores que max_chars são divididas entre linhas,
+    repetindo o título em cada parte.
+    """
+
+    def __init__(self, max_chars=1500, min_chars=600):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        # Linhas maiores que o chunk inteiro (parágrafos sem quebra)
+        self._row_splitter = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+
+    def _section_parts(self, section):
+        """
+        Divide uma seção em partes de até max_chars, sem cortar linhas.
+        """
+        title = section["title"]
+        header = f"{title}\n" if title else ""
+        rows = []
+        for row in section["rows"]:
+            if len(header) + len(row) > self.max_chars:
+                rows.extend(self._row_splitter.split_text(row))
+            else:
+                rows.append(row)
+
+        parts = []
+        current = []
+        size = len(header)
+        for row in rows:
+            if current and size + len(row) + 1 > self.max_chars:
+                parts.append(header + "\n".join(current))
+                current, size = [], len(header)
+            current.append(row)
+            size += len(row) + 1
+        if current or not parts:
+            parts.append(header + "\n".join(current))
+        return parts
+
+    def _split_pages(self, pages, metadata):
+        chunks = []
+        pending = None
+        for section in parse_sections(pages):
+            for text in self._section_parts(section):
+                titles = [section["title"]] if section["title"] else []
+                if pending is not None and len(pending["text"]) < self.min_chars \
+                        and len(pending["text"]) + len(text) + 2 <= self.max_chars:
+                    pending["text"] += "\n\n" + text
+                    pending["titles"] += [title for title in titles if title not in pending["titles"]]
+                    continue
+                if pending is not None:
+                    chunks.append(pending)
+                pending = {"text": text, "page": section["page"], "titles": titles}
+        if pending is not None:
+            chunks.append(pending)
+
+        documents = []
+        for order, chunk in enumerate(chunks):
+            # "chunk": posição no arquivo, usada para juntar chunks
+            # consecutivos no contexto (ver context_packing.pack_context)
+            chunk_metadata = dict(metadata, page=chunk["page"], chunk=order)
+            if chunk["titles"]:
+                chunk_metadata["section"] = " / ".join(chunk["titles"])
+            documents.append(Document(page_content=chunk["text"], metadata=chunk_metadata))
+        return documents
+
+    def split_documents(self, documents):
+        """
+        Divide as páginas extraídas (um Document por página, com "source" e
+        "page" nos metadados) em chunks por seção. As páginas de um mesmo
+        arquivo são lidas em sequência, de modo que uma seção que continua
+        na página seguinte fica inteira.
+        """
+        by_source = {}
+        for doc in documents:
+            by_source.setdefault(doc.metadata.get("source"), []).append(doc)
+
+        chunks = []
+        for docs in by_source.values():
+            docs = sorted(docs, key=lambda doc: doc.metadata.get("page") or 0)
+            pages = [(doc.metadata.get("page"), doc.page_content) for doc in docs]
+            chunks.extend(self._split_pages(pages, docs[0].metadata))
+        return chunks
+
+def create_splitter(settings):
+    """
+    Cria o divisor de chunks da ingestão a partir das configurações gravadas
+    no manifesto (ingest.SPLITTER_SETTINGS).
+    """
+    strategy = settings.get("strategy", "caracteres")
+    if strategy == "secoes":
+        return SectionChunker(max_chars=settings["section_max_chars"], min_chars=settings["section_min_chars"])
+    if strategy != "caracteres":
+        logger.warning(f"Estratégia de chunks desconhecida: {strategy}; usando blocos de caracteres")
+    return RecursiveCharacterTextSplitter(chunk_size=settings["chunk_size"], chunk_overlap=settings["chunk_overlap"])
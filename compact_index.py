@@ -0,0 +1,87 @@
+import os
+import json
+import shutil
+import logging
+
+import numpy as np
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Índice compacto (vetores quantizados em int8) gravado junto a cada banco
+# vetorial quando VECTOR_BACKEND=compact; a busca fica em flat_index.py
+COMPACT_INDEX_DIRNAME = "compact_index"
+COMPACT_INDEX_VERSION = 1
+
+# Candidatos da busca aproximada (int8) reordenados pelos vetores completos,
+# por documento pedido
+RESCORE_FACTOR = int(os.environ.get("COMPACT_RESCORE_FACTOR", "4"))
+
+def quantize(vectors):
+    """
+    Quantização escalar simétrica por vetor: cada vetor vira int8 e um fator
+    de escala (o maior valor absoluto / 127).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def metadata_mask(metadatas, where):
+    """
+    Máscara dos chunks cujos metadados têm todos os valores de where
+    ({"campo": valor}, como o filtro de igualdade do Chroma).
+    """
+    return np.fromiter(
+        (all((metadata or {}).get(field) == value for field, value in where.items()) for metadata in metadatas),
+        dtype=bool, count=len(metadatas)
+    )
+
+def write_compact_index(output_dir, ids, documents, metadatas, embeddings):
+    """
+    Grava o índice compacto de uma marca em output_dir/compact_index: os
+    vetores normalizados quantizados em int8 (com a escala de cada um), os
+    mesmos vetores em float16 para a reordenação exata dos candidatos e os
+    textos e metadados dos chunks.
+    """
+    if len(ids):
+        vectors = normalize_rows(embeddings)
+        codes, scales = quantize(vectors)
+    else:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+        codes, scales = vectors.astype(np.int8), np.zeros(0, dtype=np.float32)
+
+    # Grava em um diretório temporário e troca de uma vez
+    index_dir = os.path.join(output_dir, COMPACT_INDEX_DIRNAME)
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "codes.npy"), codes)
+    np.save(os.path.join(tmp_dir, "scales.npy"), scales)
+    np.save(os.path.join(tmp_dir, "rescore.npy"), vectors.astype(np.float16))
+    with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump({"documents": list(documents), "metadatas": list(metadatas)}, f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": COMPACT_INDEX_VERSION,
+            "dimension": int(vectors.shape[1]),
+            "ids": list(ids),
+        }, f, ensure_ascii=False)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    logger.info(f"Índice compacto gravado em {index_dir}: {len(ids)} vetores")
+
+def write_compact_index_from_store(output_dir, vectordb):
+    """
+    Gera o índice compacto a partir de todos os chunks do banco vetorial.
+    """
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    write_compact_index(output_dir, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
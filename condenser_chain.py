@@ -0,0 +1,61 @@
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from pydantic import Field
+from langchain.chains import LLMChain
+
+from question_condenser import CONDENSE_MODE, decide_condense
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class FastPathCondenser(LLMChain):
+    """
+    Cadeia de reformulação da pergunta com caminho rápido: perguntas
+    autossuficientes são devolvidas sem chamar o LLM. A decisão do último
+    turno fica em last_decision e os totais da sessão em stats.
+    """
+
+    matcher: Any = None
+    mode: str = CONDENSE_MODE
+    last_decision: Optional[str] = None
+    last_elapsed_ms: float = 0.0
+    stats: Dict[str, int] = Field(default_factory=lambda: {"turns": 0, "llm_calls": 0, "skipped": 0})
+
+    def _call(self, inputs, run_manager=None):
+        started = time.perf_counter()
+        decision, new_question = decide_condense(
+            inputs["question"], inputs.get("chat_history", ""), self.matcher, self.mode
+        )
+        self.stats["turns"] += 1
+        if decision == "llm":
+            self.stats["llm_calls"] += 1
+            outputs = super()._call(inputs, run_manager=run_manager)
+        else:
+            self.stats["skipped"] += 1
+            outputs = {self.output_key: new_question}
+        self.last_decision = decision
+        self.last_elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Reformulação da pergunta: {decision} ({self.last_elapsed_ms} ms)")
+        return outputs
+
+    def reset_turn(self):
+        """
+        Limpa a decisão do turno anterior (turnos sem histórico não passam
+        pela reformulação).
+        """
+        self.last_decision = None
+        self.last_elapsed_ms = 0.0
+
+    def turn_stats(self):
+        """
+        Métricas do turno atual e totais da sessão.
+        """
+        return {
+            "decision": self.last_decision or "sem_historico",
+            "elapsed_ms": self.last_elapsed_ms,
+            "llm_calls_avoided": self.stats["skipped"],
+            "followup_turns": self.stats["turns"],
+        }
@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+
+from langchain_core.documents import Document
+
+from conversation_memory import estimate_tokens, truncate_to_tokens
+from product_matcher import normalize_text
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Orçamento de tokens do contexto enviado ao LLM (0 = sem limite)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Um trecho é considerado repetido quando essa fração das suas sequências
+# de palavras já está em um trecho mantido
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_WORDS = 5
+
+# Sobreposição máxima procurada entre chunks vizinhos (chunk_overlap da
+# divisão em blocos de caracteres) e mínima para considerá-los vizinhos
+MAX_OVERLAP_CHARS = 300
+MIN_OVERLAP_CHARS = 20
+
+def shingles(text):
+    """
+    Sequências de SHINGLE_WORDS palavras do texto normalizado.
+    """
+    words = normalize_text(text).split()
+    if len(words) <= SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def merge_overlapping(first, second):
+    """
+    Junta dois chunks vizinhos cujo fim de um repete o início do outro (em
+    qualquer ordem), sem repetir a sobreposição. Retorna None se não houver
+    sobreposição.
+    """
+    for left, right in ((first, second), (second, first)):
+        for size in range(min(MAX_OVERLAP_CHARS, len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+            if left[-size:] == right[:size]:
+                return left + right[size:]
+    return None
+
+def chunk_span(doc):
+    """
+    Posições (primeira, última) do chunk na ordem do arquivo, do metadado
+    "chunk" gravado pela divisão por seções, ou None se não houver.
+    """
+    order = doc.metadata.get("chunk")
+    return (order, order) if isinstance(order, int) else None
+
+def merge_consecutive(text, span, other_text, other_span):
+    """
+    Junta dois trechos do mesmo arquivo cujos chunks são consecutivos na
+    ordem do arquivo (spans (primeira, última) que se encostam), na ordem
+    do arquivo. Retorna (texto, span unida), ou None se não forem
+    consecutivos.
+    """
+    if span is None or other_span is None:
+        return None
+    if other_span[0] == span[1] + 1:
+        return text + "\n\n" + other_text, (span[0], other_span[1])
+    if other_span[1] == span[0] - 1:
+        return other_text + "\n\n" + text, (other_span[0], span[1])
+    return None
+
+def _join_bridged(kept, item):
+    """
+    Depois de um chunk unido a item, junta item a outro trecho mantido do
+    qual ele ficou consecutivo (ex.: chunks 2 e 0 ligados pelo 1), na
+    posição do mais relevante. Retorna se houve junção.
+    """
+    for other in kept:
+        if other is item or other["key"] != item["key"]:
+            continue
+        joined = merge_consecutive(item["text"], item["span"], other["text"], other["span"])
+        if joined is not None:
+            first, last = sorted((item, other), key=kept.index)
+            first["text"], first["span"] = joined
+            first["shingles"] = item["shingles"] | other["shingles"]
+            kept.remove(last)
+            return True
+    return False
+
+def pack_context(docs, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Monta o contexto a partir dos documentos recuperados, em ordem de
+    relevância: descarta trechos quase repetidos, junta chunks vizinhos da
+    mesma página (consecutivos na ordem do arquivo ou com texto sobreposto)
+    na posição do mais relevante e corta o resultado no orçamento de
+    tokens. Retorna (documentos, estatísticas).
+    """
+    started = time.perf_counter()
+    tokens_in = sum(estimate_tokens(doc.page_content) for doc in docs)
+    kept = []
+    duplicates = 0
+    merged = 0
+    for doc in docs:
+        doc_shingles = shingles(doc.page_content)
+        if any(
+            len(doc_shingles & item["shingles"]) >= NEAR_DUPLICATE_THRESHOLD * len(doc_shingles)
+            for item in kept
+        ):
+            duplicates += 1
+            continue
+
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        span = chunk_span(doc)
+        for item in kept:
+            if key[0] and item["key"] == key:
+                joined = merge_consecutive(item["text"], item["span"], doc.page_content, span)
+                if joined is None:
+                    text = merge_overlapping(item["text"], doc.page_content)
+                    joined = (text, item["span"]) if text is not None else None
+                if joined is not None:
+                    item["text"], item["span"] = joined
+                    item["shingles"] |= doc_shingles
+                    merged += 1 + _join_bridged(kept, item)
+                    break
+        else:
+            kept.append({"doc": doc, "key": key, "span": span, "text": doc.page_content, "shingles": doc_shingles})
+
+    packed = []
+    used = 0
+    dropped = 0
+    for item in kept:
+        text = item["text"]
+        tokens = estimate_tokens(text)
+        if budget and used + tokens > budget:
+            if packed:
+                dropped += 1
+                continue
+            # O trecho mais relevante sempre entra, cortado no orçamento
+            text = truncate_to_tokens(text, budget)
+            tokens = estimate_tokens(text)
+        packed.append(Document(id=getattr(item["doc"], "id", None), page_content=text, metadata=item["doc"].metadata))
+        used += tokens
+
+    stats = {
+        "context_tokens": used,
+        "context_tokens_saved": tokens_in - used,
+        "context_duplicates": duplicates,
+        "context_merged": merged,
+        "context_dropped": dropped,
+        "context_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info(
+        f"Contexto: {len(docs)} trechos -> {len(packed)}, {used} tokens "
+        f"({stats['context_tokens_saved']} economizados)"
+    )
+    return packed, stats
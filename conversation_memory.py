@@ -0,0 +1,62 @@
+import os
+import logging
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Turnos (pergunta + resposta) mantidos na íntegra e orçamento de tokens do
+# histórico injetado na reformulação da pergunta e no prompt da resposta
+MEMORY_MAX_TURNS = int(os.environ.get("MEMORY_MAX_TURNS", "4"))
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "1200"))
+
+# O que fazer com os turnos antigos: "window" descarta, "summary" resume
+# com o LLM em um resumo acumulado
+MEMORY_MODE = os.environ.get("MEMORY_MODE", "window").lower()
+
+# Fração do orçamento reservada ao resumo acumulado
+SUMMARY_BUDGET_FRACTION = 0.3
+
+SUMMARY_PROMPT = """Resuma a conversa abaixo entre um usuário e um especialista em produtos de impermeabilização, em português e em no máximo {max_words} palavras.
+Preserve os nomes dos produtos citados e os dados técnicos já informados (consumo, rendimento, embalagens, tempos, temperaturas).
+
+Resumo anterior:
+{summary}
+
+Novos trechos da conversa:
+{new_lines}
+
+Novo resumo:"""
+
+def estimate_tokens(text):
+    """
+    Estimativa rápida do número de tokens de um texto (~4 caracteres por
+    token), suficiente para controlar orçamentos sem carregar um tokenizador.
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Corta o texto para caber em max_tokens (pela mesma estimativa).
+    """
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+def create_memory(summary_llm=None):
+    """
+    Cria a memória da conversa conforme MEMORY_MODE, MEMORY_MAX_TURNS e
+    MEMORY_TOKEN_BUDGET. A classe da memória (langchain.memory) só é
+    importada aqui, para que importar este módulo continue leve.
+    """
+    from token_budget_memory import TokenBudgetMemory
+
+    return TokenBudgetMemory(
+        memory_key="chat_history",
+        return_messages=True,
+        output_key="answer",  # Especifica qual chave será armazenada na memória
+        summary_llm=summary_llm if MEMORY_MODE == "summary" else None,
+    )
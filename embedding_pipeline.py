@@ -0,0 +1,257 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tamanho do lote enviado ao modelo e número de threads do PyTorch (0 = padrão do PyTorch)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))
+
+# Dispositivo do modelo: "auto" escolhe cuda, mps ou cpu, nessa ordem
+EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "auto")
+
+# Backend do modelo de embeddings: "torch" (sentence-transformers) ou "onnx"
+# (ONNX Runtime na CPU, ver onnx_embeddings.py), opcionalmente com o modelo
+# quantizado em int8 (EMBEDDING_ONNX_INT8=1)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_INT8 = os.environ.get("EMBEDDING_ONNX_INT8", "0").lower() in ("1", "true", "sim", "yes")
+
+# Cache persistente de embeddings, fora de vectordb/ para não ir ao repositório
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+
+# Memória máxima (MB) do cache LRU de vetores das consultas, compartilhado
+# pelo processo (ver MemoizedEmbeddings); 0 desativa o cache
+QUERY_EMBEDDING_CACHE_MB = float(os.environ.get("QUERY_EMBEDDING_CACHE_MB", "16"))
+
+# Limite de parâmetros por consulta SQL (SQLITE_MAX_VARIABLE_NUMBER)
+_SQL_BATCH = 500
+
+def resolve_device(device=None):
+    """
+    Resolve o dispositivo usado pelo modelo de embeddings.
+    """
+    device = device or EMBEDDING_DEVICE
+    if device != "auto":
+        return device
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return "cuda"
+        if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+            return "mps"
+    except ImportError:
+        pass
+    return "cpu"
+
+def configure_threads(num_threads=None):
+    """
+    Ajusta o número de threads usadas pelo PyTorch na geração de embeddings.
+    """
+    num_threads = num_threads or EMBEDDING_THREADS
+    if num_threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+        logger.info(f"PyTorch configurado para {num_threads} threads")
+    except ImportError:
+        logger.warning("PyTorch não disponível; EMBEDDING_THREADS ignorado")
+
+def text_hash(text):
+    """
+    Hash usado como chave do texto no cache de embeddings.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Cache persistente em SQLite de vetores float32, indexado por
+    (nome do modelo, hash do texto).
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model_name, hashes):
+        """
+        Retorna {hash: vetor} para os hashes encontrados no cache.
+        """
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique), _SQL_BATCH):
+                batch = unique[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model_name, *batch]
+                )
+                for row_hash, blob in rows:
+                    found[row_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model_name, items):
+        """
+        Grava uma lista de (hash, vetor) no cache.
+        """
+        rows = [
+            (model_name, row_hash, int(vector.shape[0]), np.asarray(vector, dtype=np.float32).tobytes())
+            for row_hash, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Etapa de embeddings usada na ingestão: gera vetores normalizados em
+    float32, em lotes de tamanho configurável, e reaproveita o cache em disco
+    para que textos repetidos (avisos de segurança, rodapés de contato,
+    textos legais) sejam calculados uma única vez.
+    """
+
+    def __init__(self, model, model_name, cache=None, batch_size=None, num_threads=None):
+        # model é um SentenceTransformer já carregado
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        self.hits = 0
+        self.misses = 0
+        configure_threads(num_threads)
+
+    def _encode(self, texts):
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, hashes)
+
+        # Textos ausentes do cache, sem repetição
+        missing = {}
+        for row_hash, text in zip(hashes, texts):
+            if row_hash not in vectors and row_hash not in missing:
+                missing[row_hash] = text
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            started = time.perf_counter()
+            missing_hashes = list(missing)
+            new_items = []
+            for i in range(0, len(missing_hashes), self.batch_size):
+                batch_hashes = missing_hashes[i:i + self.batch_size]
+                encoded = self._encode([missing[row_hash] for row_hash in batch_hashes])
+                new_items.extend(zip(batch_hashes, encoded))
+            self.cache.put_many(self.model_name, new_items)
+            vectors.update(new_items)
+            logger.info(
+                f"Embeddings: {len(missing)} textos calculados em {time.perf_counter() - started:.2f}s, "
+                f"{len(texts) - len(missing)} reaproveitados do cache"
+            )
+
+        return [vectors[row_hash].tolist() for row_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Consultas não passam pelo cache em disco
+        return self._encode([text])[0].tolist()
+
+class MemoizedEmbeddings(Embeddings):
+    """
+    Envolve o modelo de embeddings das consultas com um cache LRU em
+    memória, limitado em bytes e seguro entre threads: a mesma pergunta (na
+    consulta ao cache de respostas, nos passos do plano de buscas, na busca
+    federada) é codificada pelo modelo uma única vez. Os documentos não
+    passam pelo cache.
+    """
+
+    def __init__(self, embeddings, max_bytes=None):
+        self.embeddings = embeddings
+        if max_bytes is None:
+            max_bytes = int(QUERY_EMBEDDING_CACHE_MB * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()  # {hash do texto: vetor float32}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Modelo carregado (SentenceTransformer ou OnnxSentenceEncoder), usado pela ingestão
+        return self.embeddings.client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_hash(text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+            self.misses += 1
+
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        # Vetor e chave (64 caracteres) contam no limite de memória
+        size = vector.nbytes + len(key)
+        if size > self.max_bytes:
+            return vector.tolist()
+        with self._lock:
+            if key not in self._vectors:
+                self._vectors[key] = vector
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    evicted_key, evicted = self._vectors.popitem(last=False)
+                    self._bytes -= evicted.nbytes + len(evicted_key)
+        return vector.tolist()
+
+    def stats(self):
+        """
+        Acertos, falhas, vetores e memória (bytes) do cache.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._vectors), "bytes": self._bytes}
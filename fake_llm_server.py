@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Servidor local que imita a API da Groq (compatível com OpenAI) para testar
+o streaming de respostas sem acesso à rede.
+
+Uso:
+    python fake_llm_server.py --port 8765 --delay 0.03
+
+    GROQ_API_BASE=http://127.0.0.1:8765 GROQ_API_KEY=gsk_fake streamlit run app.py
+"""
+import argparse
+import json
+import logging
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MODELS = ["llama3-70b-8192", "llama3-8b-8192"]
+
+def build_answer(messages):
+    """
+    Monta uma resposta determinística a partir das mensagens recebidas.
+    """
+    question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    return (
+        f"Resposta simulada para: \"{question}\". "
+        f"O contexto recebido tem {len(system)} caracteres. "
+        "Este texto é gerado pelo servidor local de testes e transmitido token a token "
+        "para validar o streaming da interface."
+    )
+
+def tokenize(text):
+    """
+    Quebra o texto em "tokens" (palavras com o espaço seguinte).
+    """
+    words = text.split(" ")
+    return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+def usage_for(messages, answer):
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    completion_tokens = len(answer) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    # Atraso entre tokens, configurado em main()
+    token_delay = 0.03
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/openai/v1/models":
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": name, "object": "model", "owned_by": "fake"} for name in MODELS],
+            })
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/openai/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", "0"))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+        model = request.get("model", MODELS[0])
+        answer = build_answer(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage_for(messages, answer),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None, extra=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if extra:
+                chunk.update(extra)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send_chunk({"role": "assistant", "content": ""})
+        for token in tokenize(answer):
+            time.sleep(self.token_delay)
+            send_chunk({"content": token})
+        send_chunk({}, finish_reason="stop", extra={"x_groq": {"usage": usage_for(messages, answer)}})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que simula a API da Groq")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.03, help="Atraso entre tokens, em segundos")
+    args = parser.parse_args()
+
+    FakeGroqHandler.token_delay = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), FakeGroqHandler)
+    logger.info(f"Servidor falso da Groq em http://{args.host}:{args.port} (use GROQ_API_BASE)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import json
+import shutil
+import logging
+
+import numpy as np
+from langchain_core.documents import Document
+
+from compact_index import COMPACT_INDEX_DIRNAME, COMPACT_INDEX_VERSION, RESCORE_FACTOR, metadata_mask, normalize_rows
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Índice plano (matriz float32 normalizada) gravado junto a cada banco
+# vetorial quando VECTOR_BACKEND=flat
+FLAT_INDEX_DIRNAME = "flat_index"
+FLAT_INDEX_VERSION = 1
+
+def write_flat_index(output_dir, ids, documents, metadatas, embeddings):
+    """
+    Grava o índice plano de uma marca em output_dir/flat_index: os vetores
+    normalizados em uma matriz float32 contígua e os textos e metadados dos
+    chunks, na mesma ordem.
+    """
+    if len(ids):
+        vectors = normalize_rows(embeddings)
+    else:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+
+    # Grava em um diretório temporário e troca de uma vez
+    index_dir = os.path.join(output_dir, FLAT_INDEX_DIRNAME)
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "vectors.npy"), np.ascontiguousarray(vectors))
+    with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump({"documents": list(documents), "metadatas": list(metadatas)}, f, ensure_ascii=False)
+    with open(os.path.join(tmp_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": FLAT_INDEX_VERSION,
+            "dimension": int(vectors.shape[1]),
+            "ids": list(ids),
+        }, f, ensure_ascii=False)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    logger.info(f"Índice plano gravado em {index_dir}: {len(ids)} vetores")
+
+def write_flat_index_from_store(output_dir, vectordb):
+    """
+    Gera o índice plano a partir de todos os chunks do banco vetorial.
+    """
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    write_flat_index(output_dir, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+
+class FlatIndex:
+    """
+    Busca exata por força bruta: um produto matriz-vetor sobre todos os
+    chunks da marca e seleção dos k maiores cossenos. Filtros por metadados
+    ({"campo": valor}) restringem o produto às linhas de uma máscara,
+    calculada uma vez por valor.
+    """
+
+    DIRNAME = FLAT_INDEX_DIRNAME
+    VERSION = FLAT_INDEX_VERSION
+
+    def __init__(self, ids, documents, metadatas, vectors):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self.positions = {chunk_id: position for position, chunk_id in enumerate(ids)}
+        self._masks = {}
+        self._rows = {}
+
+    @classmethod
+    def _read_chunks(cls, index_dir):
+        """
+        Lê index.json e chunks.json, comuns aos formatos de índice, e
+        retorna (ids, textos, metadados).
+        """
+        with open(os.path.join(index_dir, "index.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != cls.VERSION:
+            raise ValueError(f"versão {meta.get('version')} não suportada")
+        with open(os.path.join(index_dir, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        return meta["ids"], chunks["documents"], chunks["metadatas"]
+
+    @classmethod
+    def load(cls, index_dir):
+        vectors = np.ascontiguousarray(np.load(os.path.join(index_dir, "vectors.npy")), dtype=np.float32)
+        return cls(*cls._read_chunks(index_dir), vectors)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _mask(self, where):
+        key = tuple(sorted(where.items()))
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = metadata_mask(self.metadatas, where)
+            self._masks[key] = mask
+        return mask
+
+    def _filtered_rows(self, where):
+        """
+        Posições dos chunks que atendem ao filtro e a submatriz dos seus
+        vetores.
+        """
+        key = tuple(sorted(where.items()))
+        rows = self._rows.get(key)
+        if rows is None:
+            positions = np.flatnonzero(self._mask(where))
+            rows = (positions, np.ascontiguousarray(self.vectors[positions]))
+            self._rows[key] = rows
+        return rows
+
+    def search_ids(self, query_vector, k, filter=None):
+        """
+        Retorna [(posição do chunk, cosseno)] dos k chunks mais próximos.
+        """
+        if filter:
+            positions, vectors = self._filtered_rows(filter)
+        else:
+            positions, vectors = None, self.vectors
+        if not len(vectors) or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = vectors @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        found = top if positions is None else positions[top]
+        return [(int(position), float(score)) for position, score in zip(found, scores[top])]
+
+    def document(self, position):
+        return Document(
+            id=self.ids[position],
+            page_content=self.documents[position] or "",
+            metadata=self.metadatas[position] or {},
+        )
+
+class CompactIndex(FlatIndex):
+    """
+    Variante do FlatIndex sobre o índice compacto (compact_index.py), aberto
+    por memory-map: uma passada aproximada por todos os chunks (produto int8
+    x float32) seleciona os candidatos, reordenados pelo cosseno com os
+    vetores float16. Os vetores float16 fazem o papel de self.vectors.
+    """
+
+    DIRNAME = COMPACT_INDEX_DIRNAME
+    VERSION = COMPACT_INDEX_VERSION
+
+    def __init__(self, ids, documents, metadatas, codes, scales, rescore):
+        super().__init__(ids, documents, metadatas, rescore)
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def load(cls, index_dir):
+        return cls(
+            *cls._read_chunks(index_dir),
+            np.load(os.path.join(index_dir, "codes.npy"), mmap_mode="r"),
+            np.load(os.path.join(index_dir, "scales.npy")),
+            np.load(os.path.join(index_dir, "rescore.npy"), mmap_mode="r"),
+        )
+
+    def search_ids(self, query_vector, k, filter=None):
+        """
+        Retorna [(posição do chunk, cosseno)] dos k chunks mais próximos.
+        """
+        if not len(self.ids) or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = (self.codes @ query) * self.scales
+        if filter:
+            scores = np.where(self._mask(filter), scores, -np.inf)
+        valid = int(np.isfinite(scores).sum())
+        if not valid:
+            return []
+
+        # Candidatos pela pontuação aproximada, reordenados pelo cosseno
+        n_candidates = min(valid, max(k, k * RESCORE_FACTOR))
+        candidates = np.sort(np.argpartition(-scores, n_candidates - 1)[:n_candidates])
+        exact = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        order = np.argsort(-exact)[:k]
+        return [(int(position), float(score)) for position, score in zip(candidates[order], exact[order])]
+
+class FlatVectorStore:
+    """
+    Banco vetorial de consulta sobre um FlatIndex (ou CompactIndex), com o subconjunto da API
+    do Chroma do LangChain usado pela aplicação (buscas por texto ou vetor,
+    com filtro de metadados, e get por ids).
+    """
+
+    def __init__(self, index, embeddings):
+        self.index = index
+        self.embeddings = embeddings
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [self.index.document(position) for position, _ in self.index.search_ids(embedding, k, filter)]
+
+    def cosine_search_by_vector(self, embedding, k=4, filter=None):
+        """
+        Retorna [(Document, similaridade do cosseno)].
+        """
+        return [(self.index.document(position), score) for position, score in self.index.search_ids(embedding, k, filter)]
+
+    def get(self, ids=None, where=None, include=None, **kwargs):
+        """
+        Retorna os chunks pedidos (todos, sem ids) no formato do get do
+        Chroma: {"ids", "documents", "metadatas", "embeddings"}, com apenas
+        os campos de include preenchidos.
+        """
+        include = include or ["documents", "metadatas"]
+        if ids is None:
+            positions = list(range(len(self.index)))
+        else:
+            positions = [self.index.positions[chunk_id] for chunk_id in ids if chunk_id in self.index.positions]
+        if where:
+            mask = self.index._mask(where)
+            positions = [position for position in positions if mask[position]]
+        return {
+            "ids": [self.index.ids[position] for position in positions],
+            "documents": [self.index.documents[position] for position in positions] if "documents" in include else None,
+            "metadatas": [self.index.metadatas[position] for position in positions] if "metadatas" in include else None,
+            "embeddings": np.asarray(self.index.vectors[positions], dtype=np.float32) if "embeddings" in include else None,
+        }
+
+def load_flat_index(persist_directory, index_class=FlatIndex):
+    """
+    Carrega o índice de uma marca no formato de index_class (FlatIndex ou
+    CompactIndex), ou None se ele não foi gravado (execute ingest.py com
+    VECTOR_BACKEND=flat ou compact) ou é inválido.
+    """
+    index_dir = os.path.join(persist_directory, index_class.DIRNAME)
+    if not os.path.exists(os.path.join(index_dir, "index.json")):
+        return None
+    try:
+        return index_class.load(index_dir)
+    except Exception as e:
+        logger.warning(f"Índice {index_class.DIRNAME} inválido em {index_dir}: {e}")
+        return None
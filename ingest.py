@@ -1,12 +1,28 @@
 import os
+import re
 import glob
 import io
+import json
+import hashlib
+import argparse
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pypdf import PdfReader
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from models import EMBEDDING_MODEL_ID, EMBEDDING_MODEL_NAME, MANIFEST_FILENAME, VECTOR_BACKEND, get_embeddings
+from answer_cache import get_answer_cache
+from embedding_pipeline import CachedEmbeddings
+from product_matcher import ALIAS_INDEX_FILENAME, write_alias_index
+from product_index import PRODUCT_INDEX_FILENAME, write_product_index
+from lexical_index import LEXICAL_INDEX_DIRNAME, write_lexical_index_from_store
+from chunking import CHUNKING_STRATEGY, create_splitter
+from compact_index import COMPACT_INDEX_DIRNAME, write_compact_index_from_store
+from model_artifacts import preflight
+from flat_index import FLAT_INDEX_DIRNAME, write_flat_index_from_store
+from tech_data import tech_data_is_current, update_tech_data, write_tech_data_from_store
 import shutil
 
 # Configuração de logging
@@ -23,47 +39,377 @@ BRANDS = [
     "FT_SIKA"
 ]
 
-def pdf_to_documents(pdf_path):
+# Extração paralela: número de processos (0 = um por CPU) e, para PDFs
+# grandes, quantas páginas cada tarefa extrai
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "0"))
+INGEST_PAGES_PER_TASK = int(os.environ.get("INGEST_PAGES_PER_TASK", "8"))
+LARGE_PDF_BYTES = 2 * 1024 * 1024
+
+# Índice gravado para cada backend vetorial além do Chroma (VECTOR_BACKEND):
+# nome da pasta na marca e função que o gera a partir do banco Chroma
+BACKEND_INDEXES = {
+    "flat": (FLAT_INDEX_DIRNAME, write_flat_index_from_store),
+    "compact": (COMPACT_INDEX_DIRNAME, write_compact_index_from_store),
+}
+
+# Pastas de segmentos do Chroma (HNSW), excluídas do deploy com --export-deploy
+CHROMA_SEGMENT_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Versão do formato do manifesto de ingestão (MANIFEST_FILENAME)
+MANIFEST_VERSION = 1
+
+# Configuração do divisor de texto (mudanças aqui forçam reconstrução).
+# chunk_size/chunk_overlap valem para a estratégia "caracteres"; os limites
+# section_* para a divisão por seções (ver chunking.py)
+SPLITTER_SETTINGS = {
+    "strategy": CHUNKING_STRATEGY,
+    "chunk_size": 1000,
+    "chunk_overlap": 100,
+    "section_max_chars": 1500,
+    "section_min_chars": 600,
+    # Chunks por seção gravam a posição no arquivo (metadado "chunk")
+    "section_order": True,
+}
+
+def _extract_page_range(pdf_path, start=0, end=None):
     """
-    Converte um arquivo PDF em documentos do LangChain diretamente, sem usar PyPDFLoader
+    Extrai o texto das páginas [start, end) de um PDF. Executada nos
+    processos do pool de extração, por isso nunca propaga exceções:
+    erros são devolvidos no campo "error" do resultado.
     """
+    started = time.perf_counter()
     try:
-        # Lê o PDF com pypdf
-        logger.info(f"Processando arquivo PDF: {pdf_path}")
         reader = PdfReader(pdf_path)
+        total_pages = len(reader.pages)
+        end = total_pages if end is None else min(end, total_pages)
+        pages = [(i, reader.pages[i].extract_text()) for i in range(start, end)]
+        return {
+            "pages": pages,
+            "total_pages": total_pages,
+            "elapsed": time.perf_counter() - started,
+            "error": None,
+        }
+    except Exception as e:
+        return _failed_result(e, time.perf_counter() - started)
+
+def _failed_result(error, elapsed=0.0):
+    return {
+        "pages": [],
+        "total_pages": 0,
+        "elapsed": elapsed,
+        "error": f"{type(error).__name__}: {error}",
+    }
+
+def _build_documents(pdf_path, pages, total_pages):
+    """
+    Cria os documentos do LangChain a partir do texto extraído de cada página.
+    """
+    # Extrai o nome do produto do caminho do arquivo
+    product_name = os.path.basename(pdf_path).replace('.pdf', '')
+    
+    documents = []
+    for i, text in sorted(pages, key=lambda page: page[0]):
+        if text.strip():  # Ignora páginas vazias
+            documents.append(Document(
+                page_content=text,
+                metadata={
+                    "source": pdf_path,
+                    "page": i+1,
+                    "product": product_name,
+                    "total_pages": total_pages
+                }
+            ))
+    return documents
+
+def pdf_to_documents(pdf_path):
+    """
+    Converte um arquivo PDF em documentos do LangChain diretamente, sem usar PyPDFLoader
+    """
+    logger.info(f"Processando arquivo PDF: {pdf_path}")
+    result = _extract_page_range(pdf_path)
+    if result["error"]:
+        logger.error(f"Erro ao processar {pdf_path}: {result['error']}")
+        return []
+    
+    documents = _build_documents(pdf_path, result["pages"], result["total_pages"])
+    logger.info(f"Extraídas {len(documents)} páginas com texto de {pdf_path}")
+    return documents
+
+def _plan_extraction_tasks(pdf_files):
+    """
+    Divide a extração em tarefas (pdf, início, fim). PDFs grandes são
+    quebrados em intervalos de INGEST_PAGES_PER_TASK páginas para que um
+    único arquivo não ocupe um processo sozinho.
+    """
+    tasks = []
+    for pdf_file in pdf_files:
+        try:
+            if os.path.getsize(pdf_file) >= LARGE_PDF_BYTES:
+                total_pages = len(PdfReader(pdf_file).pages)
+                if total_pages > INGEST_PAGES_PER_TASK:
+                    for start in range(0, total_pages, INGEST_PAGES_PER_TASK):
+                        tasks.append((pdf_file, start, start + INGEST_PAGES_PER_TASK))
+                    continue
+        except Exception as e:
+            # O erro real será reportado pela tarefa de extração
+            logger.warning(f"Não foi possível contar as páginas de {pdf_file}: {e}")
+        tasks.append((pdf_file, 0, None))
+    return tasks
+
+def extract_documents(pdf_files, workers=None):
+    """
+    Extrai o texto de vários PDFs em paralelo usando um pool de processos.
+    
+    Retorna (documentos, relatório): documentos é um dict {pdf: [Document]}
+    na mesma ordem de pdf_files, com páginas ordenadas; relatório é um dict
+    {pdf: {"pages", "elapsed", "error"}}. Falhas em um arquivo não
+    interrompem o processamento dos demais; se o pool de processos quebrar,
+    as tarefas restantes são extraídas no próprio processo.
+    """
+    workers = workers or INGEST_WORKERS or os.cpu_count() or 1
+    tasks = _plan_extraction_tasks(pdf_files)
+    results = {pdf_file: [] for pdf_file in pdf_files}
+    started = time.perf_counter()
+    
+    pending = list(tasks)
+    if workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                futures = {executor.submit(_extract_page_range, *task): task for task in tasks}
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        # Falha fora de _extract_page_range (ex.: resultado
+                        # que não volta do processo): só o arquivo falha
+                        logger.error(f"Erro na extração de {task[0]}: {e}")
+                        result = _failed_result(e)
+                    results[task[0]].append(result)
+                    pending.remove(task)
+        except BrokenProcessPool as e:
+            # Um processo do pool morreu (ex.: falha no parser do PDF): as
+            # tarefas restantes são extraídas no próprio processo
+            logger.error(f"Pool de extração interrompido ({e}); {len(pending)} tarefas serão extraídas sem o pool")
+    
+    for task in pending:
+        results[task[0]].append(_extract_page_range(*task))
+    
+    documents = {}
+    report = {}
+    for pdf_file in pdf_files:
+        file_results = results[pdf_file]
+        errors = [r["error"] for r in file_results if r["error"]]
+        elapsed = sum(r["elapsed"] for r in file_results)
         
-        # Extrai o nome do produto do caminho do arquivo
-        product_name = os.path.basename(pdf_path).replace('.pdf', '')
+        if errors:
+            # Um intervalo com erro invalida o arquivo inteiro para manter a saída determinística
+            documents[pdf_file] = []
+            logger.error(f"Erro ao processar {pdf_file}: {errors[0]}")
+        else:
+            pages = [page for r in file_results for page in r["pages"]]
+            total_pages = max((r["total_pages"] for r in file_results), default=0)
+            documents[pdf_file] = _build_documents(pdf_file, pages, total_pages)
+            logger.info(f"Extraídas {len(documents[pdf_file])} páginas com texto de {pdf_file} em {elapsed:.2f}s")
+        
+        report[pdf_file] = {
+            "pages": len(documents[pdf_file]),
+            "elapsed": elapsed,
+            "error": errors[0] if errors else None,
+        }
+    
+    failures = sum(1 for r in report.values() if r["error"])
+    logger.info(
+        f"Extração de {len(pdf_files)} PDFs ({len(tasks)} tarefas, {workers} processos) "
+        f"concluída em {time.perf_counter() - started:.2f}s com {failures} falhas"
+    )
+    return documents, report
+
+def file_sha256(path):
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids_for(file_key, content_hash, count):
+    """
+    Gera IDs determinísticos para os chunks de um PDF a partir do nome
+    do arquivo e do hash do seu conteúdo.
+    """
+    prefix = hashlib.sha256(f"{file_key}\0{content_hash}".encode("utf-8")).hexdigest()[:20]
+    return [f"{prefix}-{i:04d}" for i in range(count)]
+
+def new_manifest():
+    """
+    Cria um manifesto de ingestão vazio para a configuração atual.
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        # Identificador dos vetores (o modelo ONNX em int8 tem outro), para
+        # que a troca do modelo reconstrua o banco em vez de misturar vetores
+        "embedding_model": EMBEDDING_MODEL_ID,
+        "splitter": dict(SPLITTER_SETTINGS),
+        "files": {},
+    }
+
+def load_manifest(output_dir):
+    """
+    Carrega o manifesto de ingestão de um banco vetorial. Retorna None se o
+    manifesto não existir, estiver corrompido ou tiver sido gerado com outro
+    modelo de embeddings ou outra configuração de chunks.
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning(f"Manifesto inválido em {manifest_path}: {e}")
+        return None
+    
+    expected = new_manifest()
+    for key in ("version", "embedding_model", "splitter"):
+        if manifest.get(key) != expected[key]:
+            logger.info(f"Manifesto de {output_dir} incompatível ({key} mudou)")
+            return None
+    return manifest
+
+def save_manifest(output_dir, manifest):
+    """
+    Grava o manifesto de ingestão de forma atômica.
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def plan_changes(pdf_files, manifest):
+    """
+    Compara os PDFs da pasta com o manifesto e retorna
+    (alterados, inalterados, removidos). Arquivos com mesmo mtime e tamanho
+    não são relidos; os demais são identificados pelo hash do conteúdo.
+    """
+    changed = []
+    unchanged = []
+    current_keys = set()
+    
+    for pdf_file in pdf_files:
+        file_key = os.path.basename(pdf_file)
+        current_keys.add(file_key)
+        stat = os.stat(pdf_file)
+        entry = manifest["files"].get(file_key)
         
-        # Lista para armazenar os documentos
-        documents = []
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            unchanged.append(file_key)
+            continue
         
-        # Itera sobre as páginas do PDF
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            if text.strip():  # Ignora páginas vazias
-                # Cria um documento LangChain
-                doc = Document(
-                    page_content=text,
-                    metadata={
-                        "source": pdf_path,
-                        "page": i+1,
-                        "product": product_name,
-                        "total_pages": len(reader.pages)
-                    }
-                )
-                documents.append(doc)
+        content_hash = file_sha256(pdf_file)
+        if entry and entry["sha256"] == content_hash:
+            # Apenas o mtime mudou (ex.: arquivo copiado); o conteúdo é o mesmo
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            unchanged.append(file_key)
+            continue
         
-        logger.info(f"Extraídas {len(documents)} páginas com texto de {pdf_path}")
-        return documents
-    except Exception as e:
-        logger.error(f"Erro ao processar {pdf_path}: {e}")
-        return []
+        changed.append((pdf_file, file_key, content_hash, stat))
+    
+    removed = sorted(set(manifest["files"]) - current_keys)
+    return changed, unchanged, removed
+
+def write_brand_indexes(output_dir, manifest, only_missing=False, vectordb=None):
+    """
+    Gera os índices auxiliares gravados junto ao banco vetorial da marca a
+    partir do manifesto e, para o índice lexical, dos chunks do banco. Com
+    only_missing=True, apenas índices ausentes são gerados (evita alterar
+    arquivos de bancos que não mudaram). A tabela de dados técnicos é
+    atualizada por process_documents a partir das páginas dos PDFs; aqui ela
+    só é gerada, a partir dos chunks, se ainda não existir.
+    """
+    products = [entry["product"] for entry in manifest["files"].values()]
+    
+    if not (only_missing and os.path.exists(os.path.join(output_dir, ALIAS_INDEX_FILENAME))):
+        write_alias_index(output_dir, products)
+    
+    if not (only_missing and os.path.exists(os.path.join(output_dir, PRODUCT_INDEX_FILENAME))):
+        write_product_index(output_dir, manifest["files"])
+    
+    if not (only_missing and os.path.exists(os.path.join(output_dir, LEXICAL_INDEX_DIRNAME))):
+        if vectordb is None:
+            vectordb = Chroma(persist_directory=output_dir)
+        write_lexical_index_from_store(output_dir, vectordb)
+    
+    if not tech_data_is_current(output_dir):
+        if vectordb is None:
+            vectordb = Chroma(persist_directory=output_dir)
+        write_tech_data_from_store(output_dir, vectordb)
+    
+    backend_index = BACKEND_INDEXES.get(VECTOR_BACKEND)
+    if backend_index is not None:
+        dirname, write_index = backend_index
+        if not (only_missing and os.path.exists(os.path.join(output_dir, dirname))):
+            if vectordb is None:
+                vectordb = Chroma(persist_directory=output_dir)
+            write_index(output_dir, vectordb)
+
+def is_chroma_file(path):
+    """
+    Arquivos do Chroma na pasta da marca: o chroma.sqlite3 e as pastas de
+    segmentos (nomeadas por UUID).
+    """
+    name = os.path.basename(path)
+    return name.startswith("chroma.sqlite3") or (os.path.isdir(path) and CHROMA_SEGMENT_PATTERN.match(name) is not None)
+
+def export_deploy(deploy_root, brands=None):
+    """
+    Copia os bancos das marcas para deploy_root/vectordb sem os arquivos do
+    Chroma nem os índices de outros backends: apenas o índice de
+    VECTOR_BACKEND (flat ou compact), o manifesto e os índices auxiliares,
+    que é tudo o que as consultas leem. A pasta vectordb original continua
+    completa para as próximas ingestões.
+    """
+    backend_index = BACKEND_INDEXES.get(VECTOR_BACKEND)
+    if backend_index is None:
+        logger.error(f"--export-deploy requer VECTOR_BACKEND=flat ou compact (atual: {VECTOR_BACKEND})")
+        return False
+    dirname, write_index = backend_index
+    other_indexes = {name for name, _ in BACKEND_INDEXES.values()} - {dirname}
+
+    for brand_folder in brands or BRANDS:
+        source_dir = os.path.join("vectordb", brand_folder)
+        if not os.path.isdir(source_dir):
+            logger.warning(f"Banco vetorial de {brand_folder} não encontrado; marca ignorada no deploy")
+            continue
+        if not os.path.exists(os.path.join(source_dir, dirname)):
+            write_index(source_dir, Chroma(persist_directory=source_dir))
+
+        target_dir = os.path.join(deploy_root, "vectordb", brand_folder)
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.makedirs(target_dir)
+        for name in os.listdir(source_dir):
+            path = os.path.join(source_dir, name)
+            if name in other_indexes or name.endswith(".tmp") or is_chroma_file(path):
+                continue
+            if os.path.isdir(path):
+                shutil.copytree(path, os.path.join(target_dir, name))
+            else:
+                shutil.copy2(path, os.path.join(target_dir, name))
+        logger.info(f"Deploy de {brand_folder} ({VECTOR_BACKEND}) exportado para {target_dir}")
+    return True
 
-def process_documents(brand_folder):
+def process_documents(brand_folder, force=False):
     """
-    Processa todos os documentos PDF em uma pasta de marca específica
-    e cria um banco de dados vetorial para essa marca.
+    Processa os documentos PDF em uma pasta de marca específica e atualiza
+    o banco de dados vetorial dessa marca de forma incremental: apenas PDFs
+    adicionados, alterados ou removidos desde a última execução são
+    reprocessados. Retorna a quantidade de chunks gravados.
     """
     brand_name = os.path.basename(brand_folder)
     logger.info(f"Processando documentos da marca: {brand_name}")
@@ -79,83 +425,136 @@ def process_documents(brand_folder):
             logger.error(f"Erro ao criar diretório {brand_folder}: {e}")
         return 0
     
-    # Cria o diretório de saída para o banco de dados vetorial
     output_dir = os.path.join("vectordb", brand_name)
-    if os.path.exists(output_dir):
-        logger.info(f"Removendo diretório existente: {output_dir}")
-        shutil.rmtree(output_dir)
+    
+    # Carrega o manifesto da última ingestão. Sem manifesto compatível, o
+    # banco existente não pode ser atualizado e é reconstruído do zero.
+    manifest = None if force else load_manifest(output_dir)
+    if manifest is None:
+        if os.path.exists(output_dir):
+            logger.info(f"Removendo diretório existente para reconstrução completa: {output_dir}")
+            shutil.rmtree(output_dir)
+        manifest = new_manifest()
     
     # Carrega todos os PDFs na pasta
-    pdf_files = glob.glob(os.path.join(brand_folder, "*.pdf"))
-    if not pdf_files:
+    pdf_files = sorted(glob.glob(os.path.join(brand_folder, "*.pdf")))
+    if not pdf_files and not manifest["files"]:
         logger.warning(f"Nenhum documento PDF encontrado em {brand_folder}")
         return 0
     
-    logger.info(f"Encontrados {len(pdf_files)} documentos para processar")
-    documents = []
+    changed, unchanged, removed = plan_changes(pdf_files, manifest)
+    logger.info(
+        f"{brand_name}: {len(changed)} PDFs novos/alterados, "
+        f"{len(unchanged)} inalterados, {len(removed)} removidos"
+    )
     
-    for pdf_file in pdf_files:
-        try:
-            # Usa nossa função personalizada em vez de PyPDFLoader
-            docs = pdf_to_documents(pdf_file)
-            
-            # Adiciona metadados sobre a marca
-            for doc in docs:
-                doc.metadata["brand"] = brand_name
-                
-            documents.extend(docs)
-            logger.info(f"Processado: {pdf_file} - {len(docs)} páginas")
-        except Exception as e:
-            logger.error(f"Erro ao processar {pdf_file}: {e}")
+    if not changed and not removed:
+        # Persiste eventuais atualizações de mtime feitas por plan_changes
+        if os.path.exists(output_dir):
+            save_manifest(output_dir, manifest)
+            write_brand_indexes(output_dir, manifest, only_missing=True)
+        logger.info(f"Banco vetorial de {brand_name} já está atualizado")
+        return 0
     
-    if not documents:
-        logger.warning(f"Nenhum documento foi carregado com sucesso para {brand_name}")
+    # Extrai o texto dos PDFs novos/alterados em paralelo. Arquivos que
+    # falharem mantêm os chunks e a entrada de manifesto anteriores.
+    extracted, report = extract_documents([pdf_file for pdf_file, _, _, _ in changed])
+    failed = {pdf_file for pdf_file, info in report.items() if info["error"]}
+    changed = [item for item in changed if item[0] not in failed]
+    if failed:
+        logger.warning(f"{len(failed)} PDFs de {brand_name} falharam e serão tentados na próxima execução")
+    if not changed and not removed:
         return 0
     
-    # Divide os documentos em chunks menores
-    logger.info("Dividindo documentos em chunks menores...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100
-    )
+    text_splitter = create_splitter(SPLITTER_SETTINGS)
     
     try:
-        splits = text_splitter.split_documents(documents)
-        logger.info(f"Criados {len(splits)} chunks de texto")
+        # Certifica-se de que o diretório de saída exista
+        os.makedirs(output_dir, exist_ok=True)
         
-        # Carrega os embeddings e cria o banco de dados vetorial
-        logger.info("Carregando modelo de embeddings...")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        logger.info("Modelo de embeddings carregado com sucesso")
+        # Abre (ou cria) o banco vetorial existente com o modelo compartilhado
+        logger.info(f"Abrindo banco de dados vetorial em {output_dir}...")
+        embeddings = CachedEmbeddings(get_embeddings().client, EMBEDDING_MODEL_ID)
+        vectordb = Chroma(
+            persist_directory=output_dir,
+            embedding_function=embeddings
+        )
         
-        try:
-            # Certifica-se de que o diretório de saída exista
-            os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+        # Remove os chunks de PDFs apagados ou alterados
+        stale_ids = []
+        for file_key in removed:
+            stale_ids.extend(manifest["files"].pop(file_key)["chunk_ids"])
+        for _, file_key, _, _ in changed:
+            if file_key in manifest["files"]:
+                stale_ids.extend(manifest["files"][file_key]["chunk_ids"])
+        if stale_ids:
+            logger.info(f"Removendo {len(stale_ids)} chunks desatualizados")
+            vectordb.delete(ids=stale_ids)
+        
+        total_chunks = 0
+        for pdf_file, file_key, content_hash, stat in changed:
+            docs = extracted[pdf_file]
             
-            # Cria o banco de dados vetorial e o persiste
-            logger.info(f"Criando banco de dados vetorial em {output_dir}...")
-            vectordb = Chroma.from_documents(
-                documents=splits,
-                embedding=embeddings,
-                persist_directory=output_dir
-            )
+            # Adiciona metadados sobre a marca
+            for doc in docs:
+                doc.metadata["brand"] = brand_name
             
+            splits = text_splitter.split_documents(docs)
+            ids = chunk_ids_for(file_key, content_hash, len(splits))
+            if splits:
+                vectordb.add_documents(splits, ids=ids)
+            
+            manifest["files"][file_key] = {
+                "sha256": content_hash,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "product": os.path.splitext(file_key)[0],
+                "chunk_ids": ids,
+            }
+            total_chunks += len(splits)
+            logger.info(
+                f"Processado: {pdf_file} - {len(docs)} páginas, {len(splits)} chunks "
+                f"(extração em {report[pdf_file]['elapsed']:.2f}s)"
+            )
+        
+        # Dados técnicos (consumo, validade, ...) extraídos das páginas dos
+        # PDFs alterados. Bancos sem a tabela (ou com a de uma versão anterior
+        # da extração) a recebem completa, a partir dos chunks, em
+        # write_brand_indexes.
+        tech_documents = {file_key: extracted[pdf_file] for pdf_file, file_key, _, _ in changed}
+        if tech_data_is_current(output_dir) or set(tech_documents) == set(manifest["files"]):
+            update_tech_data(output_dir, tech_documents, removed)
+        
+        if hasattr(vectordb, "persist"):
             vectordb.persist()
-            logger.info(f"Banco de dados vetorial criado com sucesso para {brand_name} em {output_dir}")
-            return len(splits)
-        except Exception as e:
-            logger.error(f"Erro ao criar banco de dados vetorial para {brand_name}: {e}")
-            return 0
+        save_manifest(output_dir, manifest)
+        write_brand_indexes(output_dir, manifest, vectordb=vectordb)
+        
+        # Respostas em cache para esta marca podem estar desatualizadas
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            answer_cache.invalidate_brand(brand_name)
+        logger.info(f"Banco de dados vetorial atualizado para {brand_name} em {output_dir}: {total_chunks} chunks gravados")
+        logger.info(f"Cache de embeddings: {embeddings.hits} acertos, {embeddings.misses} textos calculados")
+        return total_chunks
     except Exception as e:
-        logger.error(f"Erro ao dividir documentos para {brand_name}: {e}")
+        logger.error(f"Erro ao atualizar banco de dados vetorial para {brand_name}: {e}")
         return 0
 
-def main():
+def main(brands=None, force=False):
     """
-    Função principal que processa todas as marcas
+    Função principal que processa todas as marcas (ou apenas as informadas).
+    Com force=True, os bancos vetoriais são reconstruídos do zero.
     """
+    brands = brands or BRANDS
     logger.info("Iniciando processamento de documentos...")
     
+    # Confere o modelo de embeddings antes de processar as marcas
+    model_ready, model_error = preflight(EMBEDDING_MODEL_NAME)
+    if not model_ready:
+        logger.error(f"Modelo de embeddings indisponível: {model_error}")
+        return
+    
     # Cria a pasta vectordb se não existir
     try:
         os.makedirs("vectordb", exist_ok=True)
@@ -165,7 +564,7 @@ def main():
         return
     
     # Verifica se todas as pastas de marca existem, criando-as se necessário
-    for brand in BRANDS:
+    for brand in brands:
         if not os.path.exists(brand):
             try:
                 logger.info(f"Criando diretório para a marca {brand}")
@@ -175,9 +574,9 @@ def main():
     
     total_chunks = 0
     
-    for brand in BRANDS:
+    for brand in brands:
         try:
-            chunks = process_documents(brand)
+            chunks = process_documents(brand, force=force)
             if chunks:
                 total_chunks += chunks
         except Exception as e:
@@ -190,4 +589,14 @@ def main():
         logger.info(f"Conteúdo do diretório vectordb após processamento: {os.listdir('vectordb')}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Processa as fichas técnicas e atualiza os bancos vetoriais")
+    parser.add_argument("brands", nargs="*", help="Pastas de marca a processar (padrão: todas)")
+    parser.add_argument("--full", action="store_true", help="Reconstrói os bancos vetoriais do zero")
+    parser.add_argument(
+        "--export-deploy", metavar="PASTA",
+        help="Após a ingestão, copia para PASTA/vectordb apenas o índice de VECTOR_BACKEND (flat ou compact) e os índices auxiliares, sem os arquivos do Chroma"
+    )
+    args = parser.parse_args()
+    main(brands=args.brands or None, force=args.full)
+    if args.export_deploy:
+        export_deploy(args.export_deploy, args.brands or None) 
\ No newline at end of file
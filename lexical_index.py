@@ -0,0 +1,218 @@
+import os
+import json
+import math
+import shutil
+import logging
+import threading
+from collections import Counter
+
+import numpy as np
+
+from product_matcher import normalize_text
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Índice invertido (BM25) gravado junto a cada banco vetorial
+LEXICAL_INDEX_DIRNAME = "lexical_index"
+LEXICAL_INDEX_VERSION = 1
+
+# Parâmetros do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text):
+    """
+    Quebra o texto em termos normalizados (minúsculas, sem acentos). Códigos
+    como "Sikadur 32", "NBR 9575" ou "kg/m²" viram termos separados
+    ("sikadur", "32", "nbr", "9575", "kg", "m2").
+    """
+    return normalize_text(text).split()
+
+def build_postings(texts):
+    """
+    Monta as listas de ocorrências dos textos: vocabulário ordenado,
+    offsets de cada termo e, para cada ocorrência, o índice do chunk e a
+    frequência do termo, além do tamanho (em termos) de cada chunk.
+    """
+    postings = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    for doc_idx, text in enumerate(texts):
+        counts = Counter(tokenize(text or ""))
+        doc_lengths[doc_idx] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_idx, tf))
+
+    vocabulary = sorted(postings)
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in vocabulary])
+    posting_docs = np.fromiter(
+        (doc_idx for term in vocabulary for doc_idx, _ in postings[term]), dtype=np.int32, count=int(offsets[-1])
+    )
+    posting_tfs = np.fromiter(
+        (tf for term in vocabulary for _, tf in postings[term]), dtype=np.float32, count=int(offsets[-1])
+    )
+    return vocabulary, offsets, posting_docs, posting_tfs, doc_lengths
+
+def write_lexical_index(output_dir, ids, texts, products):
+    """
+    Gera o índice invertido dos chunks de uma marca e grava em
+    output_dir/lexical_index: vocabulário e metadados em JSON e as listas
+    de ocorrências em arrays NumPy (.npy), abertos por memory-map na consulta.
+    """
+    vocabulary, offsets, posting_docs, posting_tfs, doc_lengths = build_postings(texts)
+
+    # Grava em um diretório temporário e troca de uma vez
+    index_dir = os.path.join(output_dir, LEXICAL_INDEX_DIRNAME)
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "posting_docs.npy"), posting_docs)
+    np.save(os.path.join(tmp_dir, "posting_tfs.npy"), posting_tfs)
+    np.save(os.path.join(tmp_dir, "doc_lengths.npy"), doc_lengths)
+    with open(os.path.join(tmp_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": LEXICAL_INDEX_VERSION,
+            "vocabulary": vocabulary,
+            "ids": list(ids),
+            "products": list(products),
+        }, f, ensure_ascii=False)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    logger.info(f"Índice lexical gravado em {index_dir}: {len(texts)} chunks, {len(vocabulary)} termos")
+
+def write_lexical_index_from_store(output_dir, vectordb):
+    """
+    Gera o índice lexical a partir de todos os chunks do banco vetorial.
+    """
+    data = vectordb.get(include=["documents", "metadatas"])
+    products = [(metadata or {}).get("product", "") for metadata in data["metadatas"]]
+    write_lexical_index(output_dir, data["ids"], data["documents"], products)
+
+class LexicalIndex:
+    """
+    Índice invertido BM25 dos chunks de uma marca. As listas de ocorrências
+    são abertas por memory-map, de modo que o carregamento é imediato e a
+    consulta lê apenas as listas dos termos da pergunta.
+    """
+
+    def __init__(self, vocabulary, ids, products, offsets, posting_docs, posting_tfs, doc_lengths):
+        self.term_ids = {term: idx for idx, term in enumerate(vocabulary)}
+        self.ids = ids
+        self.products = np.asarray(products, dtype=object)
+        self.offsets = offsets
+        self.posting_docs = posting_docs
+        self.posting_tfs = posting_tfs
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        self._product_masks = {}
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, "index.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != LEXICAL_INDEX_VERSION:
+            raise ValueError(f"versão {data.get('version')} não suportada")
+        return cls(
+            data["vocabulary"],
+            data["ids"],
+            data["products"],
+            np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r"),
+            np.load(os.path.join(index_dir, "posting_docs.npy"), mmap_mode="r"),
+            np.load(os.path.join(index_dir, "posting_tfs.npy"), mmap_mode="r"),
+            np.load(os.path.join(index_dir, "doc_lengths.npy")),
+        )
+
+    @classmethod
+    def from_store(cls, vectordb):
+        """
+        Monta o índice em memória a partir do banco vetorial (bancos gerados
+        antes do índice lexical).
+        """
+        data = vectordb.get(include=["documents", "metadatas"])
+        vocabulary, offsets, posting_docs, posting_tfs, doc_lengths = build_postings(data["documents"])
+        products = [(metadata or {}).get("product", "") for metadata in data["metadatas"]]
+        return cls(vocabulary, data["ids"], products, offsets, posting_docs, posting_tfs, doc_lengths)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _product_mask(self, product):
+        mask = self._product_masks.get(product)
+        if mask is None:
+            mask = self.products == product
+            self._product_masks[product] = mask
+        return mask
+
+    def search(self, query, k, product=None):
+        """
+        Retorna os k chunks com maior pontuação BM25 para a pergunta, como
+        lista de (ID do chunk, pontuação). Com product, apenas chunks do
+        produto são considerados.
+        """
+        n_docs = len(self.ids)
+        if not n_docs:
+            return []
+        scores = np.zeros(n_docs, dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            term_idx = self.term_ids.get(term)
+            if term_idx is None:
+                continue
+            start, end = int(self.offsets[term_idx]), int(self.offsets[term_idx + 1])
+            docs = np.asarray(self.posting_docs[start:end])
+            tfs = np.asarray(self.posting_tfs[start:end])
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / max(self.avg_length, 1e-6))
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+            matched = True
+        if not matched:
+            return []
+        if product is not None:
+            scores[~self._product_mask(product)] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+# Índices já carregados, por pasta do banco vetorial: {caminho: (mtime, id do banco, índice)}
+_index_cache = {}
+_index_lock = threading.Lock()
+
+def load_lexical_index(persist_directory, vectorstore):
+    """
+    Carrega (com cache) o índice lexical de uma marca. Sem índice gravado
+    (bancos anteriores a ele), o índice é montado em memória a partir do
+    banco vetorial; execute ingest.py para gravá-lo.
+    """
+    index_dir = os.path.join(persist_directory, LEXICAL_INDEX_DIRNAME)
+    meta_path = os.path.join(index_dir, "index.json")
+    mtime = os.path.getmtime(meta_path) if os.path.exists(meta_path) else None
+
+    with _index_lock:
+        cached = _index_cache.get(persist_directory)
+        if cached and cached[0] == mtime and cached[1] == id(vectorstore):
+            return cached[2]
+
+        index = None
+        if mtime is not None:
+            try:
+                index = LexicalIndex.load(index_dir)
+            except Exception as e:
+                logger.warning(f"Índice lexical inválido em {index_dir}: {e}")
+
+        if index is None:
+            try:
+                index = LexicalIndex.from_store(vectorstore)
+                logger.info(f"Índice lexical de {persist_directory} montado em memória; execute ingest.py para gravá-lo")
+            except Exception as e:
+                logger.warning(f"Não foi possível montar o índice lexical de {persist_directory}: {e}")
+                index = None
+
+        _index_cache[persist_directory] = (mtime, id(vectorstore), index)
+        return index
@@ -0,0 +1,255 @@
+"""
+Gerenciador dos modelos usados pela aplicação: baixa o modelo de embeddings
+(opcionalmente também exportado para ONNX) e o cross-encoder do
+reranqueamento para uma pasta local, com o checksum de cada arquivo, e
+resolve o caminho de onde cada um é carregado, sem acesso ao Hugging Face
+Hub.
+
+Uso:
+    python model_artifacts.py            # baixa os modelos para model_artifacts/
+    python model_artifacts.py --onnx     # inclui a exportação para ONNX
+    python model_artifacts.py --int8     # inclui o ONNX e a versão quantizada em int8
+    python model_artifacts.py --verify   # confere os checksums
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import logging
+import threading
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Pasta com os modelos baixados (uma subpasta por modelo)
+MODEL_ARTIFACTS_DIR = os.environ.get("MODEL_ARTIFACTS_DIR", "model_artifacts")
+ARTIFACT_MANIFEST_FILENAME = "artifact.json"
+ARTIFACT_MANIFEST_VERSION = 1
+
+# Origem dos modelos (embeddings e cross-encoder):
+# - "1" (padrão): apenas as pastas locais (a aplicação e a ingestão não
+#   iniciam sem elas) e o acesso ao Hub desativado no processo, para que
+#   uma implantação sem a pasta falhe na inicialização em vez de baixar o
+#   modelo antes da primeira resposta
+# - "auto": a pasta local, se existir; senão, o Hub, pelo nome do modelo
+#   (para desenvolvimento)
+# - "0": sempre o Hub, pelo nome do modelo
+EMBEDDING_MODEL_OFFLINE = os.environ.get("EMBEDDING_MODEL_OFFLINE", "1").lower()
+
+# Conferência da pasta local antes de carregar o modelo: "tamanho" compara
+# o tamanho dos arquivos com o manifesto; "checksum" recalcula o SHA-256
+MODEL_VERIFY = os.environ.get("MODEL_VERIFY", "tamanho").lower()
+
+# Pastas já conferidas no processo: {pasta: mtime do manifesto}; modelos
+# obtidos do Hub por falta da pasta local (o aviso é registrado uma vez)
+_verified = {}
+_hub_fallbacks = set()
+_verified_lock = threading.Lock()
+
+def model_artifact_dir(model_name):
+    """
+    Pasta local do modelo ("sentence-transformers/all-MiniLM-L6-v2" ->
+    model_artifacts/all-MiniLM-L6-v2).
+    """
+    return os.path.join(MODEL_ARTIFACTS_DIR, model_name.rstrip("/").split("/")[-1])
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _artifact_files(model_dir):
+    files = []
+    for root, _, names in os.walk(model_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, model_dir).replace(os.sep, "/")
+            if relative != ARTIFACT_MANIFEST_FILENAME:
+                files.append(relative)
+    return sorted(files)
+
+def write_artifact_manifest(model_dir, model_name, onnx=False, kind="sentence-transformer"):
+    """
+    Grava o manifesto da pasta do modelo: tamanho e SHA-256 de cada arquivo
+    e um checksum do conjunto.
+    """
+    files = {}
+    for relative in _artifact_files(model_dir):
+        path = os.path.join(model_dir, relative)
+        files[relative] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    checksum = hashlib.sha256(
+        "\n".join(f"{relative}:{entry['sha256']}" for relative, entry in files.items()).encode("utf-8")
+    ).hexdigest()
+    manifest = {
+        "version": ARTIFACT_MANIFEST_VERSION,
+        "model_name": model_name,
+        "kind": kind,
+        "onnx": onnx,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "checksum": checksum,
+        "files": files,
+    }
+    with open(os.path.join(model_dir, ARTIFACT_MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def vendor_model(model_name, model_dir=None, onnx=False, int8=False, cross_encoder=False):
+    """
+    Baixa o modelo do Hub e o grava, no formato do sentence-transformers,
+    em model_dir (padrão: model_artifact_dir). cross_encoder=True indica o
+    cross-encoder do reranqueamento. Com onnx=True, grava também a
+    exportação para ONNX em model_dir/onnx (requer optimum[onnxruntime]) e,
+    com int8=True, a versão quantizada em int8 (requer onnx).
+    """
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    model_dir = model_dir or model_artifact_dir(model_name)
+    tmp_dir = model_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    logger.info(f"Baixando {model_name}...")
+    if cross_encoder:
+        CrossEncoder(model_name, device="cpu").save(tmp_dir)
+    else:
+        SentenceTransformer(model_name, device="cpu").save(tmp_dir)
+    if onnx and not cross_encoder:
+        logger.info(f"Exportando {model_name} para ONNX...")
+        onnx_dir = tmp_dir + ".onnx"
+        shutil.rmtree(onnx_dir, ignore_errors=True)
+        try:
+            SentenceTransformer(model_name, device="cpu", backend="onnx").save(onnx_dir)
+            shutil.copytree(os.path.join(onnx_dir, "onnx"), os.path.join(tmp_dir, "onnx"))
+        finally:
+            shutil.rmtree(onnx_dir, ignore_errors=True)
+        if int8:
+            from onnx_embeddings import quantize_onnx_model
+            quantize_onnx_model(tmp_dir)
+
+    manifest = write_artifact_manifest(
+        tmp_dir, model_name, onnx=onnx and not cross_encoder,
+        kind="cross-encoder" if cross_encoder else "sentence-transformer",
+    )
+    shutil.rmtree(model_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(model_dir) or ".", exist_ok=True)
+    os.replace(tmp_dir, model_dir)
+    logger.info(f"Modelo gravado em {model_dir}: {len(manifest['files'])} arquivos, checksum {manifest['checksum'][:16]}")
+    return manifest
+
+def verify_model_artifact(model_dir, checksum=False):
+    """
+    Confere a pasta do modelo com o seu manifesto: todos os arquivos devem
+    existir com o tamanho gravado (e, com checksum=True, o mesmo SHA-256).
+    Retorna o manifesto ou lança ValueError com os arquivos divergentes.
+    """
+    manifest_path = os.path.join(model_dir, ARTIFACT_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        raise ValueError(f"Modelo não encontrado em {model_dir}. Execute: python model_artifacts.py")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != ARTIFACT_MANIFEST_VERSION:
+        raise ValueError(f"Manifesto do modelo em {model_dir} com versão {manifest.get('version')} não suportada")
+
+    problems = []
+    for relative, entry in manifest["files"].items():
+        path = os.path.join(model_dir, relative)
+        if not os.path.exists(path):
+            problems.append(f"{relative} ausente")
+        elif os.path.getsize(path) != entry["size"]:
+            problems.append(f"{relative} com tamanho diferente")
+        elif checksum and file_sha256(path) != entry["sha256"]:
+            problems.append(f"{relative} com checksum diferente")
+    if problems:
+        raise ValueError(
+            f"Modelo em {model_dir} incompleto ou alterado ({'; '.join(problems[:5])}). "
+            "Execute: python model_artifacts.py"
+        )
+    return manifest
+
+def _verify_once(model_dir):
+    manifest_path = os.path.join(model_dir, ARTIFACT_MANIFEST_FILENAME)
+    mtime = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+    with _verified_lock:
+        if mtime is not None and _verified.get(model_dir) == mtime:
+            return
+    verify_model_artifact(model_dir, checksum=MODEL_VERIFY == "checksum")
+    with _verified_lock:
+        _verified[model_dir] = mtime
+
+def resolve_model_path(model_name):
+    """
+    Retorna de onde carregar o modelo, segundo EMBEDDING_MODEL_OFFLINE: a
+    pasta local, conferida, ou o nome do modelo. Lança ValueError se a
+    pasta local é exigida (modo padrão "1") e está ausente, ou se existe
+    mas está incompleta. Apenas no modo "auto" um modelo sem pasta local
+    ainda pode ser obtido do Hub.
+    """
+    model_dir = model_artifact_dir(model_name)
+    if EMBEDDING_MODEL_OFFLINE in ("0", "false", "nao", "não", "no"):
+        return model_name
+    if EMBEDDING_MODEL_OFFLINE == "auto" and not os.path.exists(model_dir):
+        with _verified_lock:
+            if model_dir not in _hub_fallbacks:
+                _hub_fallbacks.add(model_dir)
+                logger.warning(f"Modelo {model_name} não encontrado em {model_dir}; será obtido do Hugging Face Hub")
+        return model_name
+
+    _verify_once(model_dir)
+    if EMBEDDING_MODEL_OFFLINE != "auto":
+        # Lidos pelo huggingface_hub e pelo transformers ao serem importados
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    return model_dir
+
+def managed_models():
+    """
+    Modelos usados pela aplicação: o de embeddings e, com o reranqueamento
+    ativo, o cross-encoder. Retorna [(nome, é cross-encoder)].
+    """
+    from models import EMBEDDING_MODEL_NAME
+    from reranker import RERANK_ENABLED, RERANK_MODEL
+
+    models = [(EMBEDDING_MODEL_NAME, False)]
+    if RERANK_ENABLED:
+        models.append((RERANK_MODEL, True))
+    return models
+
+def preflight(*model_names):
+    """
+    Confere, antes da inicialização, se os modelos podem ser carregados
+    sem o Hub quando isso é exigido (o padrão). Retorna (True, None) ou
+    (False, erro).
+    """
+    try:
+        for model_name in model_names:
+            resolve_model_path(model_name)
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa e confere os modelos locais")
+    parser.add_argument("--model", help="Apenas este modelo de embeddings (nome no Hugging Face Hub)")
+    parser.add_argument("--onnx", action="store_true", help="Inclui a exportação do modelo de embeddings para ONNX")
+    parser.add_argument("--int8", action="store_true", help="Inclui o modelo ONNX quantizado em int8 (implica --onnx)")
+    parser.add_argument("--verify", action="store_true", help="Apenas confere os checksums das pastas locais")
+    args = parser.parse_args()
+
+    models = [(args.model, False)] if args.model else managed_models()
+    for model_name, cross_encoder in models:
+        model_dir = model_artifact_dir(model_name)
+        if args.verify:
+            manifest = verify_model_artifact(model_dir, checksum=True)
+            print(f"{model_dir}: {len(manifest['files'])} arquivos conferidos, checksum {manifest['checksum']}")
+            continue
+        manifest = vendor_model(
+            model_name, model_dir, onnx=args.onnx or args.int8, int8=args.int8, cross_encoder=cross_encoder
+        )
+        print(f"{model_dir}: checksum {manifest['checksum']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,26 @@
 import os
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
-from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain.prompts.chat import (
-    ChatPromptTemplate,
-    HumanMessagePromptTemplate,
-    SystemMessagePromptTemplate,
-)
-from typing import Any, List, Dict, Optional
-from pydantic import Field
-from langchain.schema.retriever import BaseRetriever
-from langchain_core.retrievers import BaseRetriever as CoreBaseRetriever
-from langchain_core.documents import Document
+from langchain_core.callbacks import BaseCallbackHandler
+from embedding_pipeline import EMBEDDING_BACKEND, EMBEDDING_ONNX_INT8, MemoizedEmbeddings, resolve_device
+from model_artifacts import resolve_model_path
+from retrieval import ProductAwareRetriever, identify_product
+from answer_cache import get_answer_cache
+from product_matcher import load_product_matcher
+from product_index import load_product_index
+from lexical_index import load_lexical_index
+from reranker import get_reranker
+from tech_data import TECH_DATA_ENABLED, load_tech_data
+from flat_index import CompactIndex, FlatVectorStore, load_flat_index
+from conversation_memory import create_memory, estimate_tokens
+from question_condenser import CONDENSE_MODEL
 import logging
 import sys
+import hashlib
 import importlib.util
+import threading
 import traceback
+import weakref
+from collections import OrderedDict
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -29,6 +29,52 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente
 load_dotenv()
 
+# Modelo de embeddings usado na ingestão e nas consultas
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Identificador dos vetores gerados, usado como chave do cache de embeddings
+# da ingestão: o modelo ONNX quantizado em int8 gera vetores ligeiramente
+# diferentes e não compartilha o cache com o modelo original
+EMBEDDING_MODEL_ID = EMBEDDING_MODEL_NAME + ("#onnx-int8" if EMBEDDING_BACKEND == "onnx" and EMBEDDING_ONNX_INT8 else "")
+
+# Diretório raiz dos bancos de dados vetoriais
+VECTORDB_ROOT = "vectordb"
+
+# Identificador da consulta federada, sobre todas as marcas
+ALL_BRANDS = "__todas__"
+
+# Consulta federada (opção "Todas as marcas") disponível na aplicação. Com
+# ela, o registro de bancos vetoriais comporta todas as marcas, para que
+# cada consulta federada não reabra os bancos removidos pela política LRU
+FEDERATED_SEARCH = os.environ.get("FEDERATED_SEARCH", "1").lower() not in ("0", "false", "nao", "não", "no")
+
+# Manifesto gravado pela ingestão em cada banco vetorial
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+# Backend de busca vetorial das consultas (ver VECTOR_BACKENDS): "chroma"
+# (padrão), "flat" (matriz float32 em memória) ou "compact" (vetores int8
+# por memory-map), os dois últimos em flat_index.py. A ingestão sempre grava
+# no Chroma e, com VECTOR_BACKEND=flat ou compact, também o índice da marca
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma").lower()
+
+# Quantidade máxima de bancos vetoriais mantidos abertos no processo
+# (bancos com referências ativas nunca são removidos; com FEDERATED_SEARCH,
+# no mínimo a quantidade de marcas)
+VECTORDB_CACHE_SIZE = int(os.environ.get("VECTORDB_CACHE_SIZE", "3"))
+
+# Tag que identifica as chamadas ao LLM cuja saída é exibida ao usuário
+ANSWER_STREAM_TAG = "answer_stream"
+
+# Estado compartilhado do processo: um único modelo de embeddings, um
+# registro LRU com um handle do Chroma por pasta de marca e as funções
+# avisadas quando um banco sai do registro
+_embeddings = None
+_embeddings_lock = threading.Lock()
+_sqlite_checked = False
+_registry_lock = threading.RLock()
+_vectordb_registry = OrderedDict()
+_eviction_listeners = []
+
 def check_sqlite_version():
     """
     Verifica a versão do SQLite e retorna se está acima do mínimo necessário.
@@ -111,38 +157,270 @@ def get_api_key():
     
     return api_key
 
+def get_embeddings():
+    """
+    Retorna o modelo de embeddings compartilhado por todo o processo.
+    O modelo é carregado uma única vez, na primeira chamada, e os vetores
+    das consultas ficam em um cache LRU (ver MemoizedEmbeddings), usado
+    também pelos bancos vetoriais de get_vectordb.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                model_path = resolve_model_path(EMBEDDING_MODEL_NAME)
+                logger.info(f"Carregando modelo de embeddings {EMBEDDING_MODEL_NAME} de {model_path} ({EMBEDDING_BACKEND})...")
+                if EMBEDDING_BACKEND == "onnx":
+                    from onnx_embeddings import load_onnx_embeddings
+                    embeddings = load_onnx_embeddings(model_path, quantized=EMBEDDING_ONNX_INT8)
+                else:
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+                    embeddings = HuggingFaceEmbeddings(
+                        model_name=model_path,
+                        model_kwargs={"device": resolve_device()},
+                        encode_kwargs={"normalize_embeddings": True},
+                    )
+                _embeddings = MemoizedEmbeddings(embeddings)
+                logger.info("Embeddings carregados com sucesso")
+    return _embeddings
+
+def embedding_cache_stats():
+    """
+    Estatísticas do cache de vetores das consultas (vazio se o modelo de
+    embeddings ainda não foi carregado).
+    """
+    if _embeddings is None:
+        return {}
+    return _embeddings.stats()
+
+def get_brand_folder(brand):
+    """
+    Normaliza o nome da marca para corresponder à estrutura de pastas.
+    """
+    if not brand.startswith("FT"):
+        return f"FT - {brand}"
+    return brand
+
+def get_persist_directory(brand):
+    """
+    Retorna o caminho do banco de dados vetorial de uma marca.
+    """
+    return os.path.join(VECTORDB_ROOT, get_brand_folder(brand))
+
+def _ensure_sqlite():
+    """
+    Verifica a versão do SQLite uma única vez por processo.
+    """
+    global _sqlite_checked
+    if _sqlite_checked:
+        return
+    if not check_sqlite_version():
+        logger.warning("SQLite está em uma versão antiga. Tentando usar pysqlite3 como alternativa.")
+        setup_success = setup_pysqlite()
+        if not setup_success:
+            logger.warning("Não foi possível configurar pysqlite3. Tentando continuar com SQLite nativo.")
+    _sqlite_checked = True
+
+def _store_signature(persist_directory):
+    """
+    Calcula uma assinatura barata (nome, mtime, tamanho) dos arquivos do banco
+    vetorial, usada para detectar alterações em disco sem reabrir o Chroma.
+    Apenas os arquivos da raiz (chroma.sqlite3, manifesto e índices) são
+    considerados: o Chroma regrava os segmentos HNSW das subpastas ao
+    consultá-los, e toda ingestão altera o chroma.sqlite3 e o manifesto.
+    """
+    signature = []
+    for name in sorted(os.listdir(persist_directory)):
+        path = os.path.join(persist_directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if os.path.isfile(path):
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def _registry_capacity():
+    """
+    Quantidade de bancos mantidos no registro: VECTORDB_CACHE_SIZE ou, com a
+    consulta federada disponível, a quantidade de marcas, se for maior.
+    """
+    if not FEDERATED_SEARCH:
+        return VECTORDB_CACHE_SIZE
+    try:
+        brand_count = sum(
+            1 for name in os.listdir(VECTORDB_ROOT) if os.path.isdir(os.path.join(VECTORDB_ROOT, name))
+        )
+    except OSError:
+        brand_count = 0
+    return max(VECTORDB_CACHE_SIZE, brand_count)
+
+def on_vectordb_evicted(callback):
+    """
+    Registra uma função chamada com a pasta da marca sempre que o banco
+    vetorial dela é removido do registro, para que quem guarda recursos
+    derivados do banco (ex.: o motor de consultas) também os descarte. A
+    função é chamada com o registro bloqueado e não deve acessá-lo.
+    """
+    with _registry_lock:
+        _eviction_listeners.append(callback)
+
+def _evict_unused_vectordbs():
+    """
+    Remove do registro os bancos vetoriais sem referências ativas, do menos
+    recentemente usado para o mais recente, até respeitar a capacidade do
+    registro (ver _registry_capacity). Deve ser chamada com _registry_lock
+    adquirido.
+    """
+    capacity = _registry_capacity()
+    while len(_vectordb_registry) > capacity:
+        evictable = next(
+            (folder for folder, entry in _vectordb_registry.items() if entry["refcount"] <= 0),
+            None
+        )
+        if evictable is None:
+            break
+        del _vectordb_registry[evictable]
+        logger.info(f"Banco vetorial {evictable} removido do cache (LRU)")
+        for callback in _eviction_listeners:
+            callback(evictable)
+
+def _get_registry_entry(brand):
+    """
+    Retorna a entrada do registro para a marca, carregando o banco vetorial
+    na primeira vez e recarregando-o se os arquivos em disco mudaram.
+    Deve ser chamada com _registry_lock adquirido.
+    """
+    brand_folder = get_brand_folder(brand)
+    persist_directory = get_persist_directory(brand)
+
+    # Verifica se o banco de dados existe
+    if not os.path.exists(persist_directory):
+        logger.error(f"Diretório não encontrado: {persist_directory}")
+        raise ValueError(f"Banco de dados vetorial não encontrado para a marca {brand}")
+
+    entry = _vectordb_registry.get(brand_folder)
+    if entry is not None and entry["signature"] != _store_signature(persist_directory):
+        logger.info(f"Banco vetorial de {brand_folder} foi alterado em disco. Recarregando...")
+        entry["vectordb"] = _load_vectordb(persist_directory)
+        entry["signature"] = _store_signature(persist_directory)
+    elif entry is None:
+        vectordb = _load_vectordb(persist_directory)
+        # A assinatura é calculada após o carregamento, pois o Chroma pode
+        # tocar nos arquivos ao abrir o banco
+        entry = {
+            "vectordb": vectordb,
+            "refcount": 0,
+            "signature": _store_signature(persist_directory),
+        }
+        _vectordb_registry[brand_folder] = entry
+
+    _vectordb_registry.move_to_end(brand_folder)
+    return entry
+
+def acquire_vectordb(brand):
+    """
+    Obtém o banco vetorial compartilhado da marca e incrementa sua contagem
+    de referências. Cada chamada deve ter um release_vectordb correspondente.
+    """
+    with _registry_lock:
+        entry = _get_registry_entry(brand)
+        entry["refcount"] += 1
+        _evict_unused_vectordbs()
+        return entry["vectordb"]
+
+def release_vectordb(brand):
+    """
+    Libera uma referência ao banco vetorial da marca. Bancos sem referências
+    continuam em cache até serem removidos pela política LRU.
+    """
+    with _registry_lock:
+        entry = _vectordb_registry.get(get_brand_folder(brand))
+        if entry is None:
+            return
+        entry["refcount"] = max(0, entry["refcount"] - 1)
+        _evict_unused_vectordbs()
+
 def get_vectordb(brand):
     """
-    Carrega o banco de dados vetorial para uma marca específica.
+    Retorna o banco de dados vetorial de uma marca específica a partir do
+    registro do processo, sem alterar a contagem de referências.
     """
     try:
-        # Normaliza o nome da marca para corresponder à estrutura de pastas
-        brand_folder = brand
-        if not brand.startswith("FT"):
-            brand_folder = f"FT - {brand}"
-        
-        # Caminho para o banco de dados vetorial
-        persist_directory = os.path.join("vectordb", brand_folder)
-        
-        # Verifica se o banco de dados existe
-        if not os.path.exists(persist_directory):
-            logger.error(f"Diretório não encontrado: {persist_directory}")
-            raise ValueError(f"Banco de dados vetorial não encontrado para a marca {brand}")
-        
+        with _registry_lock:
+            entry = _get_registry_entry(brand)
+            _evict_unused_vectordbs()
+            return entry["vectordb"]
+    except Exception as e:
+        logger.error(f"Erro ao carregar o banco de dados vetorial: {str(e)}")
+        raise
+
+def _load_vectordb(persist_directory):
+    """
+    Abre o banco vetorial armazenado em persist_directory com o backend de
+    VECTOR_BACKEND. Se o backend não tem dados para a marca, usa o Chroma.
+    """
+    backend = VECTOR_BACKENDS.get(VECTOR_BACKEND)
+    if backend is None:
+        logger.warning(f"Backend vetorial desconhecido: {VECTOR_BACKEND}; usando o Chroma")
+    elif backend is not _load_chroma_vectordb:
+        vectordb = backend(persist_directory)
+        if vectordb is not None:
+            return vectordb
+        logger.warning(
+            f"Backend vetorial {VECTOR_BACKEND} sem dados em {persist_directory}; usando o Chroma "
+            f"(execute ingest.py com VECTOR_BACKEND={VECTOR_BACKEND})"
+        )
+    return _load_chroma_vectordb(persist_directory)
+
+def _load_flat_vectordb(persist_directory):
+    """
+    Abre o índice plano da marca, sem iniciar o Chroma nem verificar o
+    SQLite. Retorna None se o índice não foi gravado.
+    """
+    index = load_flat_index(persist_directory)
+    if index is None:
+        return None
+    logger.info(f"Índice plano carregado de {persist_directory}: {len(index)} chunks")
+    return FlatVectorStore(index, get_embeddings())
+
+def _load_compact_vectordb(persist_directory):
+    """
+    Abre o índice compacto da marca (int8 por memory-map), sem iniciar o
+    Chroma. Retorna None se o índice não foi gravado.
+    """
+    index = load_flat_index(persist_directory, CompactIndex)
+    if index is None:
+        return None
+    logger.info(f"Índice compacto carregado de {persist_directory}: {len(index)} chunks")
+    return FlatVectorStore(index, get_embeddings())
+
+def _open_chroma(client, embeddings, collection_name="langchain"):
+    """
+    Cria o Chroma do LangChain sobre o cliente e guarda em distance_space a
+    métrica da coleção ("l2", "cosine" ou "ip"), lida pela API do cliente,
+    usada para converter as distâncias das buscas em similaridade.
+    """
+    from langchain_community.vectorstores import Chroma
+    vectordb = Chroma(client=client, collection_name=collection_name, embedding_function=embeddings)
+    metadata = client.get_collection(collection_name).metadata or {}
+    vectordb.distance_space = metadata.get("hnsw:space", "l2")
+    return vectordb
+
+def _load_chroma_vectordb(persist_directory):
+    """
+    Abre o banco de dados vetorial Chroma armazenado em persist_directory.
+    """
+    import chromadb
+    try:
         # Lista o conteúdo do diretório para debug
         logger.info(f"Conteúdo do diretório {persist_directory}: {os.listdir(persist_directory)}")
         
         # Verifica versão do SQLite
-        if not check_sqlite_version():
-            logger.warning("SQLite está em uma versão antiga. Tentando usar pysqlite3 como alternativa.")
-            setup_success = setup_pysqlite()
-            if not setup_success:
-                logger.warning("Não foi possível configurar pysqlite3. Tentando continuar com SQLite nativo.")
+        _ensure_sqlite()
         
-        # Carrega os embeddings
-        logger.info("Iniciando carregamento dos embeddings...")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        logger.info("Embeddings carregados com sucesso")
+        # Usa o modelo de embeddings compartilhado
+        embeddings = get_embeddings()
         
         # Carrega o banco de dados vetorial com configurações compatíveis
         logger.info(f"Carregando banco de dados vetorial de {persist_directory}...")
@@ -150,10 +428,7 @@ def get_vectordb(brand):
         # Tentativa de carregamento sem configurações extras primeiro
         try:
             logger.info("Tentando carregar ChromaDB sem configurações especiais...")
-            vectordb = Chroma(
-                persist_directory=persist_directory,
-                embedding_function=embeddings
-            )
+            vectordb = _open_chroma(chromadb.PersistentClient(path=persist_directory), embeddings)
             logger.info("Banco de dados vetorial carregado com sucesso (modo padrão)")
             return vectordb
         except Exception as first_error:
@@ -164,7 +439,6 @@ def get_vectordb(brand):
                 # Se falhar, tenta importar usando o módulo chromadb diretamente
                 # para configurações mais específicas
                 from chromadb.config import Settings
-                import chromadb
                 
                 # Inicializa o cliente com configurações compatíveis
                 logger.info("Inicializando cliente ChromaDB diretamente...")
@@ -195,11 +469,7 @@ def get_vectordb(brand):
                 
                 # Criar uma instância do Chroma usando o cliente e coleção
                 logger.info("Criando instância Chroma a partir do cliente personalizado...")
-                vectordb = Chroma(
-                    client=chroma_client,
-                    collection_name=collection_name,
-                    embedding_function=embeddings
-                )
+                vectordb = _open_chroma(chroma_client, embeddings, collection_name)
                 logger.info("Banco de dados vetorial carregado com sucesso (modo alternativo)")
                 return vectordb
             except Exception as second_error:
@@ -227,10 +497,7 @@ def get_vectordb(brand):
                             shutil.copy2(src, dst)
                     
                     # Tenta carregar a partir do diretório temporário
-                    vectordb = Chroma(
-                        persist_directory=temp_dir,
-                        embedding_function=embeddings
-                    )
+                    vectordb = _open_chroma(chromadb.PersistentClient(path=temp_dir), embeddings)
                     logger.info("Banco de dados vetorial carregado com sucesso (modo de recuperação)")
                     return vectordb
                 except Exception as third_error:
@@ -243,21 +510,45 @@ def get_vectordb(brand):
         logger.error(f"Erro ao carregar o banco de dados vetorial: {str(e)}")
         raise
 
-def get_llm():
+# Backends de busca vetorial: nome -> função que abre o banco de uma marca
+# e retorna um vector store com a API usada nas consultas (similarity_search,
+# similarity_search_by_vector, get e o atributo embeddings), ou None se o
+# backend não tem dados para a marca
+VECTOR_BACKENDS = {
+    "chroma": _load_chroma_vectordb,
+    "flat": _load_flat_vectordb,
+    "compact": _load_compact_vectordb,
+}
+
+def get_llm(streaming=False, tags=None, model_name="llama3-70b-8192", **client_kwargs):
     """
     Configura e retorna o modelo LLM da Groq.
+    Com streaming=True, os tokens da resposta são emitidos aos callbacks
+    (on_llm_new_token) à medida que chegam. client_kwargs são repassados ao
+    ChatGroq (ex.: http_async_client, request_timeout, max_retries).
     """
     try:
         # Obtém a chave da API com tratamento adequado
         api_key = get_api_key()
         
+        # Permite apontar para outro endpoint compatível (ex.: fake_llm_server.py)
+        extra_kwargs = dict(client_kwargs)
+        api_base = os.environ.get("GROQ_API_BASE")
+        if api_base:
+            extra_kwargs["base_url"] = api_base
+            logger.info(f"Usando endpoint alternativo da Groq: {api_base}")
+        
         # Cria o cliente com a chave limpa
         logger.info("Inicializando modelo LLM da Groq...")
+        from langchain_groq import ChatGroq
         llm = ChatGroq(
             api_key=api_key,
-            model_name="llama3-70b-8192",
+            model_name=model_name,
             temperature=0.1,  # Reduzindo a temperatura para respostas mais precisas
             max_tokens=4096,
+            streaming=streaming,
+            tags=tags,
+            **extra_kwargs
         )
         logger.info("Modelo LLM inicializado com sucesso")
         
@@ -266,225 +557,243 @@ def get_llm():
         logger.error(f"Erro ao inicializar o modelo LLM: {str(e)}")
         raise
 
-def get_conversation_chain(brand):
+class TokenStreamHandler(BaseCallbackHandler):
     """
-    Configura e retorna a cadeia de conversação com o modelo e o banco de dados vetorial.
+    Encaminha para on_token os tokens gerados pelo LLM da resposta final.
+    Tokens de outras chamadas (ex.: reformulação da pergunta) são ignorados.
     """
-    try:
-        llm = get_llm()
-        vectordb = get_vectordb(brand)
-        
-        # Extrai o nome da marca sem prefixos para mostrar no prompt
-        brand_display = brand.replace("FT - ", "").replace("FT_", "")
-        logger.info(f"Nome da marca para exibição: {brand_display}")
-        
-        # Configura a memória da conversação com chave de saída específica
-        logger.info("Configurando memória da conversação...")
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="answer"  # Especifica qual chave será armazenada na memória
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if tags and ANSWER_STREAM_TAG in tags:
+            self.on_token(token)
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    Registra os tokens de prompt e de resposta de cada chamada ao LLM em um
+    turno. Quando a API não informa o uso, o prompt é estimado pelo tamanho.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._estimates = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._estimates[run_id] = sum(
+            estimate_tokens(str(message.content)) for batch in messages for message in batch
         )
-        
-        # Abordagem alternativa - usar diretamente o retriever padrão
-        logger.info("Usando retriever padrão com componente de busca especializada...")
-        
-        # Carrega a lista de produtos conhecidos
-        product_mapping = {
-            # Igol Ecoasfalto - todas as variações possíveis
-            "igol ecoasfalto": "IgolEcoasfalto",
-            "igolasfal": "IgolEcoasfalto",
-            "igol asfal": "IgolEcoasfalto",
-            "igol eco": "IgolEcoasfalto",
-            "ecoasfal": "IgolEcoasfalto",
-            "igolecoasfal": "IgolEcoasfalto",
-            "igol asfalto eco": "IgolEcoasfalto",
-            "igol eco asfal": "IgolEcoasfalto",
-            "igol asfalto": "IgolEcoasfalto",
-            "eco asfalto": "IgolEcoasfalto",
-            "igol-eco": "IgolEcoasfalto",
-            "asfalto eco": "IgolEcoasfalto",
-            "ecoasfalto": "IgolEcoasfalto",
-            # Outros produtos SIKA
-            "igol s": "Igol S",
-            "igol 2": "Igol®-2",
-            "igolflex": "Igolflex",  # Base para Igolflex Fachada ou Preto
-            "fachada": "Igolflex Fachada",
-            "preto": "Igolflex Preto",
-            "impermur": "Impermur_Sikagard",
-            "sikagard": "Impermur_Sikagard",
-            "impersika": "Impersika",
-            "pk premium": "PK Premium Superflex",
-            "pk superflex": "PK Premium Superflex",
-            "premium superflex": "PK Premium Superflex",
-            "sika 1": "Sika 1",
-            "sika1": "Sika 1",
-            "sika 2": "Sika 2",
-            "sika2": "Sika 2",
-            "sika 3": "Sika 3 Plus",
-            "sika3": "Sika 3 Plus",
-            "sika plus": "Sika 3 Plus",
-            "chapisco": "Sika Chapisco Plus",
-            "concreto forte": "Sika Concreto Forte",
-            "eco primer": "Sika Eco Primer",
-            "intraplast": "Sika Intraplast N",
-            "monotop": "Sika Monotop 123 Rodapé",
-            "rodapé": "Sika Monotop 123 Rodapé",
-            "multiseal": "Sika Multiseal Primer",
-            "separol": "Sika Separol Top",
-            "silicone": "Sika Silicone",
-            "sikabond 134": "SikaBond 134",
-            "sikabond at": "SikaBond AT Universal",
-            "sikacryl": "SikaCryl 203",
-            "sikadur 31": "Sikadur 31",
-            "sikadur 32 gel": "Sikadur 32 Gel",
-            "sikadur 32": "Sikadur 32",
-            "sikadur 512": "Sikadur 512",
-            "sikadur epoxi": "Sikadur Epoxi",
-            "sikafill rápido power": "Sikafill Rápido Power",
-            "sikafill rápido": "Sikafill Rápido",
-            "sikaflex 1a": "Sikaflex 1A Plus",
-            "sikaflex construction": "Sikaflex Construction",
-            "sikaflex universal": "Sikaflex Universal",
-            "sikagrout 250": "Sikagrout 250",
-            "sikagrout tix": "Sikagrout Tix",
-            "sikanol": "Sikanol Alvenaria",
-            "alvenaria": "Sikanol Alvenaria",
-            "sikashield alu": "SikaShield P34 ALU Tipo II 4 mm",
-            "sikashield 3mm": "SikaShield P34 PE Tipo II 3 mm",
-            "sikashield 4mm": "SikaShield P34 PE Tipo II 4 mm",
-            "sikatop 100": "Sikatop 100",
-            "sikatop 107": "Sikatop 107",
-            "sikatop flex": "Sikatop Flex",
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._estimates[run_id] = sum(estimate_tokens(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response, *, run_id, tags=None, **kwargs):
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            pass
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", self._estimates.get(run_id, 0))
+            completion_tokens = token_usage.get("completion_tokens", 0)
+        self.calls.append({
+            "step": "resposta" if tags and ANSWER_STREAM_TAG in tags else "reformulacao",
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+        self._estimates.pop(run_id, None)
+
+    def summary(self):
+        return {
+            "prompt_tokens": sum(call["prompt_tokens"] for call in self.calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in self.calls),
+            "llm_calls": self.calls,
         }
-        
-        # Função de busca personalizada
-        def custom_search(query, vectordb=vectordb, product_mapping=product_mapping):
-            # Identifica o produto na consulta
-            question_lower = query.lower()
-            identified_product = None
-            
-            # Adicionar logging para depuração
-            logger.info(f"Consulta original: {query}")
-            
-            # Verifica se algum produto específico é mencionado na pergunta
-            for keyword, product_name in product_mapping.items():
-                if keyword.lower() in question_lower:
-                    identified_product = product_name
-                    logger.info(f"Produto identificado na pergunta: {product_name}")
-                    break
-            
-            # Tenta buscar todos os produtos disponíveis para debug
-            try:
-                logger.info("Buscando todos os documentos para debug...")
-                all_docs_debug = vectordb.similarity_search("todos os produtos", k=20)
-                for idx, doc in enumerate(all_docs_debug):
-                    logger.info(f"Doc {idx}: Produto = {doc.metadata.get('product', 'N/A')}, Fonte = {doc.metadata.get('source', 'N/A')}")
-            except Exception as e:
-                logger.warning(f"Erro ao buscar documentos para debug: {str(e)}")
-            
-            # Se o produto for Igol Ecoasfalto, vamos tentar várias formas de busca
-            if identified_product and "ecoasfalto" in identified_product.lower():
-                logger.info("Buscando especificamente o produto Igol Ecoasfalto")
-                
-                # Lista de possíveis nomes alternativos
-                alternative_names = [
-                    "IgolEcoasfalto", 
-                    "Igol Ecoasfalto", 
-                    "Igol-Ecoasfalto",
-                    "Igol Eco Asfalto",
-                    "Eco Asfalto",
-                    "Ecoasfalto"
-                ]
-                
-                # Tenta cada um dos nomes alternativos
-                for alt_name in alternative_names:
-                    try:
-                        logger.info(f"Tentando buscar com nome alternativo: {alt_name}")
-                        alt_docs = vectordb.similarity_search(alt_name, k=5)
-                        
-                        if alt_docs:
-                            logger.info(f"Encontrados {len(alt_docs)} documentos para '{alt_name}'")
-                            # Exibe os documentos encontrados
-                            for idx, doc in enumerate(alt_docs):
-                                logger.info(f"Doc {idx}: Produto = {doc.metadata.get('product', 'N/A')}, Fonte = {doc.metadata.get('source', 'N/A')}")
-                                logger.info(f"Conteúdo: {doc.page_content[:200]}...")
-                            return alt_docs
-                    except Exception as e:
-                        logger.warning(f"Erro ao buscar '{alt_name}': {str(e)}")
-            
-            # Se identificou um produto, tenta filtrar os resultados
-            if identified_product:
-                logger.info(f"Buscando informações específicas para o produto: {identified_product}")
-                
-                # Recupera mais documentos e filtra manualmente para maior precisão
-                try:
-                    # Primeira tentativa: busca pelo nome exato
-                    exact_docs = vectordb.similarity_search(identified_product, k=5)
-                    if exact_docs:
-                        logger.info(f"Encontrados {len(exact_docs)} documentos buscando pelo nome exato: {identified_product}")
-                        return exact_docs
-                    
-                    # Segunda tentativa: filtro
-                    filter_dict = {"product": identified_product}
-                    docs_with_filter = vectordb.similarity_search(
-                        query, k=5, filter=filter_dict
-                    )
-                    
-                    if docs_with_filter:
-                        logger.info(f"Encontrados {len(docs_with_filter)} documentos com filtro exato")
-                        return docs_with_filter
-                    
-                    # Terceira tentativa: busca pela consulta original e filtra manualmente
-                    all_docs = vectordb.similarity_search(query, k=15)
-                    
-                    # Filtra manualmente por produto específico
-                    filtered_docs = []
-                    for doc in all_docs:
-                        product_in_metadata = doc.metadata.get("product", "").lower()
-                        source_in_metadata = doc.metadata.get("source", "").lower()
-                        
-                        # Verifica tanto no metadata quanto no conteúdo
-                        if (identified_product.lower() in product_in_metadata or 
-                            identified_product.lower() in source_in_metadata or
-                            identified_product.lower() in doc.page_content.lower()):
-                            filtered_docs.append(doc)
-                    
-                    if filtered_docs:
-                        logger.info(f"Encontrados {len(filtered_docs)} documentos após filtragem manual")
-                        return filtered_docs
-                
-                except Exception as e:
-                    logger.warning(f"Erro ao filtrar por produto: {str(e)}")
-            
-            # Se não conseguiu filtrar por produto, tenta uma busca mais direta
-            try:
-                # Busca direta pela consulta
-                direct_query = query
-                if identified_product:
-                    direct_query = f"{identified_product} {query}"
-                
-                logger.info(f"Tentando busca direta com: {direct_query}")
-                docs = vectordb.similarity_search(direct_query, k=5)
-                logger.info(f"Busca direta retornou {len(docs)} documentos")
-                return docs
-            except Exception as e:
-                logger.warning(f"Erro na busca direta: {str(e)}")
-            
-            # Fallback - busca padrão
-            docs = vectordb.similarity_search(query, k=3)
-            logger.info(f"Usando resultados sem filtro: {len(docs)} documentos")
-            return docs
-        
-        # Configuração do retriever padrão usando uma função de search personalizada
-        retriever = vectordb.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 3},
-            search_function=custom_search  # Passamos nossa função de busca personalizada
-        )
-        
-        # Mensagem do sistema para controlar o comportamento do modelo
-        system_template = """Você é um especialista em produtos de impermeabilização da marca """ + brand_display + """.
+
+def get_vectordb_version(brand):
+    """
+    Retorna um identificador da versão do banco vetorial da marca, que muda
+    sempre que a ingestão altera o seu conteúdo.
+    """
+    persist_directory = get_persist_directory(brand)
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    
+    # Bancos sem manifesto: usa a assinatura dos arquivos após o carregamento
+    with _registry_lock:
+        entry = _vectordb_registry.get(get_brand_folder(brand))
+        signature = entry["signature"] if entry else _store_signature(persist_directory)
+    return hashlib.sha256(repr(signature).encode("utf-8")).hexdigest()[:16]
+
+def is_cacheable_question(memory, matcher, question):
+    """
+    Uma pergunta pode ser respondida pelo cache se não depende do histórico:
+    é a primeira da conversa ou cita explicitamente um produto.
+    """
+    history = memory.chat_memory.messages if memory is not None else []
+    if not history:
+        return True
+    return identify_product(question, matcher) is not None
+
+def start_turn(brand_folder, question, memory=None, matcher=None, tech_data=None, version=None, on_token=None):
+    """
+    Primeira etapa de um turno, comum à cadeia de conversação (ask_question)
+    e ao motor de consultas (query_engine.py): perguntas que apenas consultam
+    campos técnicos de um produto (consumo, validade, ...) são respondidas
+    pela tabela de dados técnicos, e as independentes do histórico são
+    consultadas no cache de respostas da marca. version é uma função que
+    retorna a versão do banco vetorial.
+    
+    Retorna (resposta, turno): a resposta do turno já concluído (memória
+    atualizada e on_token chamado) ou None, e o estado usado por
+    finish_turn para gravar a nova resposta no cache.
+    """
+    turn = {"brand_folder": brand_folder, "cacheable": False}
+    
+    direct = None
+    if tech_data is not None:
+        try:
+            direct = tech_data.answer(question, matcher, brand_folder)
+        except Exception as e:
+            logger.warning(f"Erro ao consultar os dados técnicos: {str(e)}")
+    if direct:
+        answer, source_documents, stats = direct
+        logger.info(f"Resposta obtida dos dados técnicos ({', '.join(stats['tech_data'])}) em {stats['elapsed_ms']} ms")
+        return _shortcut_response(question, answer, source_documents, stats, memory, on_token), turn
+    
+    cache = get_answer_cache()
+    if cache is None or version is None or not is_cacheable_question(memory, matcher, question):
+        return None, turn
+    
+    # Produto citado: respostas de outros produtos não valem como acerto semântico
+    product = identify_product(question, matcher)
+    try:
+        store_version = version()
+        embedding = get_embeddings().embed_query(question)
+        cached = cache.lookup(brand_folder, store_version, question, embedding, product)
+    except Exception as e:
+        logger.warning(f"Erro ao consultar o cache de respostas: {str(e)}")
+        return None, turn
+    turn.update(cacheable=True, store_version=store_version, embedding=embedding, product=product)
+    if not cached:
+        return None, turn
+    
+    logger.info(f"Resposta obtida do cache ({cached['cache']}) em {cached['elapsed_ms']} ms")
+    stats = {
+        "cache": cached["cache"],
+        "similarity": cached.get("similarity"),
+        "searches": 0,
+        "elapsed_ms": cached["elapsed_ms"],
+    }
+    return _shortcut_response(question, cached["answer"], cached["source_documents"], stats, memory, on_token), turn
+
+def _shortcut_response(question, answer, source_documents, stats, memory, on_token):
+    if memory is not None:
+        memory.save_context({"question": question}, {"answer": answer})
+    if on_token:
+        on_token(answer)
+    return {
+        "question": question,
+        "answer": answer,
+        "source_documents": source_documents,
+        "chat_history": memory.buffer_as_messages if memory is not None else [],
+        "retrieval_stats": stats,
+    }
+
+def finish_turn(turn, question, answer, source_documents, retrieval_stats, memory=None, save_memory=True):
+    """
+    Última etapa de um turno respondido pelo LLM, comum à cadeia e ao motor
+    de consultas: atualiza a memória (save_memory=False quando a cadeia já
+    o fez), grava a resposta no cache e monta o resultado.
+    """
+    if memory is not None and save_memory:
+        memory.save_context({"question": question}, {"answer": answer})
+    if turn["cacheable"] and answer:
+        try:
+            get_answer_cache().store(
+                turn["brand_folder"], turn["store_version"], question, answer,
+                source_documents, turn["embedding"], turn["product"]
+            )
+        except Exception as e:
+            logger.warning(f"Erro ao gravar no cache de respostas: {str(e)}")
+    
+    retrieval_stats = dict(retrieval_stats)
+    if hasattr(memory, "history_tokens"):
+        retrieval_stats.setdefault("tokens", {})["history_tokens"] = memory.history_tokens
+    return {
+        "question": question,
+        "answer": answer,
+        "source_documents": source_documents,
+        "chat_history": memory.buffer_as_messages if memory is not None else [],
+        "retrieval_stats": retrieval_stats,
+    }
+
+def ask_question(conversation_chain, question, on_token=None):
+    """
+    Executa a cadeia de conversação para uma pergunta (QUERY_ENGINE=chain).
+    Se on_token for informado, cada token da resposta é entregue a ele
+    durante a geração. As etapas antes e depois do LLM (dados técnicos,
+    cache de respostas, memória) são as mesmas do motor de consultas (ver
+    start_turn e finish_turn).
+    """
+    retriever = getattr(conversation_chain, "retriever", None)
+    brand = getattr(retriever, "brand", None)
+    memory = conversation_chain.memory
+    matcher = getattr(retriever, "matcher", None)
+    
+    tech_data = None
+    if brand and TECH_DATA_ENABLED:
+        try:
+            tech_data = load_tech_data(get_persist_directory(brand), retriever.vectorstore)
+        except Exception as e:
+            logger.warning(f"Erro ao carregar os dados técnicos: {str(e)}")
+    response, turn = start_turn(
+        brand, question, memory, matcher, tech_data,
+        version=(lambda: get_vectordb_version(brand)) if brand else None,
+        on_token=on_token,
+    )
+    if response is not None:
+        return response
+    
+    condenser = getattr(conversation_chain, "question_generator", None)
+    if hasattr(condenser, "reset_turn"):
+        condenser.reset_turn()
+    
+    usage_handler = TokenUsageHandler()
+    callbacks = [usage_handler]
+    if on_token:
+        callbacks.append(TokenStreamHandler(on_token))
+    response = conversation_chain.invoke({"question": question}, config={"callbacks": callbacks})
+    
+    # Estatísticas da recuperação (buscas executadas, plano, tempo) e tokens do turno
+    retrieval_stats = dict(getattr(retriever, "last_stats", {}) or {})
+    retrieval_stats["tokens"] = usage_handler.summary()
+    if hasattr(condenser, "turn_stats"):
+        retrieval_stats["condense"] = condenser.turn_stats()
+    return finish_turn(
+        turn, question, response.get("answer", ""), response.get("source_documents", []),
+        retrieval_stats, memory, save_memory=False,
+    )
+
+# Regra adicional do prompt na consulta sobre todas as marcas
+FEDERATED_RULE = """12. O contexto reúne fichas técnicas de várias marcas e cada trecho começa com [Marca: ... | Produto: ...]. Perguntas sem um produto específico (ex.: qual produto usar em uma aplicação) podem ser respondidas indicando os produtos adequados encontrados no contexto, sempre com a marca e o nome de cada produto. Nunca atribua a um produto informações de trechos de outro produto ou marca.
+"""
+
+def build_chat_prompt(brand_display, federated=False):
+    """
+    Monta o prompt da resposta (mensagem do sistema com as regras e o
+    contexto recuperado, seguida da pergunta do usuário). Com federated=True,
+    o contexto reúne trechos de várias marcas, identificados por marca e
+    produto.
+    """
+    # Mensagem do sistema para controlar o comportamento do modelo
+    system_template = """Você é um especialista em produtos de impermeabilização da marca """ + brand_display + """.
         
 Sua função é responder perguntas sobre os produtos com base EXCLUSIVAMENTE nas informações das fichas técnicas oficiais.
 
@@ -500,8 +809,7 @@ REGRAS IMPORTANTES:
 9. ATENÇÃO ESPECIAL para informações técnicas como: consumo, rendimento, temperatura de aplicação, tempo de secagem, validade, embalagens disponíveis, etc. Verifique com muito cuidado estas informações nos documentos fornecidos.
 10. Quando responder sobre CONSUMO do produto, cite exatamente como está na ficha técnica, incluindo a unidade de medida.
 11. A ficha técnica geralmente inclui seções como "Dados do Produto" ou "Dados Técnicos" onde informações como consumo são especificadas. Examine cuidadosamente estas seções.
-12. Quando o usuário perguntar sobre o Igol Ecoasfalto (também conhecido como Igol Asfalto Eco), preste muita atenção aos dados técnicos. Este produto tem um consumo aproximado de 300 a 500 ml/m² para cada demão, dependendo da porosidade da superfície.
-
+""" + (FEDERATED_RULE if federated else "") + """
 Contexto técnico recuperado: 
 {context}
 
@@ -510,26 +818,79 @@ Histórico da conversa:
 
 Responda a pergunta do usuário com base APENAS no contexto técnico fornecido acima e APENAS sobre o produto específico perguntado.
 """
+    
+    # Mensagem do usuário
+    human_template = "{question}"
+    
+    # Constrói o prompt completo
+    from langchain_core.prompts import (
+        ChatPromptTemplate,
+        HumanMessagePromptTemplate,
+        SystemMessagePromptTemplate,
+    )
+    system_message_prompt = SystemMessagePromptTemplate.from_template(system_template)
+    human_message_prompt = HumanMessagePromptTemplate.from_template(human_template)
+    
+    # Junta as mensagens para formar o prompt completo
+    chat_prompt = ChatPromptTemplate.from_messages(
+        [system_message_prompt, human_message_prompt]
+    )
+    
+    return chat_prompt
+
+def get_conversation_chain(brand):
+    """
+    Configura e retorna a cadeia de conversação com o modelo e o banco de dados vetorial.
+    """
+    vectordb = None
+    try:
+        # O LLM da resposta é transmitido token a token; a reformulação da
+        # pergunta usa um modelo menor, sem streaming
+        llm = get_llm(streaming=True, tags=[ANSWER_STREAM_TAG])
+        condense_llm = get_llm(model_name=CONDENSE_MODEL)
+        vectordb = acquire_vectordb(brand)
+        
+        # Extrai o nome da marca sem prefixos para mostrar no prompt
+        brand_display = brand.replace("FT - ", "").replace("FT_", "")
+        logger.info(f"Nome da marca para exibição: {brand_display}")
+        
+        # Configura a memória da conversação, limitada por um orçamento de
+        # tokens (turnos antigos são descartados ou resumidos)
+        logger.info("Configurando memória da conversação...")
+        memory = create_memory(summary_llm=condense_llm)
+        
+        # Matcher de apelidos de produtos da marca, gerado na ingestão
+        matcher = load_product_matcher(get_persist_directory(brand), vectordb)
         
-        # Mensagem do usuário
-        human_template = "{question}"
+        # Índice produto -> chunks, para buscas restritas ao produto identificado
+        product_index = load_product_index(get_persist_directory(brand), vectordb)
         
-        # Constrói o prompt completo
-        system_message_prompt = SystemMessagePromptTemplate.from_template(system_template)
-        human_message_prompt = HumanMessagePromptTemplate.from_template(human_template)
+        # Índice lexical (BM25), fundido à busca vetorial
+        lexical_index = load_lexical_index(get_persist_directory(brand), vectordb)
         
-        # Junta as mensagens para formar o prompt completo
-        chat_prompt = ChatPromptTemplate.from_messages(
-            [system_message_prompt, human_message_prompt]
+        # Retriever que identifica o produto citado e executa o menor número de buscas
+        retriever = ProductAwareRetriever(
+            brand=get_brand_folder(brand),
+            vectorstore=vectordb,
+            matcher=matcher,
+            product_index=product_index,
+            lexical_index=lexical_index,
+            reranker=get_reranker(),
         )
         
+        # Prompt da resposta com as regras das fichas técnicas
+        chat_prompt = build_chat_prompt(brand_display)
+        
         # Configura a cadeia de conversação com o prompt personalizado
         logger.info("Criando cadeia de conversação com prompt personalizado...")
+        from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
+        from condenser_chain import FastPathCondenser
         
         conversation_chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
             retriever=retriever,
             memory=memory,
+            condense_question_llm=condense_llm,
             verbose=True,
             combine_docs_chain_kwargs={"prompt": chat_prompt},
             chain_type="stuff",  # Usando o tipo "stuff" para melhor contexto
@@ -537,11 +898,28 @@ Responda a pergunta do usuário com base APENAS no contexto técnico fornecido a
             output_key="answer"  # Define a chave de saída para a resposta
         )
         
+        # Reformulação com caminho rápido: perguntas de acompanhamento que já
+        # citam o produto, sem pronomes ou elipse, não chamam o LLM
+        conversation_chain.question_generator = FastPathCondenser(
+            llm=condense_llm,
+            prompt=conversation_chain.question_generator.prompt,
+            matcher=matcher,
+            verbose=True,
+        )
+        
         logger.info("Cadeia de conversação criada com sucesso")
         
+        # Libera a referência ao banco vetorial quando a sessão descartar a cadeia
+        try:
+            weakref.finalize(conversation_chain, release_vectordb, brand)
+        except TypeError:
+            logger.warning("Cadeia de conversação não suporta weakref; a referência ao banco vetorial não será liberada")
+        
         return conversation_chain
     except Exception as e:
         logger.error(f"Erro ao criar a cadeia de conversação: {str(e)}")
+        if vectordb is not None:
+            release_vectordb(brand)
         raise
 
 def get_available_brands():
@@ -552,12 +930,12 @@ def get_available_brands():
     
     try:
         # Verifica se o diretório vectordb existe
-        if os.path.exists("vectordb"):
-            logger.info(f"Conteúdo do diretório vectordb: {os.listdir('vectordb')}")
+        if os.path.exists(VECTORDB_ROOT):
+            logger.info(f"Conteúdo do diretório vectordb: {os.listdir(VECTORDB_ROOT)}")
             
             # Lista todas as pastas dentro do diretório vectordb
-            for brand_folder in os.listdir("vectordb"):
-                brand_path = os.path.join("vectordb", brand_folder)
+            for brand_folder in os.listdir(VECTORDB_ROOT):
+                brand_path = os.path.join(VECTORDB_ROOT, brand_folder)
                 if os.path.isdir(brand_path):
                     # Limpa o prefixo "FT - " ou "FT_" para exibição
                     display_name = brand_folder
@@ -0,0 +1,130 @@
+import os
+import json
+import logging
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_pipeline import EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Arquivos do modelo exportado por model_artifacts.py --onnx (e --int8),
+# dentro da pasta do modelo
+ONNX_MODEL_FILENAME = os.path.join("onnx", "model.onnx")
+ONNX_INT8_MODEL_FILENAME = os.path.join("onnx", "model_int8.onnx")
+
+# Tamanho máximo da sequência quando o modelo não informa o seu
+# (sentence_bert_config.json)
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+def quantize_onnx_model(model_dir):
+    """
+    Gera a versão do modelo ONNX com quantização dinâmica dos pesos em int8
+    (requer o pacote onnx). Retorna o caminho do arquivo gerado.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(model_dir, ONNX_MODEL_FILENAME)
+    target = os.path.join(model_dir, ONNX_INT8_MODEL_FILENAME)
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    logger.info(
+        f"Modelo ONNX quantizado em int8: {target} "
+        f"({os.path.getsize(source) / 2**20:.1f} MB -> {os.path.getsize(target) / 2**20:.1f} MB)"
+    )
+    return target
+
+class OnnxSentenceEncoder:
+    """
+    Codificador de frases pelo ONNX Runtime, equivalente ao
+    SentenceTransformer do all-MiniLM-L6-v2: tokenização pelo tokenizer.json
+    do modelo, mean pooling dos estados finais sobre a máscara de atenção e
+    normalização L2. encode tem a mesma assinatura do SentenceTransformer,
+    para ser usado também pela ingestão (CachedEmbeddings).
+    """
+
+    def __init__(self, model_dir, quantized=False, num_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file = ONNX_INT8_MODEL_FILENAME if quantized else ONNX_MODEL_FILENAME
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            option = "--onnx --int8" if quantized else "--onnx"
+            raise ValueError(f"Modelo ONNX não encontrado em {model_path}. Execute: python model_artifacts.py {option}")
+
+        max_length = DEFAULT_MAX_SEQ_LENGTH
+        config_path = os.path.join(model_dir, "sentence_bert_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                max_length = json.load(f).get("max_seq_length", max_length)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        num_threads = num_threads or EMBEDDING_THREADS
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.model_path = model_path
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling sobre os tokens reais
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, convert_to_numpy=True,
+               show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if texts:
+            vectors = np.concatenate([
+                self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)
+            ]).astype(np.float32)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors[0] if single else vectors
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings normalizados pelo OnnxSentenceEncoder (em client, como o
+    SentenceTransformer em HuggingFaceEmbeddings).
+    """
+
+    def __init__(self, client, batch_size=None):
+        self.client = client
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.encode(texts, batch_size=self.batch_size, normalize_embeddings=True).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.encode([text], normalize_embeddings=True)[0].tolist()
+
+def load_onnx_embeddings(model_dir, quantized=False):
+    """
+    Carrega os embeddings pelo ONNX Runtime a partir da pasta local do
+    modelo (gerada por model_artifacts.py).
+    """
+    if not os.path.isdir(model_dir):
+        raise ValueError("O backend ONNX requer o modelo local. Execute: python model_artifacts.py --onnx")
+    encoder = OnnxSentenceEncoder(model_dir, quantized=quantized)
+    logger.info(f"Embeddings pelo ONNX Runtime: {encoder.model_path}")
+    return OnnxEmbeddings(encoder)
@@ -0,0 +1,142 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Índice produto -> IDs de chunks gravado junto a cada banco vetorial
+PRODUCT_INDEX_FILENAME = "product_index.json"
+PRODUCT_INDEX_VERSION = 1
+
+# Quantidade de produtos com vetores mantidos em memória por marca
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", "32"))
+
+def write_product_index(output_dir, files):
+    """
+    Grava o índice {produto: [IDs de chunks]} de uma marca a partir das
+    entradas do manifesto de ingestão.
+    """
+    products = {}
+    for entry in files.values():
+        products.setdefault(entry["product"], []).extend(entry["chunk_ids"])
+
+    path = os.path.join(output_dir, PRODUCT_INDEX_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": PRODUCT_INDEX_VERSION, "products": products}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Índice de produtos gravado em {path}: {len(products)} produtos")
+    return products
+
+class ProductChunkIndex:
+    """
+    Índice dos chunks de cada produto de uma marca. Perguntas sobre um
+    produto identificado fazem uma busca exata de vizinhos mais próximos
+    apenas sobre os vetores daquele produto, carregados sob demanda do
+    banco vetorial e mantidos em um cache LRU.
+    """
+
+    def __init__(self, vectorstore, products):
+        self.vectorstore = vectorstore
+        self.products = products
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, product):
+        return bool(self.products.get(product))
+
+    def _load_product(self, product):
+        with self._lock:
+            cached = self._cache.get(product)
+            if cached is not None:
+                self._cache.move_to_end(product)
+                return cached
+
+        data = self.vectorstore.get(
+            ids=self.products[product],
+            include=["embeddings", "documents", "metadatas"]
+        )
+        matrix = np.asarray(data["embeddings"], dtype=np.float32)
+        if len(matrix):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+        docs = [
+            Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+            for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        ]
+        entry = (matrix, docs)
+
+        with self._lock:
+            self._cache[product] = entry
+            while len(self._cache) > PRODUCT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return entry
+
+    def search(self, product, query_vector, k):
+        """
+        Retorna os k chunks do produto mais próximos do vetor da consulta,
+        como lista de (Document, similaridade do cosseno).
+        """
+        matrix, docs = self._load_product(product)
+        if not len(docs):
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query
+
+        k = min(k, len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(docs[i], float(scores[i])) for i in top]
+
+# Índices já carregados, por pasta do banco vetorial: {caminho: (mtime, id do banco, índice)}
+_index_cache = {}
+_index_lock = threading.Lock()
+
+def load_product_index(persist_directory, vectorstore):
+    """
+    Carrega (com cache) o índice de chunks por produto de uma marca. Sem
+    índice gravado (bancos anteriores a ele), o mapeamento é montado a
+    partir dos metadados do banco vetorial.
+    """
+    path = os.path.join(persist_directory, PRODUCT_INDEX_FILENAME)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+    with _index_lock:
+        cached = _index_cache.get(persist_directory)
+        if cached and cached[0] == mtime and cached[1] == id(vectorstore):
+            return cached[2]
+
+        products = None
+        if mtime is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == PRODUCT_INDEX_VERSION:
+                    products = data["products"]
+            except Exception as e:
+                logger.warning(f"Índice de produtos inválido em {path}: {e}")
+
+        if products is None:
+            try:
+                data = vectorstore.get(include=["metadatas"])
+                products = {}
+                for chunk_id, metadata in zip(data["ids"], data["metadatas"]):
+                    if metadata and metadata.get("product"):
+                        products.setdefault(metadata["product"], []).append(chunk_id)
+                logger.info(f"Índice de produtos gerado a partir dos metadados de {persist_directory}")
+            except Exception as e:
+                logger.warning(f"Não foi possível gerar o índice de produtos de {persist_directory}: {e}")
+                products = {}
+
+        index = ProductChunkIndex(vectorstore, products)
+        _index_cache[persist_directory] = (mtime, id(vectorstore), index)
+        return index
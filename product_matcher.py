@@ -0,0 +1,349 @@
+import os
+import json
+import re
+import logging
+import threading
+import unicodedata
+from collections import deque
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Índice de apelidos gravado junto a cada banco vetorial
+ALIAS_INDEX_FILENAME = "product_aliases.json"
+ALIAS_INDEX_VERSION = 2
+
+# Palavras de marca que podem ser omitidas pelo usuário ("Sika Chapisco Plus" -> "chapisco plus")
+BRAND_WORDS = {"sika", "denver", "vedacit", "viapol", "dryko", "mc"}
+
+# Palavras comuns nas perguntas (materiais, superfícies, cores). Apelidos
+# formados só por elas ("alvenaria", "concreto forte") identificariam um
+# produto em perguntas genéricas e são descartados: valem apenas junto a
+# uma palavra de marca ou de produto ("sikanol alvenaria", "sika silicone")
+GENERIC_WORDS = {
+    "alvenaria", "fachada", "parede", "piso", "laje", "rodape", "reboco", "chapisco",
+    "concreto", "argamassa", "graute", "massa", "silicone", "selante", "adesivo",
+    "primer", "manta", "fita", "tinta", "pintura", "epoxi", "impermeabilizante",
+    "desforma", "contra", "umidade", "preto", "branco", "cinza", "forte", "rapido",
+}
+
+# Prefixos de nome de arquivo que não fazem parte do nome do produto
+_NAME_PREFIXES = (("ficha", "tecnica"), ("ft",))
+
+# Apelidos curados manualmente. São usados apenas quando o produto de destino
+# existe na marca, e têm prioridade sobre os apelidos gerados. Palavras
+# soltas de GENERIC_WORDS não entram aqui.
+MANUAL_ALIASES = {
+    # Igol Ecoasfalto - todas as variações possíveis
+    "igol ecoasfalto": "IgolEcoasfalto",
+    "igolasfal": "IgolEcoasfalto",
+    "igol asfal": "IgolEcoasfalto",
+    "igol eco": "IgolEcoasfalto",
+    "ecoasfal": "IgolEcoasfalto",
+    "igolecoasfal": "IgolEcoasfalto",
+    "igol asfalto eco": "IgolEcoasfalto",
+    "igol eco asfal": "IgolEcoasfalto",
+    "igol asfalto": "IgolEcoasfalto",
+    "eco asfalto": "IgolEcoasfalto",
+    "igol-eco": "IgolEcoasfalto",
+    "asfalto eco": "IgolEcoasfalto",
+    "ecoasfalto": "IgolEcoasfalto",
+    # Outros produtos SIKA
+    "igol s": "Igol S",
+    "igol 2": "Igol®-2",
+    "igolflex": "Igolflex",  # Base para Igolflex Fachada ou Preto
+    "impermur": "Impermur_Sikagard",
+    "sikagard": "Impermur_Sikagard",
+    "impersika": "Impersika",
+    "pk premium": "PK Premium Superflex",
+    "pk superflex": "PK Premium Superflex",
+    "premium superflex": "PK Premium Superflex",
+    "sika 1": "Sika 1",
+    "sika1": "Sika 1",
+    "sika 2": "Sika 2",
+    "sika2": "Sika 2",
+    "sika 3": "Sika 3 Plus",
+    "sika3": "Sika 3 Plus",
+    "sika plus": "Sika 3 Plus",
+    "eco primer": "Sika Eco Primer",
+    "intraplast": "Sika Intraplast N",
+    "monotop": "Sika Monotop 123 Rodapé",
+    "multiseal": "Sika Multiseal Primer",
+    "separol": "Sika Separol Top",
+    "sikabond 134": "SikaBond 134",
+    "sikabond at": "SikaBond AT Universal",
+    "sikacryl": "SikaCryl 203",
+    "sikadur 31": "Sikadur 31",
+    "sikadur 32 gel": "Sikadur 32 Gel",
+    "sikadur 32": "Sikadur 32",
+    "sikadur 512": "Sikadur 512",
+    "sikadur epoxi": "Sikadur Epoxi",
+    "sikafill rápido power": "Sikafill Rápido Power",
+    "sikafill rápido": "Sikafill Rápido",
+    "sikaflex 1a": "Sikaflex 1A Plus",
+    "sikaflex construction": "Sikaflex Construction",
+    "sikaflex universal": "Sikaflex Universal",
+    "sikagrout 250": "Sikagrout 250",
+    "sikagrout tix": "Sikagrout Tix",
+    "sikanol": "Sikanol Alvenaria",
+    "sikashield alu": "SikaShield P34 ALU Tipo II 4 mm",
+    "sikashield 3mm": "SikaShield P34 PE Tipo II 3 mm",
+    "sikashield 4mm": "SikaShield P34 PE Tipo II 4 mm",
+    "sikatop 100": "Sikatop 100",
+    "sikatop 107": "Sikatop 107",
+    "sikatop flex": "Sikatop Flex",
+}
+
+
+def normalize_text(text):
+    """
+    Normaliza um texto para comparação: minúsculas, sem acentos nem símbolos
+    (®, ™), com hífens, sublinhados, pontos e barras trocados por espaço.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return text.strip()
+
+def clean_product_name(product):
+    """
+    Remove do nome do produto (derivado do nome do arquivo) prefixos como
+    "FICHA-TÉCNICA"/"ft-", códigos numéricos iniciais, revisões e datas.
+    Ex.: "003-denvertec-540-flex-rev19_2023..." -> "denvertec 540 flex".
+    """
+    tokens = normalize_text(product).split()
+    
+    for prefix in _NAME_PREFIXES:
+        if tuple(tokens[:len(prefix)]) == prefix and len(tokens) > len(prefix):
+            tokens = tokens[len(prefix):]
+    
+    # Código numérico inicial ("003-denvertec...")
+    if len(tokens) > 1 and tokens[0].isdigit() and len(tokens[0]) >= 3:
+        tokens = tokens[1:]
+    
+    cleaned = []
+    for token in tokens:
+        # Revisões encerram o nome ("rev19", "rev13a", "revisado")
+        if re.fullmatch(r"rev\d*[a-z]?|revisado", token) and cleaned:
+            break
+        # Datas encerram o nome ("29092022", "2024"), junto com dia/mês anteriores
+        if re.fullmatch(r"\d{6,}|19[5-9]\d|20[0-3]\d", token) and cleaned:
+            while len(cleaned) > 1 and re.fullmatch(r"\d{1,2}", cleaned[-1]):
+                cleaned.pop()
+            break
+        cleaned.append(token)
+    return " ".join(cleaned)
+
+def generate_aliases(product):
+    """
+    Gera as variantes normalizadas pelas quais um produto pode ser citado:
+    nome limpo, variantes com e sem espaço entre letras e números
+    ("sikadur 32" / "sikadur32"), sem espaços, sem a palavra da marca, sem
+    sufixo numérico de versão ("drykomanta polialum 1" -> "drykomanta polialum")
+    e, em nomes com número, até o número ("denvertec 540 flex" -> "denvertec 540").
+    """
+    base = clean_product_name(product)
+    if not base:
+        return set()
+    
+    variants = {base, normalize_text(product)}
+    
+    # Separa letras e números colados ("am10" -> "am 10")
+    split = re.sub(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z])", " ", base)
+    variants.add(split)
+    
+    # Junta palavra + número ("sikadur 32 gel" -> "sikadur32 gel")
+    variants.add(re.sub(r"(?<=[a-z]) (?=\d)", "", split))
+    
+    # Sem espaços ("sika top 100" -> "sikatop100")
+    variants.add(base.replace(" ", ""))
+    
+    for variant in list(variants):
+        tokens = variant.split()
+        # Sem a palavra da marca no início
+        if len(tokens) > 1 and tokens[0] in BRAND_WORDS:
+            variants.add(" ".join(tokens[1:]))
+        # Sem sufixo numérico de versão de um dígito
+        if len(tokens) > 1 and re.fullmatch(r"\d", tokens[-1]):
+            variants.add(" ".join(tokens[:-1]))
+    
+    # Nome até o número, citado sem o restante ("denvertec 540", "monotop 123")
+    for variant in list(variants):
+        tokens = variant.split()
+        for i, token in enumerate(tokens[:-1]):
+            if re.search(r"\d", token):
+                variants.add(" ".join(tokens[:i + 1]))
+    
+    # Apelidos muito curtos ou só com números geram falsos positivos
+    return {v for v in variants if len(v) >= 3 and re.search(r"[a-z]", v)}
+
+def is_generic_alias(alias):
+    """
+    Se o apelido (normalizado) é formado só por palavras de GENERIC_WORDS.
+    """
+    return all(token in GENERIC_WORDS for token in alias.split())
+
+def build_alias_index(products, manual_aliases=None):
+    """
+    Monta o índice {apelido normalizado: produto} de uma marca. Apelidos
+    gerados que apontam para mais de um produto são descartados, exceto o
+    nome limpo do próprio produto, assim como apelidos (gerados ou manuais)
+    formados só por palavras genéricas (ver is_generic_alias).
+    """
+    manual_aliases = MANUAL_ALIASES if manual_aliases is None else manual_aliases
+    products = sorted(set(products))
+    
+    candidates = {}
+    canonical = {}
+    for product in products:
+        canonical[clean_product_name(product)] = product
+        for alias in generate_aliases(product):
+            candidates.setdefault(alias, set()).add(product)
+    
+    index = {}
+    for alias, targets in candidates.items():
+        if alias in canonical:
+            index[alias] = canonical[alias]
+        elif is_generic_alias(alias):
+            continue
+        elif len(targets) == 1:
+            index[alias] = next(iter(targets))
+    
+    for keyword, product in manual_aliases.items():
+        alias = normalize_text(keyword)
+        if product in products and alias and not is_generic_alias(alias):
+            index[alias] = product
+    
+    return index
+
+class AliasMatcher:
+    """
+    Autômato de Aho-Corasick sobre os apelidos de produtos. Encontra, em uma
+    única passada pela pergunta normalizada, o apelido mais longo que começa
+    e termina em fronteira de palavra.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = dict(aliases)
+        # Estruturas do autômato, indexadas pelo número do nó
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]      # (tamanho, produto) do apelido que termina no nó
+        self._dict_link = [0]      # próximo nó na cadeia de falha que tem saída
+        for alias, product in self.aliases.items():
+            self._insert(alias, product)
+        self._build_links()
+
+    def _insert(self, alias, product):
+        node = 0
+        for ch in alias:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._dict_link.append(0)
+            node = nxt
+        self._output[node] = (len(alias), product)
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                target = self._fail[child]
+                self._dict_link[child] = target if self._output[target] else self._dict_link[target]
+                queue.append(child)
+
+    def find_all(self, text):
+        """
+        Gera (início, fim, produto) para cada ocorrência de apelido em text
+        (já normalizado).
+        """
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            out = node if self._output[node] else self._dict_link[node]
+            while out:
+                length, product = self._output[out]
+                yield i + 1 - length, i + 1, product
+                out = self._dict_link[out]
+
+    def match(self, query):
+        """
+        Retorna o produto do apelido mais longo citado na pergunta, ou None.
+        """
+        text = normalize_text(query)
+        best = None
+        for start, end, product in self.find_all(text):
+            if start > 0 and text[start - 1] != " ":
+                continue
+            if end < len(text) and text[end] != " ":
+                continue
+            if best is None or end - start > best[1] - best[0]:
+                best = (start, end, product)
+        return best[2] if best else None
+
+def write_alias_index(output_dir, products):
+    """
+    Gera e grava o índice de apelidos de uma marca junto ao banco vetorial.
+    """
+    index = build_alias_index(products)
+    path = os.path.join(output_dir, ALIAS_INDEX_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": ALIAS_INDEX_VERSION, "aliases": index}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Índice de apelidos gravado em {path}: {len(index)} apelidos para {len(set(products))} produtos")
+    return index
+
+# Matchers já compilados, por pasta do banco vetorial: {caminho: (mtime, matcher)}
+_matcher_cache = {}
+_matcher_lock = threading.Lock()
+
+def load_product_matcher(persist_directory, vectordb=None):
+    """
+    Carrega (com cache) o matcher de produtos de uma marca. Sem índice
+    gravado (bancos anteriores a ele), os produtos são lidos dos metadados
+    do banco vetorial.
+    """
+    path = os.path.join(persist_directory, ALIAS_INDEX_FILENAME)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    
+    with _matcher_lock:
+        cached = _matcher_cache.get(persist_directory)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        
+        index = None
+        if mtime is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == ALIAS_INDEX_VERSION:
+                    index = data["aliases"]
+            except Exception as e:
+                logger.warning(f"Índice de apelidos inválido em {path}: {e}")
+        
+        if index is None and vectordb is not None:
+            try:
+                metadatas = vectordb.get(include=["metadatas"])["metadatas"]
+                products = {m.get("product") for m in metadatas if m and m.get("product")}
+                index = build_alias_index(products)
+                logger.info(f"Índice de apelidos gerado a partir dos metadados de {persist_directory}")
+            except Exception as e:
+                logger.warning(f"Não foi possível gerar o índice de apelidos de {persist_directory}: {e}")
+        
+        matcher = AliasMatcher(index or {})
+        _matcher_cache[persist_directory] = (mtime, matcher)
+        return matcher
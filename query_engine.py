@@ -0,0 +1,483 @@
+import os
+import time
+import hashlib
+import queue
+import asyncio
+import logging
+import threading
+
+import httpx
+from langchain_core.messages import get_buffer_string
+
+from models import (
+    ALL_BRANDS,
+    ANSWER_STREAM_TAG,
+    build_chat_prompt,
+    estimate_tokens,
+    finish_turn,
+    get_available_brands,
+    get_brand_folder,
+    get_embeddings,
+    get_llm,
+    acquire_vectordb,
+    get_persist_directory,
+    get_vectordb_version,
+    on_vectordb_evicted,
+    release_vectordb,
+    start_turn,
+)
+from product_index import load_product_index
+from lexical_index import load_lexical_index
+from reranker import get_reranker
+from tech_data import TECH_DATA_ENABLED, load_tech_data
+from product_matcher import load_product_matcher
+from conversation_memory import MEMORY_MODE, create_memory
+from question_condenser import CONDENSE_MODEL, decide_condense
+from context_packing import pack_context
+from retrieval import FEDERATED_K, FEDERATED_PER_BRAND, ProductAwareRetriever, merge_ranked
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Cliente HTTP assíncrono compartilhado com a Groq: tempo limite por
+# requisição (segundos), novas tentativas e tamanho do pool de conexões
+GROQ_TIMEOUT = float(os.environ.get("GROQ_TIMEOUT", "30"))
+GROQ_MAX_RETRIES = int(os.environ.get("GROQ_MAX_RETRIES", "2"))
+GROQ_MAX_CONNECTIONS = int(os.environ.get("GROQ_MAX_CONNECTIONS", "20"))
+
+# Separador dos documentos no contexto (o mesmo da cadeia "stuff")
+DOCUMENT_SEPARATOR = "\n\n"
+
+def brand_display(brand_folder):
+    """
+    Nome da marca para exibição, sem os prefixos das pastas.
+    """
+    return brand_folder.replace("FT - ", "").replace("FT_", "")
+
+def format_context(docs, tagged=False):
+    """
+    Monta o contexto da resposta. Com tagged=True (consulta federada), cada
+    trecho é precedido da marca e do produto de origem.
+    """
+    if not tagged:
+        return DOCUMENT_SEPARATOR.join(doc.page_content for doc in docs)
+    return DOCUMENT_SEPARATOR.join(
+        f"[Marca: {brand_display(doc.metadata.get('brand', 'N/A'))} | Produto: {doc.metadata.get('product', 'N/A')}]\n{doc.page_content}"
+        for doc in docs
+    )
+
+class QueryStream:
+    """
+    Resposta em andamento de QueryEngine.stream: iterar produz os tokens à
+    medida que chegam; result() aguarda e retorna a resposta completa.
+    """
+
+    _DONE = object()
+
+    def __init__(self, engine, brand, question, memory):
+        self._tokens = queue.Queue()
+        self._future = asyncio.run_coroutine_threadsafe(
+            engine._run(brand, question, memory, self._tokens.put),
+            engine.loop
+        )
+        self._future.add_done_callback(lambda _: self._tokens.put(self._DONE))
+
+    def __iter__(self):
+        while True:
+            token = self._tokens.get()
+            if token is self._DONE:
+                return
+            yield token
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+class QueryEngine:
+    """
+    Motor de consultas assíncrono, alternativo a get_conversation_chain(),
+    com as mesmas etapas antes e depois do LLM (start_turn e finish_turn).
+    Um único event loop, em uma thread própria, atende todas as sessões: as
+    buscas independentes rodam em paralelo e as chamadas à Groq compartilham
+    um pool de conexões HTTP, de modo que sessões simultâneas não ficam
+    serializadas esperando E/S.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._llms = None
+        self._brands = {}
+        # Recursos derivados de bancos removidos do registro são descartados
+        on_vectordb_evicted(self._forget_brand)
+        self.stats = {"queries": 0, "condense_llm_calls": 0, "condense_skipped": 0, "cache_hits": 0, "tech_data_hits": 0}
+
+    @property
+    def loop(self):
+        """
+        Event loop do motor, iniciado na primeira utilização.
+        """
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=loop.run_forever, name="query-engine", daemon=True
+                    )
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def _get_http_client(self):
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(GROQ_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=GROQ_MAX_CONNECTIONS,
+                    max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+                ),
+            )
+        return self._http_client
+
+    def _get_llms(self):
+        """
+        LLMs da resposta e da reformulação, comuns a todas as marcas e
+        ligados ao pool de conexões do motor.
+        """
+        with self._lock:
+            if self._llms is None:
+                client_kwargs = {
+                    "http_async_client": self._get_http_client(),
+                    "request_timeout": GROQ_TIMEOUT,
+                    "max_retries": GROQ_MAX_RETRIES,
+                }
+                self._llms = (
+                    get_llm(streaming=True, tags=[ANSWER_STREAM_TAG], **client_kwargs),
+                    get_llm(model_name=CONDENSE_MODEL, **client_kwargs),
+                )
+            return self._llms
+
+    def _forget_brand(self, brand_folder):
+        with self._lock:
+            self._brands.pop(brand_folder, None)
+
+    def _acquire_brand(self, brand):
+        """
+        Retriever e prompt de uma marca, recriados quando o banco vetorial
+        compartilhado é recarregado. Adquire uma referência ao banco no
+        registro (ver acquire_vectordb), que deve ser liberada com
+        release_vectordb ao fim da consulta.
+        """
+        vectordb = acquire_vectordb(brand)
+        try:
+            return self._brand_resources(brand, vectordb)
+        except Exception:
+            release_vectordb(brand)
+            raise
+
+    def _brand_resources(self, brand, vectordb):
+        brand_folder = get_brand_folder(brand)
+        with self._lock:
+            resources = self._brands.get(brand_folder)
+            if resources is not None and resources["vectordb"] is vectordb:
+                return resources
+
+        persist_directory = get_persist_directory(brand)
+        matcher = load_product_matcher(persist_directory, vectordb)
+        retriever = ProductAwareRetriever(
+            brand=brand_folder,
+            vectorstore=vectordb,
+            matcher=matcher,
+            product_index=load_product_index(persist_directory, vectordb),
+            lexical_index=load_lexical_index(persist_directory, vectordb),
+            reranker=get_reranker(),
+        )
+        resources = {
+            "brand_folder": brand_folder,
+            "vectordb": vectordb,
+            "matcher": matcher,
+            "retriever": retriever,
+            "retrieve": retriever.aretrieve,
+            "version": lambda: get_vectordb_version(brand_folder),
+            "prompt": build_chat_prompt(brand_display(brand_folder)),
+            "tech_data": load_tech_data(persist_directory, vectordb) if TECH_DATA_ENABLED else None,
+        }
+        with self._lock:
+            self._brands[brand_folder] = resources
+        return resources
+
+    def warm_up(self, brand):
+        """
+        Carrega os recursos da marca (banco vetorial, índices e prompt) antes
+        da primeira pergunta.
+        """
+        self._acquire_brand(brand)
+        release_vectordb(brand)
+
+    def create_memory(self):
+        """
+        Memória de uma conversa atendida pelo motor. No modo de memória
+        com resumo, os turnos antigos são resumidos pelo LLM de reformulação
+        do motor, compartilhado pelas sessões.
+        """
+        summary_llm = self._get_llms()[1] if MEMORY_MODE == "summary" else None
+        return create_memory(summary_llm=summary_llm)
+
+    def warm_up_llms(self):
+        """
+        Cria os clientes dos LLMs antes da primeira pergunta.
+        """
+        self._get_llms()
+
+    def _federated_resources(self):
+        """
+        Recursos da consulta federada, sobre todas as marcas disponíveis.
+        """
+        with self._lock:
+            resources = self._brands.get(ALL_BRANDS)
+            if resources is not None:
+                return resources
+        resources = {
+            "brand_folder": ALL_BRANDS,
+            "matcher": None,
+            "tech_data": None,
+            "retrieve": self._federated_retrieve,
+            "version": self._federated_version,
+            "prompt": build_chat_prompt("de todas as marcas disponíveis", federated=True),
+        }
+        with self._lock:
+            self._brands[ALL_BRANDS] = resources
+        return resources
+
+    def _federated_version(self):
+        versions = [
+            f"{brand['folder']}:{get_vectordb_version(brand['folder'])}" for brand in get_available_brands()
+        ]
+        return hashlib.sha256("|".join(versions).encode("utf-8")).hexdigest()[:16]
+
+    async def _federated_retrieve(self, question):
+        """
+        Consulta todas as marcas em paralelo, com o vetor da pergunta
+        calculado uma única vez e o mesmo caminho da busca em uma marca
+        (alternativas do produto, fusão lexical e reranqueamento), e junta
+        os resultados pela pontuação respeitando FEDERATED_PER_BRAND trechos
+        por marca.
+        """
+        started = time.perf_counter()
+        brand_folders = [brand["folder"] for brand in get_available_brands()]
+        loaded = await asyncio.gather(
+            *(asyncio.to_thread(self._acquire_brand, folder) for folder in brand_folders),
+            return_exceptions=True
+        )
+        brands = []
+        for folder, resources in zip(brand_folders, loaded):
+            if isinstance(resources, Exception):
+                logger.warning(f"Marca {folder} ignorada na busca federada: {str(resources)}")
+            else:
+                brands.append(resources)
+        try:
+            return await self._federated_search(question, brands, started)
+        finally:
+            for resources in brands:
+                release_vectordb(resources["brand_folder"])
+
+    async def _federated_search(self, question, brands, started):
+        query_vector = await asyncio.to_thread(get_embeddings().embed_query, question)
+
+        async def search(resources):
+            try:
+                return await asyncio.to_thread(
+                    resources["retriever"].scored_retrieve, question, query_vector, FEDERATED_PER_BRAND
+                )
+            except Exception as e:
+                logger.warning(f"Erro na busca federada em {resources['brand_folder']}: {str(e)}")
+                return [], {}
+
+        searched = await asyncio.gather(*(search(resources) for resources in brands))
+
+        # Pontuações do cross-encoder são comparáveis entre as marcas (mesma
+        # pergunta e mesmo modelo); se alguma marca não foi reranqueada, vale
+        # a similaridade do cosseno
+        reranked = all(
+            rerank_score is not None for results, _ in searched for _, _, rerank_score in results
+        )
+        merged = merge_ranked(
+            {
+                resources["brand_folder"]: [
+                    (doc, rerank_score if reranked else similarity) for doc, similarity, rerank_score in results
+                ]
+                for resources, (results, _) in zip(brands, searched)
+            },
+            k=FEDERATED_K,
+            per_brand=FEDERATED_PER_BRAND,
+        )
+
+        # Cópias dos trechos com a marca de origem e a similaridade
+        docs = []
+        for brand_folder, doc, score in merged:
+            metadata = dict(doc.metadata)
+            metadata["brand"] = brand_folder
+            metadata["score"] = round(score, 4)
+            docs.append(doc.__class__(page_content=doc.page_content, metadata=metadata))
+        docs, context_stats = pack_context(docs)
+
+        stats = {
+            "federated": True,
+            "brands": len(brands),
+            "searches": sum(brand_stats.get("searches", 0) for _, brand_stats in searched),
+            "reranked": reranked,
+            "plan_per_brand": {
+                resources["brand_folder"]: brand_stats.get("plan", [])
+                for resources, (_, brand_stats) in zip(brands, searched)
+            },
+            "documents": len(docs),
+            "documents_per_brand": {
+                folder: sum(1 for doc in docs if doc.metadata.get("brand") == folder)
+                for folder in (resources["brand_folder"] for resources in brands)
+            },
+            **context_stats,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        logger.info(f"Recuperação federada: {stats}")
+        return docs, stats
+
+    async def aquery(self, brand, question, memory=None, on_token=None):
+        """
+        Responde a uma pergunta sobre os produtos da marca (ou de todas as
+        marcas, com brand=ALL_BRANDS). Com memory (uma
+        memória de conversa), o histórico é usado e atualizado; on_token
+        recebe os tokens da resposta durante a geração, na thread do motor.
+        Retorna um dict com answer, source_documents, chat_history e
+        retrieval_stats. Chamado de outro event loop, a consulta é executada
+        no loop do motor, que é o dono do pool de conexões.
+        """
+        coroutine = self._run(brand, question, memory, on_token)
+        if asyncio.get_running_loop() is self.loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    async def _run(self, brand, question, memory, on_token):
+        started = time.perf_counter()
+        self.stats["queries"] += 1
+        if brand == ALL_BRANDS:
+            resources = self._federated_resources()
+            return await self._answer(resources, brand, question, memory, on_token, started)
+        resources = await asyncio.to_thread(self._acquire_brand, brand)
+        try:
+            return await self._answer(resources, brand, question, memory, on_token, started)
+        finally:
+            release_vectordb(brand)
+
+    async def _answer(self, resources, brand, question, memory, on_token, started):
+        llm, condense_llm = self._get_llms()
+        brand_folder = resources["brand_folder"]
+        history = memory.buffer_as_messages if memory is not None else []
+        llm_calls = []
+
+        # Dados técnicos e cache de respostas, como na cadeia de conversação
+        response, turn = await asyncio.to_thread(
+            start_turn, brand_folder, question, memory, resources["matcher"], resources["tech_data"],
+            resources["version"], on_token,
+        )
+        if response is not None:
+            stats = response["retrieval_stats"]
+            self.stats["cache_hits" if stats.get("cache") else "tech_data_hits"] += 1
+            return response
+
+        # Reformulação da pergunta de acompanhamento
+        chat_history = get_buffer_string(history, human_prefix="Human", ai_prefix="Assistant") if history else ""
+        new_question = question
+        decision = "sem_historico"
+        if chat_history:
+            decision, new_question = decide_condense(question, chat_history, resources["matcher"])
+            if decision == "llm":
+                # Prompt da cadeia do LangChain, importado só quando usado
+                from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+
+                self.stats["condense_llm_calls"] += 1
+                result = await condense_llm.ainvoke(
+                    CONDENSE_QUESTION_PROMPT.format(question=question, chat_history=chat_history)
+                )
+                new_question = result.content
+                llm_calls.append(self._usage("reformulacao", result, chat_history + question))
+            else:
+                self.stats["condense_skipped"] += 1
+
+        # Recuperação (buscas independentes em paralelo)
+        docs, retrieval_stats = await resources["retrieve"](new_question)
+
+        # Resposta transmitida token a token
+        messages = resources["prompt"].format_messages(
+            context=format_context(docs, tagged=brand == ALL_BRANDS),
+            chat_history=chat_history,
+            question=new_question,
+        )
+        parts = []
+        final_chunk = None
+        async for chunk in llm.astream(messages):
+            final_chunk = chunk if final_chunk is None else final_chunk + chunk
+            if chunk.content:
+                parts.append(chunk.content)
+                if on_token:
+                    on_token(chunk.content)
+        answer = "".join(parts)
+        llm_calls.append(self._usage(
+            "resposta", final_chunk, "".join(str(message.content) for message in messages)
+        ))
+
+        retrieval_stats = dict(retrieval_stats)
+        retrieval_stats["condense"] = {"decision": decision}
+        retrieval_stats["tokens"] = {
+            "prompt_tokens": sum(call["prompt_tokens"] for call in llm_calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in llm_calls),
+            "llm_calls": llm_calls,
+        }
+        retrieval_stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return await asyncio.to_thread(finish_turn, turn, question, answer, docs, retrieval_stats, memory)
+
+    def _usage(self, step, message, prompt_text):
+        usage = getattr(message, "usage_metadata", None) or {}
+        return {
+            "step": step,
+            "prompt_tokens": usage.get("input_tokens", estimate_tokens(prompt_text)),
+            "completion_tokens": usage.get("output_tokens", estimate_tokens(getattr(message, "content", ""))),
+        }
+
+    def query(self, brand, question, memory=None, on_token=None, timeout=None):
+        """
+        Versão síncrona de aquery, executada no event loop do motor.
+        on_token é chamado na thread do motor.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(brand, question, memory, on_token), self.loop
+        )
+        return future.result(timeout)
+
+    def stream(self, brand, question, memory=None):
+        """
+        Inicia a consulta no event loop do motor e retorna um QueryStream,
+        cujos tokens podem ser consumidos pela thread que chamou.
+        """
+        return QueryStream(self, brand, question, memory)
+
+_query_engine = None
+_query_engine_lock = threading.Lock()
+
+def get_query_engine():
+    """
+    Retorna o motor de consultas compartilhado pelo processo.
+    """
+    global _query_engine
+    if _query_engine is None:
+        with _query_engine_lock:
+            if _query_engine is None:
+                _query_engine = QueryEngine()
+    return _query_engine
+
+def aquery(brand, question, memory=None, on_token=None):
+    """
+    Atalho para get_query_engine().aquery.
+    """
+    return get_query_engine().aquery(brand, question, memory=memory, on_token=on_token)
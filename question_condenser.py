@@ -0,0 +1,75 @@
+import os
+import re
+import logging
+
+from product_matcher import normalize_text
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Estratégia de reformulação das perguntas de acompanhamento:
+# - "auto": perguntas autossuficientes são usadas como estão; as demais são
+#   reformuladas pelo LLM de reformulação
+# - "llm": sempre reformula com o LLM (comportamento original)
+# - "local": nunca chama o LLM; perguntas sem produto recebem o último
+#   produto citado no histórico
+CONDENSE_MODE = os.environ.get("CONDENSE_MODE", "auto").lower()
+
+# Modelo usado na reformulação (menor e mais rápido que o da resposta)
+CONDENSE_MODEL = os.environ.get("CONDENSE_MODEL", "llama3-8b-8192")
+
+# Palavras que fazem referência a algo dito antes (pronomes e demonstrativos)
+REFERENCE_WORDS = {
+    "ele", "ela", "eles", "elas", "dele", "dela", "deles", "delas",
+    "nele", "nela", "neles", "nelas", "lo", "la", "los", "las",
+    "este", "esta", "estes", "estas", "esse", "essa", "esses", "essas",
+    "isto", "isso", "aquele", "aquela", "aquilo", "deste", "desta", "desse",
+    "dessa", "disso", "disto", "neste", "nesta", "nesse", "nessa", "nisso",
+    "daquele", "daquela", "naquele", "naquela", "seu", "sua", "seus", "suas",
+    "mesmo", "mesma", "anterior", "acima", "outro", "outra", "tambem",
+}
+
+# Começos típicos de perguntas elípticas ("e a embalagem?", "e para piso?")
+ELLIPSIS_PATTERN = re.compile(r"^(e|mas|entao|tambem|so|agora)\b")
+
+def is_self_contained(question, matcher):
+    """
+    Uma pergunta é autossuficiente quando cita um produto conhecido e não
+    contém pronomes, demonstrativos ou elipse que dependam do histórico.
+    """
+    if matcher is None or matcher.match(question) is None:
+        return False
+    text = normalize_text(question)
+    if ELLIPSIS_PATTERN.match(text):
+        return False
+    return not (set(text.split()) & REFERENCE_WORDS)
+
+def last_product_in_history(chat_history, matcher):
+    """
+    Retorna o último produto citado no histórico (texto formatado), ou None.
+    """
+    if matcher is None:
+        return None
+    for line in reversed(chat_history.splitlines()):
+        product = matcher.match(line)
+        if product:
+            return product
+    return None
+
+def decide_condense(question, chat_history, matcher, mode=CONDENSE_MODE):
+    """
+    Decide como tratar uma pergunta de acompanhamento. Retorna (decisão,
+    pergunta), em que a decisão é "pulada", "local" ou "llm"; com "llm" a
+    pergunta deve ser reformulada pelo LLM e o segundo valor é None.
+    """
+    if mode == "llm":
+        return "llm", None
+    if is_self_contained(question, matcher):
+        return "pulada", question
+    if mode == "local":
+        product = last_product_in_history(chat_history, matcher)
+        if product and matcher.match(question) is None:
+            return "local", f"{question} ({product})"
+        return "local", question
+    return "llm", None
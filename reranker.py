@@ -0,0 +1,207 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from model_artifacts import resolve_model_path
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Reranqueamento dos candidatos com um cross-encoder local (CPU)
+RERANK_ENABLED = os.environ.get("RERANK", "1").lower() not in ("0", "false", "nao", "não", "no")
+
+# Modelo multilíngue (as fichas técnicas são em português), carregado da
+# pasta local gerada por model_artifacts.py, como o de embeddings
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+
+# Máximo de candidatos reranqueados e orçamento de latência (ms) do
+# reranqueamento: o número de candidatos é reduzido para caber no orçamento
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "30"))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "150"))
+
+# Pontuações mantidas em memória, por (hash da pergunta, ID do chunk)
+RERANK_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", "4096"))
+
+# Tamanho máximo (tokens) do par pergunta + trecho enviado ao modelo
+RERANK_MAX_LENGTH = 256
+
+def chunk_key(doc):
+    """
+    Identificador do chunk: o ID do banco vetorial, quando conhecido, ou o
+    hash do conteúdo.
+    """
+    return getattr(doc, "id", None) or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+# Pares usados no aquecimento, para medir o custo por par antes da primeira
+# pergunta
+WARMUP_PAIRS = 8
+
+class CrossEncoderReranker:
+    """
+    Reordena os candidatos da recuperação com um cross-encoder, em uma única
+    passada em lote. O custo por par é medido no aquecimento e a cada
+    chamada e usado para limitar os candidatos ao orçamento de latência;
+    pontuações já calculadas para a mesma pergunta e o mesmo chunk são
+    reaproveitadas. O modelo é carregado por load (no aquecimento da
+    inicialização ou, sem ele, em segundo plano na primeira consulta):
+    enquanto não está pronto, as consultas seguem sem reranqueamento.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, budget_ms=RERANK_BUDGET_MS,
+                 max_candidates=RERANK_CANDIDATES, cache_size=RERANK_CACHE_SIZE, model=None):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.max_candidates = max_candidates
+        self.cache_size = cache_size
+        self.model = model
+        self.available = True
+        self.ms_per_pair = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._loader = None
+
+    def load(self):
+        """
+        Carrega o modelo (uma única vez) e mede o custo por par com um lote
+        de aquecimento. Retorna o modelo, ou None se não pôde ser carregado.
+        """
+        with self._model_lock:
+            if self.model is None and self.available:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    model_path = resolve_model_path(self.model_name)
+                    logger.info(f"Carregando cross-encoder {self.model_name} de {model_path}...")
+                    self.model = CrossEncoder(model_path, device="cpu", max_length=RERANK_MAX_LENGTH)
+                except Exception as e:
+                    logger.warning(f"Reranqueamento desativado: não foi possível carregar {self.model_name}: {e}")
+                    self.available = False
+                    return None
+            if self.model is not None and self.ms_per_pair is None:
+                pairs = [("aquecimento do reranqueamento", "trecho de ficha técnica " * 20)] * WARMUP_PAIRS
+                started = time.perf_counter()
+                self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+                self.ms_per_pair = (time.perf_counter() - started) * 1000 / len(pairs)
+                logger.info(f"Cross-encoder pronto: {self.ms_per_pair:.1f} ms por par")
+            return self.model
+
+    @property
+    def ready(self):
+        """
+        Se o modelo está carregado e o custo por par já foi medido.
+        """
+        return self.model is not None and self.ms_per_pair is not None
+
+    def _ready_model(self):
+        """
+        O modelo, se já carregado e medido; senão, inicia o carregamento em
+        segundo plano (uma única vez) e retorna None.
+        """
+        if self.ready:
+            return self.model
+        if self.available:
+            with self._lock:
+                if self._loader is None:
+                    self._loader = threading.Thread(target=self.load, name="reranker-load", daemon=True)
+                    self._loader.start()
+        return None
+
+    def candidate_count(self, k):
+        """
+        Quantidade de candidatos a recuperar para que o reranqueamento caiba
+        no orçamento de latência (nunca menos que k). Enquanto o custo por
+        par não foi medido, apenas k.
+        """
+        if not self.available or self.ms_per_pair is None:
+            return k
+        return max(k, min(self.max_candidates, int(self.budget_ms / max(self.ms_per_pair, 1e-3))))
+
+    def rerank(self, query, docs, k):
+        """
+        Retorna (os k documentos mais relevantes, estatísticas).
+        """
+        scored, stats = self.rerank_scored(query, docs, k)
+        if scored is None:
+            return docs[:k], stats
+        return [doc for doc, _ in scored], stats
+
+    def rerank_scored(self, query, docs, k):
+        """
+        Como rerank, mas retorna ([(Document, pontuação do cross-encoder)],
+        estatísticas), ou (None, {}) se os documentos não foram reranqueados.
+        No máximo budget_ms / ms_per_pair pares são pontuados por chamada;
+        os demais candidatos ficam no fim, na ordem da recuperação, com a
+        menor pontuação calculada.
+        """
+        if len(docs) <= 1:
+            return None, {}
+        model = self._ready_model()
+        if model is None:
+            return None, {}
+        started = time.perf_counter()
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(query_hash, chunk_key(doc)) for doc in docs]
+
+        scores = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+        missing = [(key, doc) for key, doc in zip(keys, docs) if key not in scores]
+
+        # Pares além do orçamento de latência não são pontuados e seguem,
+        # na ordem da recuperação, depois dos pontuados
+        limit = max(1, int(self.budget_ms / max(self.ms_per_pair, 1e-3)))
+        skipped = len(missing) - limit if len(missing) > limit else 0
+        missing = missing[:limit]
+
+        if missing:
+            model_started = time.perf_counter()
+            predicted = model.predict(
+                [(query, doc.page_content) for _, doc in missing],
+                batch_size=len(missing),
+                show_progress_bar=False,
+            )
+            elapsed_ms = (time.perf_counter() - model_started) * 1000
+            per_pair = elapsed_ms / len(missing)
+            with self._lock:
+                self.ms_per_pair = 0.7 * self.ms_per_pair + 0.3 * per_pair
+                for (key, _), score in zip(missing, predicted):
+                    scores[key] = float(score)
+                    self._cache[key] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        scored = [i for i in range(len(docs)) if keys[i] in scores]
+        order = sorted(scored, key=lambda i: scores[keys[i]], reverse=True)
+        lowest = scores[keys[order[-1]]]
+        ranked = [(docs[i], scores[keys[i]]) for i in order]
+        ranked.extend((docs[i], lowest) for i in range(len(docs)) if keys[i] not in scores)
+        return ranked[:k], {
+            "rerank_candidates": len(docs),
+            "rerank_cached": len(docs) - len(missing) - skipped,
+            "rerank_skipped": skipped,
+            "rerank_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker():
+    """
+    Retorna o reranqueador compartilhado pelo processo, ou None se estiver
+    desativado.
+    """
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker()
+    return _reranker
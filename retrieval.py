@@ -0,0 +1,446 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from pydantic import Field
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from context_packing import CONTEXT_TOKEN_BUDGET, pack_context
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Quantidade de documentos retornados por consulta
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "5"))
+
+# Modo de diagnóstico: registra os documentos recuperados e executa uma busca
+# ampla extra ("todos os produtos") apenas para inspeção do banco vetorial
+RAG_DIAGNOSTICS = os.environ.get("RAG_DIAGNOSTICS", "").lower() in ("1", "true", "sim", "yes")
+
+# Busca híbrida: funde o resultado vetorial com o índice lexical (BM25) da
+# marca por reciprocal rank fusion (RRF)
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1").lower() not in ("0", "false", "nao", "não", "no")
+LEXICAL_CANDIDATES = int(os.environ.get("LEXICAL_CANDIDATES", "10"))
+RRF_K = 60
+
+# Busca federada (todas as marcas): trechos no contexto e máximo por marca
+FEDERATED_K = int(os.environ.get("FEDERATED_K", "8"))
+FEDERATED_PER_BRAND = int(os.environ.get("FEDERATED_PER_BRAND", "3"))
+
+def identify_product(query, matcher):
+    """
+    Retorna o produto mencionado na pergunta (apelido mais longo), ou None.
+    """
+    if matcher is None:
+        return None
+    return matcher.match(query)
+
+def plan_searches(query, product, k, product_index=None, single=False):
+    """
+    Monta o plano de buscas da pergunta, em ordem. Cada passo é executado
+    apenas se os anteriores não retornaram documentos, de modo que o caso
+    comum custa uma única consulta:
+    
+    - produto identificado e presente no índice de produtos: busca exata
+      restrita aos chunks do produto;
+    - produto fora do índice: busca filtrada pelo metadado "product" e, se
+      o nome não existir nos metadados, busca única com o nome do produto
+      prefixado à pergunta;
+    - sem produto: busca única pela pergunta.
+    
+    Com single=True (candidatos reranqueados em seguida), o plano tem um
+    único passo: o índice do produto ou, fora dele, a busca com o nome do
+    produto prefixado à pergunta.
+    """
+    if product and single:
+        if product_index is not None and product in product_index:
+            return [{"name": "produto_indice", "query": query, "k": k, "filter": None, "product": product}]
+        return [{"name": "produto_na_consulta", "query": f"{product} {query}", "k": k, "filter": None}]
+    if product:
+        steps = []
+        if product_index is not None and product in product_index:
+            steps.append({"name": "produto_indice", "query": query, "k": k, "filter": None, "product": product})
+        steps.extend([
+            {"name": "produto_filtrado", "query": query, "k": k, "filter": {"product": product}},
+            {"name": "produto_na_consulta", "query": f"{product} {query}", "k": k, "filter": None},
+        ])
+        return steps
+    return [{"name": "direta", "query": query, "k": k, "filter": None}]
+
+def distance_to_similarity(distance, space="l2"):
+    """
+    Converte a distância retornada pelo Chroma em similaridade do cosseno,
+    considerando vetores normalizados (como os gerados na ingestão).
+    """
+    if space == "l2":
+        # O Chroma retorna a distância euclidiana ao quadrado
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+def merge_ranked(results, k=FEDERATED_K, per_brand=FEDERATED_PER_BRAND):
+    """
+    Junta os resultados de várias marcas, {marca: [(Document, similaridade)]},
+    em uma única lista de (marca, Document, similaridade) ordenada pela
+    similaridade, com no máximo per_brand trechos de cada marca e k no total.
+    """
+    ranked = sorted(
+        ((score, brand, doc) for brand, scored_docs in results.items() for doc, score in scored_docs),
+        key=lambda item: item[0],
+        reverse=True
+    )
+    merged = []
+    taken = {}
+    for score, brand, doc in ranked:
+        if taken.get(brand, 0) >= per_brand:
+            continue
+        taken[brand] = taken.get(brand, 0) + 1
+        merged.append((brand, doc, score))
+        if len(merged) >= k:
+            break
+    return merged
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """
+    Funde listas ordenadas de Documents pela soma de 1 / (rrf_k + posição).
+    Documentos com o mesmo conteúdo em listas diferentes são somados.
+    """
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ordered[:k]]
+
+class ProductAwareRetriever(BaseRetriever):
+    """
+    Retriever que identifica o produto citado na pergunta e executa o menor
+    número de buscas necessário. As estatísticas da última consulta ficam em
+    last_stats (buscas executadas, plano usado, tempo).
+    """
+
+    brand: str = ""
+    vectorstore: Any
+    matcher: Any = None
+    product_index: Any = None
+    lexical_index: Any = None
+    hybrid: bool = HYBRID_SEARCH
+    reranker: Any = None
+    k: int = RETRIEVAL_K
+    context_budget: int = CONTEXT_TOKEN_BUDGET
+    diagnostics: bool = RAG_DIAGNOSTICS
+    last_stats: Dict[str, Any] = Field(default_factory=dict)
+
+    def _embed_steps(self, steps):
+        """
+        Calcula o vetor de consulta de cada passo do plano. Passos com o
+        mesmo texto compartilham o vetor (e o cache de embeddings evita
+        recalcular textos de consultas anteriores).
+        """
+        vectors = {}
+        try:
+            for step in steps:
+                if step["query"] not in vectors:
+                    vectors[step["query"]] = self.vectorstore.embeddings.embed_query(step["query"])
+        except Exception as e:
+            # Cada passo tenta de novo em _safe_search, que registra o erro
+            logger.warning(f"Erro ao calcular os vetores de consulta: {str(e)}")
+        return [vectors.get(step["query"]) for step in steps]
+
+    def _search(self, step, query_vector=None):
+        if query_vector is None:
+            query_vector = self.vectorstore.embeddings.embed_query(step["query"])
+        if step.get("product"):
+            return [doc for doc, _ in self.product_index.search(step["product"], query_vector, step["k"])]
+        if step["filter"]:
+            return self.vectorstore.similarity_search_by_vector(query_vector, k=step["k"], filter=step["filter"])
+        return self.vectorstore.similarity_search_by_vector(query_vector, k=step["k"])
+
+    def _run_diagnostics(self, docs):
+        """
+        Registra os documentos recuperados e uma amostra ampla do banco.
+        Só é executado com o modo de diagnóstico ativado.
+        """
+        for idx, doc in enumerate(docs):
+            logger.info(f"Doc {idx}: Produto = {doc.metadata.get('product', 'N/A')}, Fonte = {doc.metadata.get('source', 'N/A')}")
+            logger.info(f"Conteúdo: {doc.page_content[:200]}...")
+        try:
+            all_docs_debug = self.vectorstore.similarity_search("todos os produtos", k=20)
+            for idx, doc in enumerate(all_docs_debug):
+                logger.info(f"[diagnóstico] Doc {idx}: Produto = {doc.metadata.get('product', 'N/A')}, Fonte = {doc.metadata.get('source', 'N/A')}")
+        except Exception as e:
+            logger.warning(f"Erro ao buscar documentos para diagnóstico: {str(e)}")
+        return 1
+
+    def _scored_search(self, step, query_vector=None):
+        """
+        Executa um passo do plano e retorna [(Document, similaridade do
+        cosseno)]. No Chroma, a distância é convertida pela métrica da
+        coleção (distance_space, lida ao abrir o banco; "l2" por padrão).
+        """
+        if query_vector is None:
+            query_vector = self.vectorstore.embeddings.embed_query(step["query"])
+        if step.get("product"):
+            return self.product_index.search(step["product"], query_vector, step["k"])
+        cosine_search = getattr(self.vectorstore, "cosine_search_by_vector", None)
+        if cosine_search is not None:
+            return cosine_search(query_vector, k=step["k"], filter=step["filter"])
+        space = getattr(self.vectorstore, "distance_space", "l2")
+        return [
+            (doc, distance_to_similarity(distance, space))
+            for doc, distance in self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                query_vector, k=step["k"], filter=step["filter"]
+            )
+        ]
+
+    def _similarities(self, query_vector, docs):
+        """
+        Similaridade do cosseno dos documentos (com ID) com o vetor da
+        consulta, a partir dos vetores gravados no banco: {conteúdo: similaridade}.
+        """
+        ids = [doc.id for doc in docs if getattr(doc, "id", None)]
+        if not ids:
+            return {}
+        data = self.vectorstore.get(ids=ids, include=["embeddings"])
+        vectors = {chunk_id: vector for chunk_id, vector in zip(data["ids"], data["embeddings"])}
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        similarities = {}
+        for doc in docs:
+            vector = vectors.get(getattr(doc, "id", None))
+            if vector is not None:
+                vector = np.asarray(vector, dtype=np.float32)
+                similarities[doc.page_content] = float(vector @ query) / max(float(np.linalg.norm(vector)), 1e-12)
+        return similarities
+
+    def scored_retrieve(self, query, query_vector, k):
+        """
+        Recuperação de uma marca na busca federada, pelo mesmo caminho de
+        retrieve (plano de buscas com as alternativas do produto, fusão com
+        o índice lexical e reranqueamento), com o vetor da pergunta já
+        calculado e sem empacotar o contexto, feito uma única vez com os
+        trechos de todas as marcas. Retorna ([(Document, similaridade do
+        cosseno, pontuação do reranqueamento ou None)], estatísticas).
+        """
+        product = identify_product(query, self.matcher)
+        candidates = self._candidate_count()
+        scored = []
+        executed = []
+        for step in plan_searches(query, product, candidates, self.product_index, single=self._reranking()):
+            executed.append(step["name"])
+            try:
+                scored = self._scored_search(step, query_vector if step["query"] == query else None)
+            except Exception as e:
+                logger.warning(f"Erro na busca '{step['name']}': {str(e)}")
+                scored = []
+            if scored:
+                break
+        similarities = {doc.page_content: score for doc, score in scored}
+        scope = self._lexical_scope(product, executed[-1] if scored else None)
+        docs, lexical_stats = self._hybrid(query, scope, [doc for doc, _ in scored], candidates)
+
+        rerank_scores = {}
+        rerank_stats = {}
+        if self.reranker is not None:
+            try:
+                reranked, rerank_stats = self.reranker.rerank_scored(query, docs, k)
+            except Exception as e:
+                logger.warning(f"Erro no reranqueamento: {str(e)}")
+                reranked = None
+            if reranked is not None:
+                docs = [doc for doc, _ in reranked]
+                rerank_scores = {doc.page_content: score for doc, score in reranked}
+        docs = docs[:k]
+
+        # Trechos vindos apenas do índice lexical não têm similaridade da busca
+        unscored = [doc for doc in docs if doc.page_content not in similarities]
+        if unscored:
+            try:
+                similarities.update(self._similarities(query_vector, unscored))
+            except Exception as e:
+                logger.warning(f"Erro ao calcular a similaridade dos trechos lexicais: {str(e)}")
+        results = [
+            (doc, similarities.get(doc.page_content, 0.0), rerank_scores.get(doc.page_content))
+            for doc in docs
+        ]
+        return results, {
+            "product": product,
+            "plan": executed,
+            "searches": len(executed),
+            "documents": len(docs),
+            **lexical_stats,
+            **rerank_stats,
+        }
+
+    def _hybrid(self, query, product, docs, k):
+        """
+        Funde os documentos da busca vetorial com os melhores resultados do
+        índice lexical no mesmo escopo (o produto, quando a busca vetorial
+        foi restrita a ele). Retorna (documentos, estatísticas).
+        """
+        if not self.hybrid or self.lexical_index is None:
+            return docs, {}
+        started = time.perf_counter()
+        try:
+            hits = self.lexical_index.search(query, LEXICAL_CANDIDATES, product=product)
+            lexical_docs = []
+            if hits:
+                data = self.vectorstore.get(ids=[chunk_id for chunk_id, _ in hits], include=["documents", "metadatas"])
+                found = {
+                    chunk_id: Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+                    for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+                }
+                lexical_docs = [found[chunk_id] for chunk_id, _ in hits if chunk_id in found]
+        except Exception as e:
+            logger.warning(f"Erro na busca lexical: {str(e)}")
+            return docs, {}
+        fused = reciprocal_rank_fusion([docs, lexical_docs], k) if lexical_docs else docs
+        return fused, {
+            "lexical_hits": len(lexical_docs),
+            "lexical_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def _reranking(self):
+        # Com o reranqueador pronto, o plano tem um único passo (ver plan_searches)
+        return self.reranker is not None and self.reranker.ready
+
+    def _candidate_count(self):
+        # Com reranqueamento, recupera mais candidatos (limitados ao orçamento de latência)
+        if self.reranker is not None:
+            return self.reranker.candidate_count(self.k)
+        return self.k
+
+    def _rerank(self, query, docs):
+        if self.reranker is None:
+            return docs, {}
+        try:
+            return self.reranker.rerank(query, docs, self.k)
+        except Exception as e:
+            logger.warning(f"Erro no reranqueamento: {str(e)}")
+            return docs[:self.k], {}
+
+    @staticmethod
+    def _lexical_scope(product, step_name):
+        # Busca lexical restrita ao produto se a vetorial também foi
+        if product and step_name in ("produto_indice", "produto_filtrado"):
+            return product
+        return None
+
+    def _safe_search(self, step, query_vector=None):
+        try:
+            return self._search(step, query_vector)
+        except Exception as e:
+            logger.warning(f"Erro na busca '{step['name']}': {str(e)}")
+            return []
+
+    def _finish(self, started, product, executed, docs, diagnostic_searches, extra_stats):
+        stats = {
+            "product": product,
+            "plan": executed,
+            "searches": len(executed),
+            "diagnostic_searches": diagnostic_searches,
+            "documents": len(docs),
+            **extra_stats,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        self.last_stats = stats
+        logger.info(f"Recuperação: {stats}")
+        return stats
+
+    def retrieve(self, query):
+        """
+        Executa o plano de buscas em sequência, parando no primeiro passo
+        com resultados. Retorna (documentos, estatísticas).
+        """
+        started = time.perf_counter()
+        product = identify_product(query, self.matcher)
+        if product:
+            logger.info(f"Produto identificado na pergunta: {product}")
+        
+        candidates = self._candidate_count()
+        docs = []
+        executed = []
+        for step in plan_searches(query, product, candidates, self.product_index, single=self._reranking()):
+            executed.append(step["name"])
+            docs = self._safe_search(step)
+            if docs:
+                break
+        scope = self._lexical_scope(product, executed[-1] if docs else None)
+        docs, lexical_stats = self._hybrid(query, scope, docs, candidates)
+        docs, rerank_stats = self._rerank(query, docs)
+        docs, context_stats = pack_context(docs, self.context_budget)
+        
+        diagnostic_searches = self._run_diagnostics(docs) if self.diagnostics else 0
+        return docs, self._finish(
+            started, product, executed, docs, diagnostic_searches, {**lexical_stats, **rerank_stats, **context_stats}
+        )
+
+    async def aretrieve(self, query):
+        """
+        Versão assíncrona de retrieve. A busca no índice do produto (em
+        memória) é feita primeiro; as buscas no banco vetorial que restarem
+        no plano são executadas em paralelo, em threads, e vale o resultado
+        do primeiro passo do plano que retornar documentos.
+        """
+        started = time.perf_counter()
+        product = identify_product(query, self.matcher)
+        if product:
+            logger.info(f"Produto identificado na pergunta: {product}")
+        
+        candidates = self._candidate_count()
+        steps = plan_searches(query, product, candidates, self.product_index, single=self._reranking())
+        docs = []
+        executed = []
+        winner = None
+        if steps[0].get("product"):
+            executed.append(steps[0]["name"])
+            docs = await asyncio.to_thread(self._safe_search, steps[0])
+            if docs:
+                winner = steps[0]["name"]
+                steps = []
+            else:
+                steps = steps[1:]
+        
+        if steps:
+            executed.extend(step["name"] for step in steps)
+            # Vetores calculados antes das buscas em paralelo, uma vez por texto
+            vectors = await asyncio.to_thread(self._embed_steps, steps)
+            results = await asyncio.gather(
+                *(asyncio.to_thread(self._safe_search, step, vector) for step, vector in zip(steps, vectors))
+            )
+            for step, result in zip(steps, results):
+                if result:
+                    docs, winner = result, step["name"]
+                    break
+        docs, lexical_stats = await asyncio.to_thread(
+            self._hybrid, query, self._lexical_scope(product, winner), docs, candidates
+        )
+        docs, rerank_stats = await asyncio.to_thread(self._rerank, query, docs)
+        docs, context_stats = pack_context(docs, self.context_budget)
+        
+        diagnostic_searches = 0
+        if self.diagnostics:
+            diagnostic_searches = await asyncio.to_thread(self._run_diagnostics, docs)
+        return docs, self._finish(
+            started, product, executed, docs, diagnostic_searches, {**lexical_stats, **rerank_stats, **context_stats}
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        docs, _ = self.retrieve(query)
+        return docs
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: Optional[AsyncCallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        docs, _ = await self.aretrieve(query)
+        return docs
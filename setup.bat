@@ -36,6 +36,14 @@ if exist install_deps.bat (
     )
 )
 
+echo Baixando os modelos (embeddings e reranqueamento)...
+python model_artifacts.py
+if %errorlevel% neq 0 (
+    echo Erro: Falha ao baixar os modelos.
+    echo Tente novamente com: python model_artifacts.py
+    exit /b 1
+)
+
 :: Verifica se existe arquivo .env
 if not exist .env (
     echo Arquivo .env nao encontrado. Vamos criar um.
@@ -52,6 +52,14 @@ else
     fi
 fi
 
+echo -e "${GREEN}Baixando os modelos (embeddings e reranqueamento)...${NC}"
+$PYTHON model_artifacts.py
+if [ $? -ne 0 ]; then
+    echo -e "${RED}Erro: Falha ao baixar os modelos.${NC}"
+    echo -e "${YELLOW}Tente novamente com: python model_artifacts.py${NC}"
+    exit 1
+fi
+
 # Verifica se existe arquivo .env
 if [ ! -f .env ]; then
     echo -e "${YELLOW}Arquivo .env não encontrado. Vamos criar um.${NC}"
@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Aquecimento em segundo plano na inicialização: carrega o modelo de
+# embeddings, o banco da marca padrão e o cross-encoder do reranqueamento
+# enquanto a interface é exibida
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "1").lower() not in ("0", "false", "nao", "não", "no")
+
+# Marca aquecida na inicialização (padrão: a primeira marca disponível)
+DEFAULT_BRAND = os.environ.get("DEFAULT_BRAND")
+
+# Tempos (ms) das fases da inicialização do processo, na ordem em que
+# terminaram. Cada fase é registrada apenas na primeira vez
+_phases = {}
+_phases_lock = threading.Lock()
+_warmup_thread = None
+
+def record_phase(name, elapsed_ms):
+    """
+    Registra o tempo de uma fase da inicialização, se ela ainda não foi
+    registrada no processo.
+    """
+    with _phases_lock:
+        if name in _phases:
+            return
+        _phases[name] = round(elapsed_ms, 1)
+    logger.info(f"Inicialização: {name} em {elapsed_ms:.0f} ms")
+
+@contextmanager
+def startup_phase(name):
+    """
+    Mede o bloco como uma fase da inicialização (ver record_phase).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, (time.perf_counter() - started) * 1000)
+
+def startup_report():
+    """
+    Retorna os tempos (ms) das fases da inicialização já concluídas.
+    """
+    with _phases_lock:
+        return dict(_phases)
+
+def _warm_up(brand):
+    # Importados aqui para que o tempo das importações fique na fase
+    # "importações", medida pela aplicação
+    from models import get_embeddings
+    from query_engine import get_query_engine
+    from reranker import get_reranker
+
+    started = time.perf_counter()
+    try:
+        with startup_phase("modelo de embeddings"):
+            get_embeddings().embed_query("aquecimento")
+        with startup_phase("banco vetorial"):
+            get_query_engine().warm_up(brand)
+        with startup_phase("cliente do LLM"):
+            get_query_engine().warm_up_llms()
+        reranker = get_reranker()
+        if reranker is not None:
+            with startup_phase("reranqueador"):
+                reranker.load()
+    except Exception as e:
+        logger.warning(f"Falha no aquecimento da marca {brand}: {e}")
+        return
+    report = ", ".join(f"{name} {elapsed:.0f} ms" for name, elapsed in startup_report().items())
+    logger.info(f"Aquecimento de {brand} concluído em {(time.perf_counter() - started) * 1000:.0f} ms ({report})")
+
+def start_warmup(brands):
+    """
+    Inicia, uma única vez por processo, o aquecimento da marca padrão
+    (DEFAULT_BRAND ou a primeira de brands) em uma thread em segundo plano.
+    """
+    global _warmup_thread
+    if not STARTUP_WARMUP or not brands:
+        return
+    with _phases_lock:
+        if _warmup_thread is not None:
+            return
+        brand = DEFAULT_BRAND or brands[0]["folder"]
+        _warmup_thread = threading.Thread(target=_warm_up, args=(brand,), name="startup-warmup", daemon=True)
+        _warmup_thread.start()
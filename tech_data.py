@@ -0,0 +1,443 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+from langchain_core.documents import Document
+
+from product_matcher import normalize_text
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tabela de dados técnicos (consumo, validade, ...) gravada junto a cada banco vetorial
+TECH_DATA_FILENAME = "tech_data.sqlite3"
+
+# Versão da extração (PRAGMA user_version da tabela): tabelas de versões
+# anteriores são ignoradas na consulta e geradas de novo pela ingestão
+TECH_DATA_VERSION = 2
+
+# Permite desativar as respostas diretas pela tabela (TECH_DATA=0)
+TECH_DATA_ENABLED = os.environ.get("TECH_DATA", "1").lower() not in ("0", "false", "nao", "não", "no")
+
+# Rótulos de cada campo nas fichas técnicas, no início da linha. O valor
+# vem na mesma linha ("Consumo Aproximadamente 300 a 500 ml/m²") ou na
+# linha seguinte, quando o rótulo é um título ("VALIDADE" / "12 meses").
+FIELD_LABELS = {
+    "consumo": r"consumo(?:\s+(?:m[ií]nimo|aproximado|m[eé]dio|estimado|te[oó]rico))?",
+    "rendimento": r"rendimento(?:\s+(?:aproximado|m[eé]dio|te[oó]rico))?",
+    "secagem": r"(?:tempo\s+de\s+secagem|secagem(?:\s+(?:ao\s+toque|total|completa|final))?)",
+    "validade": r"(?:prazo\s+de\s+)?validade",
+    "embalagem": r"embalage(?:m|ns)",
+}
+LABEL_PATTERNS = {
+    field: re.compile(r"^[\W_]*(" + label + r")\b\s*[:\-–]?\s*(.*)$", re.IGNORECASE)
+    for field, label in FIELD_LABELS.items()
+}
+
+# Palavras da pergunta (normalizada) que indicam cada campo
+FIELD_KEYWORDS = {
+    "consumo": {"consumo", "consome", "gasto", "gasta"},
+    "rendimento": {"rendimento", "rende"},
+    "secagem": {"secagem", "secar"},
+    "validade": {"validade", "vencimento", "vence"},
+    "embalagem": {"embalagem", "embalagens", "vendido"},
+}
+
+# Perguntas que pedem mais que a consulta do valor (cálculos, comparações,
+# recomendações) seguem para o LLM
+NON_LOOKUP_WORDS = {
+    "compara", "comparar", "comparacao", "diferenca", "melhor", "pior", "calcular",
+    "calculo", "preciso", "devo", "posso", "pode", "porque",
+}
+
+# Linhas acrescentadas a um valor: continuações de frases quebradas no PDF
+# e outras linhas com a unidade do campo (consumos por uso ou sistema)
+MAX_CONTINUATION_LINES = 6
+
+HAS_DIGIT = re.compile(r"\d")
+
+# Unidade ou forma exigida no valor de cada campo. Valores sem ela (o valor
+# de outra linha da tabela pego por um rótulo em título, frases sem
+# quantidade) não são gravados e a pergunta segue para a busca
+_RATE = r"\d\s*(?:k?g|ml|l|lts?|litros?)\s*/\s*m\s*[²³23]"
+_AREA_PER_UNIT = r"m\s*[²2]\s*/\s*(?:dem[aã]o|l\b|lts?\b|litros?|kg|m\s*[²2])"
+FIELD_SHAPES = {
+    "consumo": re.compile(
+        _RATE + "|" + _AREA_PER_UNIT
+        + r"|\d\s*(?:ml|l|litros?|g|kg)\b.*\b(?:por|para)\s+(?:cada\s+)?(?:quilo|kg|saco|metro)",
+        re.IGNORECASE,
+    ),
+    "rendimento": re.compile(_RATE + "|" + _AREA_PER_UNIT + r"|\d\s*m\s*[²2](?!\d)", re.IGNORECASE),
+    "secagem": re.compile(r"\d\s*(?:h|horas?|min|minutos?|dias?)\b", re.IGNORECASE),
+    "validade": re.compile(r"\b(?:m[eê]s|meses|anos?|dias)\b", re.IGNORECASE),
+    "embalagem": re.compile(r"\d\s*(?:ml|l|lts?|litros?|kg|g|metros|cm|m)\b", re.IGNORECASE),
+}
+
+# Rótulos (com maiúscula) de outras linhas da tabela de dados técnicos: um
+# valor que começa com um deles pertence a outra linha ("Consumo" /
+# "Temperatura ambiente ...")
+OTHER_LABELS = re.compile(
+    r"^(?:temperatura|densidade|cor|aspecto|pot\s+life|tempo\s+de|condi[cç][oõ]es|espessura|"
+    r"composi[cç][aã]o|base\s+qu[ií]mica|dureza|granulometria|resist[eê]ncia|propor[cç][aã]o|"
+    r"dilui[cç][aã]o|ferramentas|cura|ph|empilhamento|descarte|valor|observa[cç][oõ]es)\b",
+    re.IGNORECASE,
+)
+
+def _is_other_label(line):
+    return line[0].isupper() and bool(OTHER_LABELS.match(line))
+
+# Marcadores de lista e notas de rodapé em volta dos valores
+VALUE_MARKERS = "*•▪· "
+
+def _match_label(line):
+    """
+    Retorna (campo, rótulo, resto da linha) se a linha começa com o rótulo
+    de um campo, ou None. O rótulo deve começar com maiúscula, o que exclui
+    linhas que continuam uma frase ("consumo recomendado conforme...").
+    """
+    for field, pattern in LABEL_PATTERNS.items():
+        match = pattern.match(line)
+        if match and match.group(1)[0].isupper():
+            return field, match.group(1), match.group(2).strip()
+    return None
+
+def _join_lines(value, line):
+    # Palavras hifenizadas na quebra de linha ("tem-" / "peraturas")
+    if value.endswith("-"):
+        return value[:-1] + line
+    return f"{value} {line}"
+
+def _continues(field, value, line, next_line):
+    """
+    Indica se a linha faz parte do valor: continuação da frase (minúscula,
+    parêntese, exceto notas "(*)", ou palavra hifenizada), subtítulo após ":" ("Consumo Graute:"),
+    outra linha com a unidade do campo ("Utilização como impermeabilizante:
+    0,5 litros/m²") ou um subtítulo seguido de uma delas ("Microconcreto:").
+    """
+    if _match_label(line) or _is_other_label(line) or line.startswith("(*"):
+        return False
+    if line[0].islower() or line[0] == "(" or value.endswith(("-", ":")):
+        return True
+    if FIELD_SHAPES[field].search(line):
+        return True
+    return line.endswith(":") and bool(next_line) and bool(FIELD_SHAPES[field].search(next_line))
+
+def extract_tech_fields(text):
+    """
+    Extrai os campos técnicos do texto de uma página. Retorna uma lista de
+    (campo, rótulo, valor); valores sem a unidade do campo (FIELD_SHAPES) ou
+    que são outra linha da tabela são descartados.
+    """
+    # Linhas em branco (espaços entre os itens de um valor) são ignoradas
+    lines = [line.strip() for line in (text or "").splitlines()]
+    lines = [line for line in lines if line]
+    found = []
+    for i, line in enumerate(lines):
+        label = _match_label(line)
+        if label is None:
+            continue
+        field, label_text, value = label
+        j = i + 1
+        if not value:
+            # Rótulo em título: o valor é a linha seguinte
+            if j >= len(lines) or _match_label(lines[j]):
+                continue
+            value = lines[j]
+            j += 1
+        if _is_other_label(value):
+            continue
+        for k in range(j, min(j + MAX_CONTINUATION_LINES, len(lines))):
+            next_line = lines[k + 1] if k + 1 < len(lines) else ""
+            if not _continues(field, value, lines[k], next_line):
+                break
+            value = _join_lines(value, lines[k])
+        value = " ".join(value.split()).strip(VALUE_MARKERS)
+        if HAS_DIGIT.search(value) and FIELD_SHAPES[field].search(value):
+            found.append((field, " ".join(label_text.split()), value))
+    return found
+
+def extract_tech_rows(documents):
+    """
+    Extrai as linhas da tabela de dados técnicos de documentos (páginas ou
+    chunks) com os metadados da ingestão: (arquivo, produto, campo, rótulo,
+    valor, página, origem). Valores repetidos (sobreposição de chunks) são
+    gravados uma única vez.
+    """
+    rows = []
+    seen = set()
+    for doc in documents:
+        metadata = doc.metadata or {}
+        source = metadata.get("source", "")
+        for field, label, value in extract_tech_fields(doc.page_content):
+            key = (source, field, value)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append((
+                # Bancos gerados no Windows guardam a origem com "\\"
+                os.path.basename(source.replace("\\", "/")),
+                metadata.get("product", ""),
+                field,
+                label,
+                value,
+                metadata.get("page"),
+                source,
+            ))
+    return rows
+
+def _create_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS tech_data ("
+        " file_key TEXT NOT NULL,"
+        " product TEXT NOT NULL,"
+        " field TEXT NOT NULL,"
+        " label TEXT NOT NULL,"
+        " value TEXT NOT NULL,"
+        " page INTEGER,"
+        " source TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS tech_data_lookup ON tech_data (product, field)")
+    conn.execute("CREATE INDEX IF NOT EXISTS tech_data_file ON tech_data (file_key)")
+
+def write_tech_data(output_dir, rows):
+    """
+    Grava a tabela de dados técnicos completa de uma marca, substituindo a
+    anterior de uma vez.
+    """
+    path = os.path.join(output_dir, TECH_DATA_FILENAME)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        _create_table(conn)
+        conn.executemany("INSERT INTO tech_data VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute(f"PRAGMA user_version = {TECH_DATA_VERSION}")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    logger.info(f"Dados técnicos gravados em {path}: {len(rows)} valores")
+
+def _table_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def tech_data_is_current(output_dir):
+    """
+    Indica se a marca tem a tabela de dados técnicos gravada pela versão
+    atual da extração.
+    """
+    path = os.path.join(output_dir, TECH_DATA_FILENAME)
+    if not os.path.exists(path):
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return _table_version(conn) == TECH_DATA_VERSION
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+def update_tech_data(output_dir, documents_by_file, removed=()):
+    """
+    Atualiza a tabela de dados técnicos após uma ingestão incremental: os
+    valores dos arquivos alterados ({arquivo: [páginas]}) são extraídos de
+    novo e os dos arquivos removidos, apagados. Uma tabela de versão anterior
+    só é atualizada com todos os arquivos da marca, e é substituída por eles.
+    """
+    path = os.path.join(output_dir, TECH_DATA_FILENAME)
+    rows = extract_tech_rows([doc for docs in documents_by_file.values() for doc in docs])
+    conn = sqlite3.connect(path)
+    try:
+        _create_table(conn)
+        if _table_version(conn) != TECH_DATA_VERSION:
+            conn.execute("DELETE FROM tech_data")
+            conn.execute(f"PRAGMA user_version = {TECH_DATA_VERSION}")
+        conn.executemany(
+            "DELETE FROM tech_data WHERE file_key = ?",
+            [(file_key,) for file_key in list(documents_by_file) + list(removed)]
+        )
+        conn.executemany("INSERT INTO tech_data VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Dados técnicos atualizados em {path}: {len(rows)} valores de {len(documents_by_file)} arquivos")
+
+def _store_documents(vectordb):
+    data = vectordb.get(include=["documents", "metadatas"])
+    return [
+        Document(page_content=text or "", metadata=metadata or {})
+        for text, metadata in zip(data["documents"], data["metadatas"])
+    ]
+
+def write_tech_data_from_store(output_dir, vectordb):
+    """
+    Gera a tabela de dados técnicos a partir dos chunks do banco vetorial
+    (bancos gerados antes da tabela).
+    """
+    write_tech_data(output_dir, extract_tech_rows(_store_documents(vectordb)))
+
+def detect_fields(question):
+    """
+    Retorna os campos técnicos pedidos na pergunta.
+    """
+    words = set(normalize_text(question).split())
+    return [field for field, keywords in FIELD_KEYWORDS.items() if words & keywords]
+
+def _product_mentions(text, matcher):
+    """
+    Ocorrências (início, fim, produto) de apelidos em fronteira de palavra
+    no texto normalizado.
+    """
+    return [
+        (start, end, product) for start, end, product in matcher.find_all(text)
+        if (start == 0 or text[start - 1] == " ") and (end == len(text) or text[end] == " ")
+    ]
+
+def match_field_question(question, matcher):
+    """
+    Identifica perguntas que apenas consultam campos técnicos de um produto
+    ("qual o consumo do Igol Ecoasfalto?"). Retorna (produto, campos) ou
+    None para perguntas que dependem do LLM: sem produto ou com vários,
+    sem campo técnico, com números fora do nome do produto (cálculos) ou
+    com comparações.
+    """
+    if matcher is None:
+        return None
+    fields = detect_fields(question)
+    if not fields:
+        return None
+    text = normalize_text(question)
+    mentions = _product_mentions(text, matcher)
+    if not mentions:
+        return None
+    start, end, product = max(mentions, key=lambda mention: mention[1] - mention[0])
+    # Apelidos fora do trecho do produto identificado indicam outro produto
+    # (apelidos mais curtos dentro dele, como "igol" em "igol ecoasfalto", não)
+    if any(other != product and (s >= end or e <= start) for s, e, other in mentions):
+        return None
+    rest = text[:start] + " " + text[end:]
+    if HAS_DIGIT.search(rest) or set(rest.split()) & NON_LOOKUP_WORDS:
+        return None
+    return product, fields
+
+class TechDataTable:
+    """
+    Dados técnicos de uma marca em memória, por (produto, campo), lidos da
+    tabela SQLite gravada pela ingestão.
+    """
+
+    def __init__(self, rows):
+        self.values = {}
+        for file_key, product, field, label, value, page, source in rows:
+            self.values.setdefault((product, field), []).append({
+                "label": label, "value": value, "page": page, "source": source,
+            })
+
+    @classmethod
+    def load(cls, path):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            if _table_version(conn) != TECH_DATA_VERSION:
+                raise ValueError("gravada por uma versão anterior da extração")
+            rows = conn.execute(
+                "SELECT file_key, product, field, label, value, page, source FROM tech_data ORDER BY rowid"
+            ).fetchall()
+        finally:
+            conn.close()
+        return cls(rows)
+
+    @classmethod
+    def from_store(cls, vectordb):
+        return cls(extract_tech_rows(_store_documents(vectordb)))
+
+    def __len__(self):
+        return sum(len(values) for values in self.values.values())
+
+    def lookup(self, product, fields):
+        """
+        Retorna {campo: [valores]} dos campos encontrados para o produto.
+        """
+        return {
+            field: self.values[(product, field)]
+            for field in fields if (product, field) in self.values
+        }
+
+    def answer(self, question, matcher, brand=None):
+        """
+        Responde diretamente perguntas de consulta a campos técnicos. Retorna
+        (resposta, documentos de origem, estatísticas), ou None se a pergunta
+        precisa do LLM ou algum campo pedido não está na tabela.
+        """
+        started = time.perf_counter()
+        matched = match_field_question(question, matcher)
+        if matched is None:
+            return None
+        product, fields = matched
+        found = self.lookup(product, fields)
+        if len(found) < len(fields):
+            return None
+
+        lines = [f"Conforme a ficha técnica do {product}:", ""]
+        docs = []
+        for field in fields:
+            for item in found[field]:
+                page = f" (página {item['page']})" if item["page"] else ""
+                lines.append(f"- **{item['label']}**: {item['value']}{page}")
+                docs.append(Document(
+                    page_content=f"{item['label']}: {item['value']}",
+                    metadata={
+                        "source": item["source"],
+                        "page": item["page"],
+                        "product": product,
+                        "brand": brand,
+                        "field": field,
+                    },
+                ))
+        return "\n".join(lines), docs, {
+            "tech_data": fields,
+            "product": product,
+            "searches": 0,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+# Tabelas já carregadas, por pasta do banco vetorial: {caminho: (mtime, id do banco, tabela)}
+_table_cache = {}
+_table_lock = threading.Lock()
+
+def load_tech_data(persist_directory, vectorstore):
+    """
+    Carrega (com cache) os dados técnicos de uma marca. Sem tabela gravada
+    (bancos anteriores a ela), os valores são extraídos dos chunks do banco
+    vetorial; execute ingest.py para gravá-la.
+    """
+    path = os.path.join(persist_directory, TECH_DATA_FILENAME)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+    with _table_lock:
+        cached = _table_cache.get(persist_directory)
+        if cached and cached[0] == mtime and cached[1] == id(vectorstore):
+            return cached[2]
+
+        table = None
+        if mtime is not None:
+            try:
+                table = TechDataTable.load(path)
+            except Exception as e:
+                logger.warning(f"Tabela de dados técnicos inválida em {path}: {e}")
+
+        if table is None:
+            try:
+                table = TechDataTable.from_store(vectorstore)
+                logger.info(f"Dados técnicos de {persist_directory} extraídos em memória; execute ingest.py para gravá-los")
+            except Exception as e:
+                logger.warning(f"Não foi possível extrair os dados técnicos de {persist_directory}: {e}")
+                table = None
+
+        _table_cache[persist_directory] = (mtime, id(vectorstore), table)
+        return table
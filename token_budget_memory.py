@@ -0,0 +1,126 @@
+import logging
+from typing import Any, List, Optional
+
+from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+
+from conversation_memory import (
+    MEMORY_MAX_TURNS,
+    MEMORY_MODE,
+    MEMORY_TOKEN_BUDGET,
+    SUMMARY_BUDGET_FRACTION,
+    SUMMARY_PROMPT,
+    estimate_tokens,
+    truncate_to_tokens,
+)
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class TokenBudgetMemory(ConversationBufferMemory):
+    """
+    Memória da conversa com tamanho limitado. Mantém na íntegra apenas os
+    últimos max_turns turnos, dentro de max_tokens; os turnos mais antigos
+    são descartados (mode="window") ou incorporados a um resumo acumulado
+    gerado pelo summary_llm (mode="summary").
+    """
+
+    max_turns: int = MEMORY_MAX_TURNS
+    max_tokens: int = MEMORY_TOKEN_BUDGET
+    mode: str = MEMORY_MODE
+    summary_llm: Optional[Any] = None
+    summary: str = ""
+
+    def _messages_tokens(self, messages):
+        return sum(estimate_tokens(message.content) for message in messages)
+
+    @property
+    def summary_message(self):
+        if not self.summary:
+            return None
+        return SystemMessage(content=f"Resumo da conversa anterior: {self.summary}")
+
+    @property
+    def buffer_as_messages(self) -> List[BaseMessage]:
+        messages = list(self.chat_memory.messages)
+        if self.summary:
+            messages.insert(0, self.summary_message)
+        return messages
+
+    @property
+    def buffer_as_str(self) -> str:
+        return get_buffer_string(
+            self.buffer_as_messages,
+            human_prefix=self.human_prefix,
+            ai_prefix=self.ai_prefix,
+        )
+
+    @property
+    def history_tokens(self):
+        """
+        Tokens estimados do histórico entregue à cadeia (resumo + turnos).
+        """
+        return self._messages_tokens(self.buffer_as_messages)
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        self._enforce_budget()
+
+    def clear(self):
+        super().clear()
+        self.summary = ""
+
+    def _enforce_budget(self):
+        messages = list(self.chat_memory.messages)
+        summary_budget = int(self.max_tokens * SUMMARY_BUDGET_FRACTION) if self.mode == "summary" else 0
+        turns_budget = self.max_tokens - summary_budget
+
+        # Remove os turnos mais antigos até respeitar o limite de turnos e de
+        # tokens; o último turno é sempre mantido
+        evicted = []
+        while len(messages) > 2 and (
+            len(messages) > 2 * self.max_turns or self._messages_tokens(messages) > turns_budget
+        ):
+            evicted.extend(messages[:2])
+            messages = messages[2:]
+
+        # Um único turno acima do orçamento tem a resposta encurtada
+        if self._messages_tokens(messages) > turns_budget:
+            question_tokens = self._messages_tokens(messages[:-1])
+            last = messages[-1]
+            messages[-1] = last.__class__(
+                content=truncate_to_tokens(last.content, max(turns_budget - question_tokens, 50))
+            )
+
+        if not evicted and messages == self.chat_memory.messages:
+            return
+
+        self.chat_memory.clear()
+        self.chat_memory.add_messages(messages)
+
+        if evicted:
+            if self.mode == "summary" and self.summary_llm is not None:
+                self._fold_into_summary(evicted, summary_budget)
+            logger.info(
+                f"Memória: {len(evicted) // 2} turnos antigos "
+                f"{'resumidos' if self.mode == 'summary' else 'descartados'}, "
+                f"{len(messages) // 2} mantidos ({self.history_tokens} tokens estimados)"
+            )
+
+    def _fold_into_summary(self, evicted, summary_budget):
+        new_lines = get_buffer_string(evicted, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        prompt = SUMMARY_PROMPT.format(
+            max_words=max(20, summary_budget * 3 // 4),
+            summary=self.summary or "(vazio)",
+            new_lines=new_lines,
+        )
+        try:
+            result = self.summary_llm.invoke(prompt)
+            summary = getattr(result, "content", result)
+        except Exception as e:
+            # Sem o LLM, mantém ao menos as perguntas feitas
+            logger.warning(f"Não foi possível resumir o histórico: {str(e)}")
+            questions = [message.content for message in evicted if message.type == "human"]
+            summary = " ".join(filter(None, [self.summary, "Perguntas anteriores: " + "; ".join(questions)]))
+        self.summary = truncate_to_tokens(str(summary).strip(), summary_budget)